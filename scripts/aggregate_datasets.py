@@ -1,285 +1,394 @@
 import polars as pl
 import os
+import ast
 import glob
 import time
-import gc
+import inspect
+from datetime import datetime
+
+import marts
+import tlc_schema
+from scheduler import run_tasks, current_tuning, report_failures, estimate_task_bytes, parquet_rows
+from tlc_schema import scan_dataset, is_processed as is_processed_dataset
+from catalog import partitions as dataset_partitions, dataset_root
+from marts import sufficient_stats, sketch, SKETCHES
+from od_cube import write_cubes
+from manifest import (
+    file_fingerprint,
+    text_fingerprint,
+    load_manifest,
+    save_manifest,
+    stale_reason,
+    make_entry,
+    temp_path,
+    commit_files,
+    discard_temp_files,
+    TMP_SUFFIX,
+)
+from profiling import stage, save_plans, task_name, new_run_id, plan_dir_for, write_run_report, print_stage_summary
 
 # --- Configuration ---
-# CHANGE THIS PATH to switch between Processed vs Raw input
-INPUT_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\HVFHV subsets 2019-2025"
-# INPUT_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\HVFHV subsets 2019-2025 - Processed"
-
-# Output will be saved here
-OUTPUT_BASE = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\HVFHV subsets 2019-2025 - Aggregates"
-
-# Tuning
-os.environ["POLARS_MAX_THREADS"] = "14"
-# pl.Config.set_streaming_chunk_size(100000)
-
-
-def enforce_schema(lf, is_processed):
+# CHANGE THIS to switch between Processed vs Raw input (catalog dataset name, see catalog.DATASETS)
+INPUT_DATASET = "raw"
+# INPUT_DATASET = "processed"
+
+# Output is saved under the catalog's "aggregates" root: Aggregates_{Raw,Processed}/<mart>.parquet (.csv for
+# the executive summary), assembled from month partitions <mart>/year=YYYY/month=MM/data.parquet
+
+# Incremental Runs: Aggregates_*/_manifest.json records the input files and code each month partition was
+# built from, so only new or changed months are aggregated again. Bump the version for anything the code
+# fingerprint can't see.
+MANIFEST_NAME = "_manifest.json"
+AGGREGATION_VERSION = 1
+
+# Mart label (see process_single_file) -> table name
+MART_TABLES = {
+    "Mart 1: Timeline": "agg_timeline_hourly",
+    "Mart 2: Network": "agg_network_monthly",
+    "Mart 3: Economic": "agg_pricing_distribution",
+    "Mart 4: Executive": "agg_executive_daily",
+}
+# Tables published as CSV (sorted by this column) instead of Parquet
+CSV_TABLES = {"agg_executive_daily": "pickup_date"}
+
+# Memory Budget (GB); None = scheduler.DEFAULT_RAM_FRACTION of the free RAM. Threads and streaming
+# chunk sizes follow from it; files estimated over it are aggregated on the streaming engine.
+MEMORY_BUDGET_GB = None
+
+# Profiling (opt-in): per-mart rows, time & peak memory, query plans and a run report under
+# profiling.PROFILE_DIR
+PROFILE = False
+
+
+def process_single_file(file_path, is_processed, plan_dir=None):
     """
-    Ensures types match across all files before aggregation.
+    Calculates the 4 Marts for a SINGLE month (one file, or a list of its shards) and returns 4
+    tiny DataFrames, plus the stage records when profiling (`plan_dir` set; empty list otherwise).
+    Errors propagate so the scheduler can record them per file.
     """
+    # Canonical dtypes (and later-year columns on old raw files) come from the schema registry
+    lf = scan_dataset(file_path)
     schema = lf.collect_schema().names()
-    casts = []
-
-    # 1. Cast Floats (Fix Float64 vs Float32 mismatch)
-    float_cols = [
-        "cbd_congestion_fee",
-        "airport_fee",
-        "base_passenger_fare",
-        "driver_pay",
-        "tips",
-        "tolls",
-        "trip_miles",
+
+    stages = []
+    rows_in = None
+    if plan_dir is not None:
+        with stage(stages, "Read (row count)") as record:
+            record["rows_out"] = rows_in = lf.select(pl.len()).collect().item()
+
+    # Low-memory plan: the streaming engine holds chunks, not the file's columns
+    engine = "streaming" if current_tuning()["low_memory"] else "auto"
+
+    # Marts are only declared here and collected together at the end (one pass over the file)
+    marts = {}
+
+    # --- Fallback for Raw Data (Time Generation) ---
+    # Only generate if missing (Processed files have them, Raw files don't)
+    time_exprs = []
+    if "pickup_year" not in schema:
+        time_exprs.append(pl.col("pickup_datetime").dt.year().alias("pickup_year"))
+    if "pickup_month" not in schema:
+        time_exprs.append(pl.col("pickup_datetime").dt.month().alias("pickup_month"))
+    if "pickup_day" not in schema:
+        time_exprs.append(pl.col("pickup_datetime").dt.day().alias("pickup_day"))
+    if "pickup_hour" not in schema:
+        time_exprs.append(pl.col("pickup_datetime").dt.hour().alias("pickup_hour"))
+    if "pickup_date" not in schema:
+        time_exprs.append(pl.col("pickup_datetime").dt.date().alias("pickup_date"))
+
+    if time_exprs:
+        lf = lf.with_columns(time_exprs)
+
+    # --- MART 1: Timeline (Hourly) ---
+    keys_1 = ["pickup_year", "pickup_month", "pickup_day", "pickup_hour"]
+
+    aggs_1 = [
+        pl.len().alias("trip_count"),
+        pl.col("base_passenger_fare").sum().alias("total_fare_amt"),
+        pl.col("driver_pay").sum().alias("total_driver_pay"),
+        pl.col("cbd_congestion_fee").sum().alias("total_cbd_fee"),
     ]
 
     if is_processed:
-        float_cols.extend([
-            "total_rider_cost",
-            "trip_km",
-            "speed_kmh",
-            "cost_per_km",
-            "driver_revenue_share",
-            "total_wait_time_min",
-            "driver_response_time_min",
-            "boarding_time_min",
+        keys_1.extend(["borough_flow_type", "trip_archetype", "cultural_day_type"])
+        aggs_1.extend([
+            pl.col("total_rider_cost").sum().alias("total_revenue_gross"),
+            pl.col("tips").sum().alias("total_tips"),
+            pl.col("trip_km").mean().alias("avg_trip_km"),
+            pl.col("speed_kmh").mean().alias("avg_speed_kmh"),
+            pl.col("is_bad_weather").sum().alias("bad_weather_count"),
+            pl.col("is_extreme_weather").sum().alias("extreme_weather_count"),
         ])
+    else:
+        # Fallback for Raw
+        aggs_1.append(pl.col("trip_miles").mean().alias("avg_trip_miles"))
 
-    for col in float_cols:
-        if col in schema:
-            casts.append(pl.col(col).cast(pl.Float32))
-        elif col == "cbd_congestion_fee":
-            casts.append(pl.lit(0.0).cast(pl.Float32).alias("cbd_congestion_fee"))
-
-    # 2. Cast Categoricals/Strings
-    cat_cols = [
-        "pickup_borough",
-        "dropoff_borough",
-        "weather_state",
-        "trip_archetype",
-        "borough_flow_type",
-        "time_of_day_bin",
-        "rain_intensity",
-        "snow_intensity",
-        "wind_intensity",
-        "visibility_status",
-    ]
-    for col in cat_cols:
-        if col in schema:
-            casts.append(pl.col(col).cast(pl.String))
+    aggs_1.extend(sufficient_stats(aggs_1))
+    marts["Mart 1: Timeline"] = lf.group_by(keys_1).agg(aggs_1)
 
-    # 3. Cast Integers (Fix Int32 vs Int64 mismatch in Raw Data) -- NEW BLOCK
-    int_cols = ["PULocationID", "DOLocationID"]
-    for col in int_cols:
-        if col in schema:
-            casts.append(pl.col(col).cast(pl.Int32))
+    # --- MART 2: Network (Monthly) ---
+    keys_2 = ["pickup_year", "pickup_month", "PULocationID", "DOLocationID"]
+    aggs_2 = [pl.len().alias("trip_count")]
 
-    if casts:
-        lf = lf.with_columns(casts)
+    if is_processed:
+        if "pickup_borough" in schema:
+            keys_2.extend(["pickup_borough", "dropoff_borough"])
+
+        aggs_2.extend([
+            pl.col("duration_min").mean().alias("avg_duration_min"),
+            pl.col("total_rider_cost").mean().alias("avg_cost"),
+            pl.col("displacement_speed_kmh").mean().alias("avg_displacement_speed"),
+            # NEW: Service Metrics
+            pl.col("total_wait_time_min").mean().alias("avg_wait_time"),
+            pl.col("driver_response_time_min").mean().alias("avg_driver_response"),
+        ])
+    else:
+        if "trip_time" in schema:
+            aggs_2.append(pl.col("trip_time").mean().alias("avg_duration_sec"))
 
-    return lf
+    aggs_2.extend(sufficient_stats(aggs_2))
+    marts["Mart 2: Network"] = lf.group_by(keys_2).agg(aggs_2)
 
+    # --- MART 3: Economic (Processed Only) ---
+    if is_processed:
+        keys_3 = ["pickup_date", "time_of_day_bin", "weather_state", "borough_flow_type"]
+        aggs_3 = [
+            pl.len().alias("trip_count"),
+            pl.col("driver_revenue_share").mean().alias("avg_driver_share"),
+            pl.col("driver_revenue_share").std().alias("std_driver_share"),
+            pl.col("uber_take_rate_proxy").mean().alias("avg_take_rate"),
+            pl.col("tipping_pct").mean().alias("avg_tip_pct"),
+            pl.col("pay_per_hour").mean().alias("avg_hourly_wage"),
+            pl.col("base_passenger_fare").median().alias("median_fare"),
+            pl.col("base_passenger_fare").quantile(0.90).alias("p90_fare_surge_proxy"),
+            # Weather Intensity Check
+            pl.col("rain_intensity").mode().first().alias("dominant_rain"),
+            # Mergeable quantile sketches (weekly / yearly quantiles without a rescan, see marts.rollup)
+            *[sketch(col, name) for name, col in SKETCHES.items()],
+        ]
+        aggs_3.extend(sufficient_stats(aggs_3))
+        marts["Mart 3: Economic"] = lf.group_by(keys_3).agg(aggs_3)
+
+    # --- MART 4: Executive (Daily) ---
+    keys_4 = ["pickup_date"]
+    aggs_4 = [
+        pl.len().alias("total_trips"),
+        pl.col("base_passenger_fare").sum().alias("total_fare_revenue"),
+    ]
 
-def process_single_file(file_path, is_processed):
+    if is_processed:
+        aggs_4.extend([
+            pl.col("total_rider_cost").sum().alias("total_gross_booking_value"),
+            pl.col("tips").sum().alias("total_tips"),
+            pl.col("trip_km").sum().alias("total_km_traveled"),
+            pl.col("is_bad_weather").sum().alias("bad_weather_trip_count"),
+            pl.col("is_extreme_weather").sum().alias("extreme_weather_trip_count"),
+            pl.col("total_wait_time_min").mean().alias("avg_wait_time"),
+        ])
+    else:
+        aggs_4.append(pl.col("trip_miles").mean().alias("avg_distance_miles"))
+
+    aggs_4.extend(sufficient_stats(aggs_4))
+    marts["Mart 4: Executive"] = lf.group_by(keys_4).agg(aggs_4)
+
+    # --- SINGLE PASS ---
+    # collect_all plans the marts together: the common scan (and the time columns) become one
+    # cached subplan, so the file is decoded once instead of once per mart
+    queries = list(marts.values())
+    if plan_dir is None:
+        frames = pl.collect_all(queries, engine=engine)
+    else:
+        first_file = file_path if isinstance(file_path, str) else file_path[0]
+        save_plans(queries, plan_dir, f"{task_name(first_file)}_marts")
+        with stage(stages, "Marts (single pass)", rows_in) as record:
+            frames = pl.collect_all(queries, engine=engine)
+            record["rows_out"] = sum(df.height for df in frames)
+            record["bytes_out"] = sum(df.estimated_size() for df in frames)
+
+    out = dict(zip(marts, frames))
+    return (
+        out["Mart 1: Timeline"],
+        out["Mart 2: Network"],
+        out.get("Mart 3: Economic"),
+        out["Mart 4: Executive"],
+        stages,
+    )
+
+
+def aggregate_partition(files, targets, is_processed, plan_dir=None):
     """
-    Calculates the 4 Marts for a SINGLE file and returns 4 tiny DataFrames.
+    Worker: aggregates one month and writes each mart's partition to the temp path of its
+    target in `targets` ({table: final path}); the parent commits them. Returns rows per table.
     """
-    try:
-        lf = pl.scan_parquet(file_path)
-        lf = enforce_schema(lf, is_processed)
-        schema = lf.collect_schema().names()
-
-        # --- Fallback for Raw Data (Time Generation) ---
-        # Only generate if missing (Processed files have them, Raw files don't)
-        time_exprs = []
-        if "pickup_year" not in schema:
-            time_exprs.append(pl.col("pickup_datetime").dt.year().alias("pickup_year"))
-        if "pickup_month" not in schema:
-            time_exprs.append(pl.col("pickup_datetime").dt.month().alias("pickup_month"))
-        if "pickup_day" not in schema:
-            time_exprs.append(pl.col("pickup_datetime").dt.day().alias("pickup_day"))
-        if "pickup_hour" not in schema:
-            time_exprs.append(pl.col("pickup_datetime").dt.hour().alias("pickup_hour"))
-        if "pickup_date" not in schema:
-            time_exprs.append(pl.col("pickup_datetime").dt.date().alias("pickup_date"))
-
-        if time_exprs:
-            lf = lf.with_columns(time_exprs)
-
-        # --- MART 1: Timeline (Hourly) ---
-        keys_1 = ["pickup_year", "pickup_month", "pickup_day", "pickup_hour"]
-
-        aggs_1 = [
-            pl.len().alias("trip_count"),
-            pl.col("base_passenger_fare").sum().alias("total_fare_amt"),
-            pl.col("driver_pay").sum().alias("total_driver_pay"),
-            pl.col("cbd_congestion_fee").sum().alias("total_cbd_fee"),
-        ]
+    frames = process_single_file(files if len(files) > 1 else files[0], is_processed, plan_dir)
+    stages = frames[-1]
+    rows = {}
+    for table, df in zip(MART_TABLES.values(), frames[:-1]):
+        if df is None:
+            continue
+        os.makedirs(os.path.dirname(targets[table]), exist_ok=True)
+        df.write_parquet(temp_path(targets[table]))
+        rows[table] = df.height
+    return {"rows": rows, "stages": stages}
+
+
+# --- Incremental Maintenance ---
+def aggregation_fingerprint():
+    """
+    Fingerprint of the code that shapes a mart partition (mart definitions, sketches and
+    sufficient statistics, schema registry). Compared as syntax trees, like process_data's.
+    """
+    code_units = [process_single_file, marts, tlc_schema]
+    trees = [ast.dump(ast.parse(inspect.getsource(unit))) for unit in code_units]
+    return text_fingerprint(AGGREGATION_VERSION, *trees)
 
-        if is_processed:
-            keys_1.extend(["borough_flow_type", "trip_archetype", "cultural_day_type"])
-            aggs_1.extend([
-                pl.col("total_rider_cost").sum().alias("total_revenue_gross"),
-                pl.col("tips").sum().alias("total_tips"),
-                pl.col("trip_km").mean().alias("avg_trip_km"),
-                pl.col("speed_kmh").mean().alias("avg_speed_kmh"),
-                pl.col("is_bad_weather").sum().alias("bad_weather_count"),
-                pl.col("is_extreme_weather").sum().alias("extreme_weather_count"),
-            ])
-        else:
-            # Fallback for Raw
-            aggs_1.append(pl.col("trip_miles").mean().alias("avg_trip_miles"))
-
-        df_1 = lf.group_by(keys_1).agg(aggs_1).collect()
-
-        # --- MART 2: Network (Monthly) ---
-        keys_2 = ["pickup_year", "pickup_month", "PULocationID", "DOLocationID"]
-        aggs_2 = [pl.len().alias("trip_count")]
-
-        if is_processed:
-            if "pickup_borough" in schema:
-                keys_2.extend(["pickup_borough", "dropoff_borough"])
-
-            aggs_2.extend([
-                pl.col("duration_min").mean().alias("avg_duration_min"),
-                pl.col("total_rider_cost").mean().alias("avg_cost"),
-                pl.col("displacement_speed_kmh").mean().alias("avg_displacement_speed"),
-                # NEW: Service Metrics
-                pl.col("total_wait_time_min").mean().alias("avg_wait_time"),
-                pl.col("driver_response_time_min").mean().alias("avg_driver_response"),
-            ])
-        else:
-            if "trip_time" in schema:
-                aggs_2.append(pl.col("trip_time").mean().alias("avg_duration_sec"))
-
-        df_2 = lf.group_by(keys_2).agg(aggs_2).collect()
-
-        # --- MART 3: Economic (Processed Only) ---
-        df_3 = None
-        if is_processed:
-            keys_3 = ["pickup_date", "time_of_day_bin", "weather_state", "borough_flow_type"]
-            aggs_3 = [
-                pl.len().alias("trip_count"),
-                pl.col("driver_revenue_share").mean().alias("avg_driver_share"),
-                pl.col("driver_revenue_share").std().alias("std_driver_share"),
-                pl.col("uber_take_rate_proxy").mean().alias("avg_take_rate"),
-                pl.col("tipping_pct").mean().alias("avg_tip_pct"),
-                pl.col("pay_per_hour").mean().alias("avg_hourly_wage"),
-                pl.col("base_passenger_fare").median().alias("median_fare"),
-                pl.col("base_passenger_fare").quantile(0.90).alias("p90_fare_surge_proxy"),
-                # Weather Intensity Check
-                pl.col("rain_intensity").mode().first().alias("dominant_rain"),
-            ]
-            df_3 = lf.group_by(keys_3).agg(aggs_3).collect()
-
-        # --- MART 4: Executive (Daily) ---
-        keys_4 = ["pickup_date"]
-        aggs_4 = [
-            pl.len().alias("total_trips"),
-            pl.col("base_passenger_fare").sum().alias("total_fare_revenue"),
-        ]
 
-        if is_processed:
-            aggs_4.extend([
-                pl.col("total_rider_cost").sum().alias("total_gross_booking_value"),
-                pl.col("tips").sum().alias("total_tips"),
-                pl.col("trip_km").sum().alias("total_km_traveled"),
-                pl.col("is_bad_weather").sum().alias("bad_weather_trip_count"),
-                pl.col("is_extreme_weather").sum().alias("extreme_weather_trip_count"),
-                pl.col("total_wait_time_min").mean().alias("avg_wait_time"),
-            ])
-        else:
-            aggs_4.append(pl.col("trip_miles").mean().alias("avg_distance_miles"))
+def partition_dir(year, month):
+    """Hive folder of a source partition (yearly or period-less sample files included)."""
+    if year is None:
+        return "all"
+    return f"year={year}" if month is None else f"year={year}/month={month:02d}"
 
-        df_4 = lf.group_by(keys_4).agg(aggs_4).collect()
 
-        return df_1, df_2, df_3, df_4
+def partition_targets(output_dir, key, is_processed):
+    return {
+        table: os.path.join(output_dir, table, key, "data.parquet")
+        for label, table in MART_TABLES.items()
+        if is_processed or label != "Mart 3: Economic"
+    }
 
-    except Exception as e:
-        print(f"❌ Error processing {os.path.basename(file_path)}: {e}")
-        import traceback
 
-        traceback.print_exc()
-        return None, None, None, None
+def publish_tables(output_dir):
+    """
+    Rebuilds each mart's single file from its month partitions. Streams partition by partition,
+    so memory stays flat however many months there are.
+    """
+    for table in MART_TABLES.values():
+        parts = sorted(glob.glob(os.path.join(output_dir, table, "**", "data.parquet"), recursive=True))
+        if not parts:
+            continue
+        lf = pl.concat([pl.scan_parquet(f) for f in parts], how="diagonal_relaxed")
+        if table in CSV_TABLES:
+            final = os.path.join(output_dir, f"{table}.csv")
+            lf.sort(CSV_TABLES[table]).sink_csv(temp_path(final))
+        else:
+            final = os.path.join(output_dir, f"{table}.parquet")
+            lf.sink_parquet(temp_path(final))
+        os.replace(temp_path(final), final)
+        print(f"   -> {os.path.basename(final)} ({len(parts)} partition(s))")
 
 
 def main():
     print(f"🚀 Orion: Initializing Atomic Data Mart Generation...")
-    print(f"📂 Input: {INPUT_DIR}")
+    run_id = new_run_id("aggregate_datasets")
+    plan_dir = plan_dir_for(run_id) if PROFILE else None
+    started_at = datetime.now().isoformat()
+    print(f"📂 Input: {INPUT_DATASET} ({dataset_root(INPUT_DATASET)})")
 
-    files = sorted(glob.glob(os.path.join(INPUT_DIR, "**", "*.parquet"), recursive=True))
-    if not files:
+    source_parts = dataset_partitions(INPUT_DATASET)
+    if not source_parts:
         print("❌ No files found.")
         return
 
     # Detect Mode
-    lf_sample = pl.scan_parquet(files[0])
-    sample_cols = lf_sample.collect_schema().names()
-    is_processed = "trip_archetype" in sample_cols
+    is_processed = is_processed_dataset(pl.scan_parquet(source_parts[0]["files"][0]))
     mode_label = "Processed" if is_processed else "Raw"
     print(f"🧠 Operation Mode: {mode_label.upper()}")
 
-    output_dir = os.path.join(OUTPUT_BASE, f"Aggregates_{mode_label}")
+    output_dir = os.path.join(dataset_root("aggregates"), f"Aggregates_{mode_label}")
     os.makedirs(output_dir, exist_ok=True)
 
-    # Storage for accumulation
-    mart1_list = []
-    mart2_list = []
-    mart3_list = []
-    mart4_list = []
+    manifest_file = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_file)
+    code = aggregation_fingerprint()
+
+    # Leftovers of an interrupted run: never valid output
+    discard_temp_files(glob.glob(os.path.join(output_dir, "**", "*" + TMP_SUFFIX), recursive=True))
+
+    jobs = []
+    inputs_by_key = {}
+    for p in source_parts:
+        key = partition_dir(p["year"], p["month"])
+        files = p["files"]
+        inputs = {"source": text_fingerprint(*(file_fingerprint(f) for f in files)), "code": code}
+        reason = stale_reason(manifest["partitions"].get(key), inputs, output_dir)
+        if reason is None:
+            continue
+        print(f"   🔁 {key} ({reason})")
+        inputs_by_key[key] = inputs
+        jobs.append({
+            "key": key.replace("/", "_"),
+            "partition": key,
+            "args": (files, partition_targets(output_dir, key, is_processed), is_processed, plan_dir),
+            "est_bytes": sum(estimate_task_bytes(f) for f in files),
+            "rows": sum(parquet_rows(f) or 0 for f in files) or None,
+        })
+
+    # Months whose source is gone take their mart partitions with them
+    live = {partition_dir(p["year"], p["month"]) for p in source_parts}
+    removed = [k for k in manifest["partitions"] if k not in live]
+    for key in removed:
+        for f in manifest["partitions"].pop(key).get("files", []):
+            path = os.path.join(output_dir, f)
+            if os.path.exists(path):
+                os.remove(path)
+            try:
+                os.removedirs(os.path.dirname(path))  # empty month/year folders only
+            except OSError:
+                pass
+        print(f"   🗑️ {key} (source partition removed)")
+    if removed:
+        save_manifest(manifest, manifest_file)
+
+    print(f"🔍 {len(source_parts)} source partition(s): {len(jobs)} to aggregate, {len(source_parts) - len(jobs)} up to date.")
+
+    def commit_partition(idx, record):
+        job = jobs[idx]
+        targets = job["args"][1]
+        if not record["ok"]:
+            discard_temp_files(temp_path(t) for t in targets.values())
+            return
+        written = record["value"]["rows"]
+        commit_files([(temp_path(targets[t]), targets[t]) for t in written])
+        manifest["partitions"][job["partition"]] = make_entry(
+            inputs_by_key[job["partition"]],
+            [os.path.relpath(targets[t], output_dir) for t in written],
+            rows=written,
+        )
+        save_manifest(manifest, manifest_file)
 
     start_total = time.time()
 
-    for i, f in enumerate(files, 1):
-        print(f"[{i}/{len(files)}] Aggregating {os.path.basename(f)}...", end="", flush=True)
-        st = time.time()
+    results = run_tasks(
+        aggregate_partition,
+        jobs,
+        label="Aggregating",
+        on_result=commit_partition,
+        memory_budget_gb=MEMORY_BUDGET_GB,
+    )
+    for res in results:
+        res["stages"] = res["value"]["stages"] if res["ok"] else []
+
+    report_failures(results)
+    if PROFILE and results:
+        report_file = write_run_report(
+            run_id, "aggregate_datasets", results, config={"input": INPUT_DATASET, "mode": mode_label}, started_at=started_at
+        )
+        print_stage_summary(report_file)
+        print(f"📊 Run report: {report_file} (query plans in {plan_dir})")
+
+    published = [os.path.join(output_dir, f"{t}.csv" if t in CSV_TABLES else f"{t}.parquet") for t in MART_TABLES.values()]
+    if not any(r["ok"] for r in results) and not removed and any(os.path.exists(f) for f in published):
+        print("✅ Every mart partition is up to date.")
+        return
 
-        d1, d2, d3, d4 = process_single_file(f, is_processed)
+    print("\n🔗 Publishing Final Marts...")
+    publish_tables(output_dir)
 
-        if d1 is not None:
-            mart1_list.append(d1)
-            mart2_list.append(d2)
-            if d3 is not None:
-                mart3_list.append(d3)
-            mart4_list.append(d4)
-            print(f" Done ({time.time() - st:.1f}s)")
-        else:
-            print(" Skipped.")
-
-        # CRITICAL: Free RAM immediately
-        gc.collect()
-
-    print("\n🔗 Concatenating and Saving Final Marts...")
-
-    # Save Mart 1
-    if mart1_list:
-        print("   -> Saving Timeline Backbone...")
-        pl.concat(mart1_list).write_parquet(os.path.join(output_dir, "agg_timeline_hourly.parquet"))
-        del mart1_list
-        gc.collect()
-
-    # Save Mart 2
-    if mart2_list:
-        print("   -> Saving Network Backbone...")
-        pl.concat(mart2_list).write_parquet(os.path.join(output_dir, "agg_network_monthly.parquet"))
-        del mart2_list
-        gc.collect()
-
-    # Save Mart 3
-    if mart3_list:
-        print("   -> Saving Economic Backbone...")
-        pl.concat(mart3_list).write_parquet(os.path.join(output_dir, "agg_pricing_distribution.parquet"))
-        del mart3_list
-        gc.collect()
-
-    # Save Mart 4
-    if mart4_list:
-        print("   -> Saving Executive Summary...")
-        pl.concat(mart4_list).sort("pickup_date").write_csv(os.path.join(output_dir, "agg_executive_daily.csv"))
-        del mart4_list
-        gc.collect()
+    network_file = os.path.join(output_dir, f"{MART_TABLES['Mart 2: Network']}.parquet")
+    if os.path.exists(network_file):
+        index = write_cubes(network_file, output_dir)
+        print(f"   -> OD cubes {' x '.join(map(str, index['shape']))}: {', '.join(index['files'])}")
 
     print(f"\n✅ Success! Total Time: {(time.time() - start_total) / 60:.2f} min")
 
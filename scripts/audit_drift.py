@@ -0,0 +1,153 @@
+import os
+
+import polars as pl
+
+# --- Configuration ---
+# Audit reports of each tier (tlc_universal_audit.py OUTPUT_FILE per INPUT_DATASET), compared pairwise
+REPORTS = {
+    "raw": "TLC_Universal_Audit_Report_Raw.csv",
+    "processed": "TLC_Universal_Audit_Report_Processed.csv",
+    "sampled": "TLC_Universal_Audit_Report_Sampled.csv",
+}
+PAIRS = [("raw", "processed"), ("processed", "sampled")]
+OUTPUT_FILE = "TLC_Audit_Drift_Report.csv"
+
+# A month's shift is flagged when it is significant (|z| >= Z_CRITICAL: two-sided p < 0.001) AND large
+# enough to matter (|effect| >= MIN_EFFECT: Cohen's d for means, Cohen's h for rates). With millions of
+# trips a month, significance alone would flag every rounding difference.
+Z_CRITICAL = 3.29
+MIN_EFFECT = 0.1
+
+# Report counts compared as rates: suffix -> denominator ("rows": all trips, "values": non-null ones)
+RATES = {"nulls": "rows", "zeros": "values", "negatives": "values"}
+
+
+# --- 1. Tests ---
+# Every report column is a per-month summary, so the tests run on summaries: the joined frame has tier
+# A's columns as they are and tier B's with a "_b" suffix.
+def _values(col, side):
+    """Non-null values of `col` in a month (the n behind its mean / std)."""
+    suffix = "" if side == "a" else "_b"
+    return pl.col(f"total_rows{suffix}") - pl.col(f"{col}_nulls{suffix}")
+
+
+def mean_shift(col):
+    """Welch z of the difference in means, and Cohen's d."""
+    m1, m2 = pl.col(f"{col}_mean"), pl.col(f"{col}_mean_b")
+    v1, v2 = pl.col(f"{col}_std") ** 2, pl.col(f"{col}_std_b") ** 2
+    se = (v1 / _values(col, "a") + v2 / _values(col, "b")).sqrt()
+    pooled = ((v1 + v2) / 2).sqrt()
+    return m1, m2, pl.when(se > 0).then((m2 - m1) / se), pl.when(pooled > 0).then((m2 - m1) / pooled)
+
+
+def rate_shift(col, stat):
+    """Two-proportion z of the difference in rates, and Cohen's h."""
+    if RATES[stat] == "rows":
+        n1, n2 = pl.col("total_rows"), pl.col("total_rows_b")
+    else:
+        n1, n2 = _values(col, "a"), _values(col, "b")
+    x1, x2 = pl.col(f"{col}_{stat}"), pl.col(f"{col}_{stat}_b")
+    p1, p2 = x1 / n1, x2 / n2
+    p = (x1 + x2) / (n1 + n2)
+    se = (p * (1 - p) * (1 / n1 + 1 / n2)).sqrt()
+    h = 2 * p2.sqrt().arcsin() - 2 * p1.sqrt().arcsin()
+    return p1, p2, pl.when(se > 0).then((p2 - p1) / se).otherwise(0.0), h
+
+
+# --- 2. Comparison ---
+def load_report(path):
+    """
+    One row per month. Raw files hold a few stray trips of neighbouring months, reported as rows
+    of their own: a month is compared on the partition it belongs to (its largest row).
+    """
+    df = pl.read_csv(path, try_parse_dates=True, infer_schema_length=None)
+    return df.sort("total_rows", descending=True).unique("audit_month", keep="first").sort("audit_month")
+
+
+def compare(a, b, name_a, name_b):
+    """
+    One row per month, metric and statistic the two reports share: both values, z, effect size
+    and whether the shift is flagged.
+    """
+    joined = a.join(b, on="audit_month", suffix="_b")
+    shared = [c for c in a.columns if c in b.columns]
+
+    tests = []
+    for c in shared:
+        if c.endswith("_mean") and {c.replace("_mean", "_std"), c.replace("_mean", "_nulls")} <= set(shared):
+            tests.append((c.removesuffix("_mean"), "mean", mean_shift(c.removesuffix("_mean"))))
+        for stat in RATES:
+            col = c.removesuffix(f"_{stat}")
+            if c.endswith(f"_{stat}") and (RATES[stat] == "rows" or f"{col}_nulls" in shared):
+                tests.append((col, f"{stat}_rate", rate_shift(col, stat)))
+
+    rows = [
+        joined.select(
+            "audit_month",
+            pl.lit(metric).alias("metric"),
+            pl.lit(statistic).alias("statistic"),
+            value_a.cast(pl.Float64).alias("value_a"),
+            value_b.cast(pl.Float64).alias("value_b"),
+            z.cast(pl.Float64).alias("z"),
+            effect.cast(pl.Float64).alias("effect"),
+        )
+        for metric, statistic, (value_a, value_b, z, effect) in tests
+    ]
+    if not rows:
+        return None
+    out = pl.concat(rows).drop_nulls(["value_a", "value_b"])
+    # inf / NaN summaries (e.g. raw speeds of zero-second trips) support no test
+    out = out.with_columns([pl.when(pl.col(c).is_finite()).then(pl.col(c)).alias(c) for c in ("z", "effect")])
+    flagged = (pl.col("z").abs() >= Z_CRITICAL) & (pl.col("effect").abs() >= MIN_EFFECT)
+    return out.select(
+        pl.lit(name_a).alias("tier_a"),
+        pl.lit(name_b).alias("tier_b"),
+        pl.all(),
+        flagged.fill_null(False).alias("flagged"),
+    )
+
+
+def run(reports=None, pairs=None, output_file=None):
+    """Compares every pair of tiers whose reports exist, writes and returns the drift table."""
+    reports, pairs, output_file = reports or REPORTS, pairs or PAIRS, output_file or OUTPUT_FILE
+    print("\n--- DRIFT (month by month) ---")
+
+    frames = []
+    for name_a, name_b in pairs:
+        missing = [reports[n] for n in (name_a, name_b) if not os.path.exists(reports[n])]
+        if missing:
+            print(f"   ⏭️ {name_a} vs {name_b}: no {', '.join(missing)}")
+            continue
+        drift = compare(load_report(reports[name_a]), load_report(reports[name_b]), name_a, name_b)
+        if drift is None or drift.is_empty():
+            print(f"   ⏭️ {name_a} vs {name_b}: no months or statistics in common")
+            continue
+        months = drift["audit_month"].n_unique()
+        print(f"   🔎 {name_a} vs {name_b}: {months} month(s), {drift['flagged'].sum()} of {drift.height} shifts flagged")
+        frames.append(drift)
+
+    if not frames:
+        return None
+    drift = pl.concat(frames).sort(["tier_a", "tier_b", "metric", "statistic", "audit_month"])
+    drift.write_csv(output_file)
+    print(f"✅ Drift Report Saved: {output_file}")
+
+    # Metrics that shifted most often, across months
+    top = (
+        drift.filter("flagged")
+        .group_by("tier_a", "tier_b", "metric", "statistic")
+        .agg(pl.len().alias("months_flagged"), pl.col("effect").abs().max().round(3).alias("max_abs_effect"))
+        .sort("months_flagged", "max_abs_effect", descending=True)
+    )
+    if not top.is_empty():
+        with pl.Config(tbl_rows=20, tbl_hide_dataframe_shape=True):
+            print(top.head(20))
+    return drift
+
+
+def main():
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import polars as pl
+import os
+import time
+import shutil
+import tempfile
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from process_data import OUTPUT_LAYOUT, apply_output_layout
+
+# ==============================================================================
+# ⚙️ CONFIGURATION
+# ==============================================================================
+# One processed partition: it is rewritten once per layout below. The baseline keeps this file's
+# row order, so point it at a partition written with sort_by=[] for a fair comparison.
+SOURCE_FILE = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\TLC_NYC_Processed\year=2024\month=10\data.parquet"
+
+# Layouts to compare. "Baseline" is what the pipeline wrote before layouts were configurable.
+# OUTPUT_LAYOUT keeps the raw order by default, so the date-sorted layout is listed on its own
+LAYOUTS = {
+    "Baseline (raw order, defaults)": {"sort_by": [], "statistics": True},
+    "Configured (OUTPUT_LAYOUT)": OUTPUT_LAYOUT,
+    "Date-sorted": {**OUTPUT_LAYOUT, "sort_by": ["pickup_datetime"]},
+    "Zone-first": {**OUTPUT_LAYOUT, "sort_by": ["PULocationID", "pickup_datetime"]},
+}
+
+# Typical notebook filters, as inclusive (column, low, high) ranges so the same definition
+# drives both the Polars query and the footer-statistics pruning estimate
+QUERIES = {
+    "One day": [("pickup_datetime", datetime(2024, 10, 15), datetime(2024, 10, 15, 23, 59, 59, 999999))],
+    "Friday evening rush": [
+        ("pickup_date", datetime(2024, 10, 18).date(), datetime(2024, 10, 18).date()),
+        ("pickup_hour", 16, 19),
+    ],
+    "JFK pickups": [("PULocationID", 132, 132)],
+    "Manhattan internal": [("borough_flow_type", "manhattan_internal", "manhattan_internal")],
+}
+SELECT_COLS = ["pickup_datetime", "PULocationID", "DOLocationID", "base_passenger_fare", "driver_pay"]
+
+REPEATS = 5
+# ==============================================================================
+
+
+def query_expr(ranges):
+    expr = pl.lit(True)
+    for col, lo, hi in ranges:
+        if lo == hi:
+            expr = expr & (pl.col(col) == pl.lit(lo))
+        else:
+            expr = expr & pl.col(col).is_between(pl.lit(lo), pl.lit(hi))
+    return expr
+
+
+def estimate_bytes_read(path, ranges, columns):
+    """
+    Compressed bytes a statistics-aware reader must fetch: the needed column chunks of every
+    row group whose min/max can't rule the filter out. Returns (bytes, kept groups, groups).
+    """
+    meta = pq.ParquetFile(path).metadata
+    names = [meta.schema.column(i).name for i in range(meta.num_columns)]
+    idx = {n: i for i, n in enumerate(names)}
+    needed = set(columns) | {col for col, _, _ in ranges}
+
+    total, kept = 0, 0
+    for g in range(meta.num_row_groups):
+        rg = meta.row_group(g)
+        skip = False
+        for col, lo, hi in ranges:
+            stats = rg.column(idx[col]).statistics
+            if stats is None or not stats.has_min_max:
+                continue
+            if isinstance(lo, str):
+                smin, smax = str(stats.min), str(stats.max)
+            else:
+                smin, smax = stats.min, stats.max
+            if smax < lo or smin > hi:
+                skip = True
+                break
+        if skip:
+            continue
+        kept += 1
+        total += sum(rg.column(idx[c]).total_compressed_size for c in needed if c in idx)
+
+    return total, kept, meta.num_row_groups
+
+
+def time_query(path, ranges, columns):
+    best = None
+    for _ in range(REPEATS):
+        start_t = time.perf_counter()
+        df = pl.scan_parquet(path).filter(query_expr(ranges)).select(columns).collect()
+        elapsed = time.perf_counter() - start_t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(df)
+
+
+def write_layout(source, target, layout):
+    lf, sink_options = apply_output_layout(pl.scan_parquet(source), layout)
+    start_t = time.perf_counter()
+    lf.sink_parquet(target, **sink_options)
+    return time.perf_counter() - start_t
+
+
+def main():
+    print("🚀 Orion: Parquet Layout Benchmark")
+    print(f"📂 Source: {SOURCE_FILE}")
+
+    work_dir = tempfile.mkdtemp(prefix="tlc_layout_")
+    rows = []
+    try:
+        for k, (name, layout) in enumerate(LAYOUTS.items()):
+            path = os.path.join(work_dir, f"layout_{k}.parquet")
+            write_s = write_layout(SOURCE_FILE, path, layout)
+            size = os.path.getsize(path)
+            print(f"\n🧱 {name}: {size / 1e6:,.1f} MB, written in {write_s:.1f}s")
+
+            for q_name, ranges in QUERIES.items():
+                seconds, n = time_query(path, ranges, SELECT_COLS)
+                read_bytes, kept, groups = estimate_bytes_read(path, ranges, SELECT_COLS)
+                print(
+                    f"   {q_name:<22} {seconds * 1000:8.1f} ms  {read_bytes / 1e6:8.1f} MB  "
+                    f"{kept}/{groups} row groups  ({n:,} rows)"
+                )
+                rows.append({
+                    "layout": name,
+                    "query": q_name,
+                    "file_mb": size / 1e6,
+                    "best_ms": seconds * 1000,
+                    "est_read_mb": read_bytes / 1e6,
+                    "row_groups_read": kept,
+                    "row_groups": groups,
+                    "rows_matched": n,
+                })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = pl.DataFrame(rows)
+    baseline = report.filter(pl.col("layout") == next(iter(LAYOUTS))).select([
+        "query",
+        pl.col("best_ms").alias("base_ms"),
+        pl.col("est_read_mb").alias("base_mb"),
+    ])
+    report = report.join(baseline, on="query").with_columns([
+        pl.col("best_ms").round(1),
+        pl.col("est_read_mb").round(1),
+        (pl.col("base_ms") / pl.col("best_ms")).round(2).alias("speedup"),
+        (1 - pl.col("est_read_mb") / pl.col("base_mb")).round(3).alias("bytes_saved"),
+    ])
+
+    print("\n--- SUMMARY (vs baseline) ---")
+    with pl.Config(tbl_rows=50, tbl_cols=12, tbl_width_chars=160):
+        print(report.select(["layout", "query", "best_ms", "speedup", "est_read_mb", "bytes_saved"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+import polars as pl
+import os
+import sys
+import glob
+import time
+import shutil
+import subprocess
+
+import synthetic_data
+from profiling import new_run_id, host_info
+
+# ==============================================================================
+# ⚙️ CONFIGURATION
+# ==============================================================================
+# Synthetic TLC_ROOT: raw months are generated here once, every script then reads and writes
+# under it through the catalog (same folder names as the real datasets)
+WORK_DIR = r"./benchmark_data"
+RESULTS_DIR = r"./benchmarks"
+
+PERIODS = synthetic_data.PERIODS
+ROWS_PER_MONTH = 500_000
+REPEATS = 3
+
+# Every repeat scans every file (no result cache) and times the audit alone (no drift report)
+AUDIT_UNCACHED = {"AUDIT_CACHE_DIR": None, "DRIFT_AFTER_AUDIT": False}
+
+# (step name, script module, config overrides, dataset whose rows count for throughput)
+STEPS = [
+    ("process_data", "process_data", {}, "raw"),
+    ("aggregate_raw", "aggregate_datasets", {"INPUT_DATASET": "raw"}, "raw"),
+    ("aggregate_processed", "aggregate_datasets", {"INPUT_DATASET": "processed"}, "processed"),
+    ("audit_raw", "tlc_universal_audit", {"INPUT_DATASET": "raw", "OUTPUT_FILE": "audit_raw.csv", **AUDIT_UNCACHED}, "raw"),
+    ("audit_processed", "tlc_universal_audit", {"INPUT_DATASET": "processed", "OUTPUT_FILE": "audit_processed.csv", **AUDIT_UNCACHED}, "processed"),
+    ("sampling", "stratified_sampling", {}, "processed"),
+]
+
+RSS_SAMPLE_SECONDS = 0.05
+# ==============================================================================
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ZONE_SOURCE = os.path.join(SCRIPTS_DIR, "..", "external_data", "taxi_zones_detailed.csv")
+
+# Folder names under TLC_ROOT, as in catalog.DATASETS
+RAW_FOLDER = "HVFHV subsets 2019-2025"
+PROCESSED_FOLDER = "TLC_NYC_Processed"
+AGGREGATES_FOLDER = "HVFHV subsets 2019-2025 - Aggregates"
+
+
+# --- 1. Synthetic Inputs ---
+def prepare_inputs(work_dir):
+    """Raw months, weather and zones where the scripts expect them (reused across suite runs)."""
+    os.makedirs(work_dir, exist_ok=True)
+    zone_file = os.path.join(work_dir, "taxi_zones_detailed.csv")
+    if not os.path.exists(zone_file):
+        shutil.copyfile(ZONE_SOURCE, zone_file)
+
+    synthetic_data.ZONE_FILE = zone_file
+    synthetic_data.generate_dataset(
+        PERIODS,
+        ROWS_PER_MONTH,
+        output_dir=os.path.join(work_dir, RAW_FOLDER),
+        weather_output=os.path.join(work_dir, "nyc_weather_hourly_2019_2025.csv"),
+    )
+
+
+def dataset_rows(work_dir, name):
+    """Rows of a dataset under the synthetic root (Parquet footers only)."""
+    pattern = {
+        "raw": os.path.join(work_dir, RAW_FOLDER, "*.parquet"),
+        "processed": os.path.join(work_dir, PROCESSED_FOLDER, "year=*", "month=*", "*.parquet"),
+    }[name]
+    # One scan per file: the months' schemas drift (see synthetic_data.raw_schema)
+    return sum(pl.scan_parquet(f).select(pl.len()).collect().item() for f in glob.glob(pattern))
+
+
+# --- 2. Measurement ---
+def tree_rss_bytes(pid):
+    """RSS of a process plus all its descendants (the scheduler's workers); None without psutil."""
+    try:
+        import psutil
+
+        root = psutil.Process(pid)
+        procs = [root] + root.children(recursive=True)
+    except ImportError:
+        return None
+    except Exception:
+        return 0
+
+    total = 0
+    for p in procs:
+        try:
+            total += p.memory_info().rss
+        except Exception:
+            pass
+    return total
+
+
+def children_peak_bytes():
+    # Fallback without psutil: largest single descendant seen so far (not the sum of a pool)
+    try:
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+def run_step(module, overrides, work_dir, log_file):
+    """Runs one script's main() in a fresh interpreter; returns (ok, seconds, peak RSS bytes)."""
+    code = f"import {module} as m\n" + "".join(f"m.{k} = {v!r}\n" for k, v in overrides.items()) + "m.main()\n"
+    env = dict(os.environ)
+    env["TLC_ROOT"] = os.path.abspath(work_dir)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in [SCRIPTS_DIR, env.get("PYTHONPATH")] if p)
+    env["PYTHONIOENCODING"] = "utf-8"
+
+    peak = 0
+    with open(log_file, "w", encoding="utf-8") as log:
+        start_t = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-c", code], cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        while proc.poll() is None:
+            rss = tree_rss_bytes(proc.pid)
+            if rss is None:
+                proc.wait()
+                break
+            peak = max(peak, rss)
+            time.sleep(RSS_SAMPLE_SECONDS)
+        seconds = time.perf_counter() - start_t
+
+    if not peak:
+        peak = children_peak_bytes()
+    return proc.returncode == 0, seconds, peak
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+# --- 3. Reporting ---
+def summarize(df):
+    return (
+        df.filter(pl.col("ok"))
+        .group_by("step", maintain_order=True)
+        .agg([
+            pl.col("rows").first(),
+            pl.col("seconds").median().round(2).alias("median_s"),
+            pl.col("seconds").min().round(2).alias("best_s"),
+            (pl.col("rows").first() / pl.col("seconds").median()).round(0).alias("rows_per_sec"),
+            (pl.col("peak_rss_bytes").max() / 1e6).round(0).alias("peak_rss_mb"),
+        ])
+    )
+
+
+def previous_summary(results_dir, run_id):
+    """Summary of the latest earlier run at the same size, to track throughput over commits."""
+    runs = sorted(f for f in glob.glob(os.path.join(results_dir, "*.parquet")) if not f.endswith(f"{run_id}.parquet"))
+    for f in reversed(runs):
+        df = pl.read_parquet(f)
+        if df["rows_per_month"][0] == ROWS_PER_MONTH and df["periods"][0] == ",".join(PERIODS):
+            return df["commit"][0], summarize(df)
+    return None, None
+
+
+def main():
+    print("🚀 Orion: Offline Benchmark Suite")
+    print(f"📂 Synthetic root: {WORK_DIR} ({len(PERIODS)} months x {ROWS_PER_MONTH:,} rows)")
+    prepare_inputs(WORK_DIR)
+
+    run_id = new_run_id("benchmark_suite")
+    log_dir = os.path.join(RESULTS_DIR, f"{run_id}_logs")
+    os.makedirs(log_dir, exist_ok=True)
+    commit = git_commit()
+    host = host_info()
+
+    rows = []
+    for name, module, overrides, input_dataset in STEPS:
+        for k in range(REPEATS):
+            # Cold build every time (the manifests would skip everything after the first run)
+            if module == "process_data":
+                shutil.rmtree(os.path.join(WORK_DIR, PROCESSED_FOLDER), ignore_errors=True)
+            elif module == "aggregate_datasets":
+                shutil.rmtree(os.path.join(WORK_DIR, AGGREGATES_FOLDER), ignore_errors=True)
+
+            log_file = os.path.join(log_dir, f"{name}_{k}.log")
+            ok, seconds, peak = run_step(module, overrides, WORK_DIR, log_file)
+            n = dataset_rows(WORK_DIR, input_dataset)
+            status = f"{seconds:6.1f}s  {n / seconds:12,.0f} rows/s  peak {(peak or 0) / 1e6:7,.0f} MB" if ok else "❌ FAILED"
+            print(f"   {name:<22} run {k + 1}/{REPEATS}  {status}")
+            if not ok:
+                print(f"      see {log_file}")
+
+            rows.append({
+                "run_id": run_id,
+                "commit": commit,
+                "step": name,
+                "repeat": k,
+                "ok": ok,
+                "seconds": seconds,
+                "rows": n,
+                "peak_rss_bytes": peak,
+                "rows_per_month": ROWS_PER_MONTH,
+                "periods": ",".join(PERIODS),
+                "polars": host["polars"],
+                "cpu_count": host["cpu_count"],
+                "platform": host["platform"],
+            })
+
+    df = pl.DataFrame(rows, schema_overrides={"peak_rss_bytes": pl.Int64, "commit": pl.String})
+    df.write_parquet(os.path.join(RESULTS_DIR, f"{run_id}.parquet"))
+
+    summary = summarize(df)
+    prev_commit, prev = previous_summary(RESULTS_DIR, run_id)
+    if prev is not None:
+        summary = summary.join(
+            prev.select(["step", pl.col("rows_per_sec").alias("prev_rows_per_sec")]), on="step", how="left"
+        ).with_columns((pl.col("rows_per_sec") / pl.col("prev_rows_per_sec")).round(2).alias("speedup"))
+
+    print(f"\n--- SUMMARY ({run_id}, commit {commit or 'n/a'}" + (f", vs {prev_commit or 'previous run'})" if prev is not None else ")") + " ---")
+    with pl.Config(tbl_rows=30, tbl_width_chars=160, tbl_hide_dataframe_shape=True):
+        print(summary)
+    print(f"📊 Results: {os.path.join(RESULTS_DIR, run_id)}.parquet")
+
+
+if __name__ == "__main__":
+    main()
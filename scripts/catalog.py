@@ -0,0 +1,231 @@
+import os
+import re
+import glob
+
+import polars as pl
+
+from manifest import load_manifest, save_manifest
+from tlc_schema import scan_dataset
+
+# ==============================================================================
+# 🗂️ DATASET CATALOG
+# Every dataset stays where its script wrote it. The catalog finds its month partitions,
+# hands out lazy scans pruned to a year/month range and exposes Hive or flat views of the
+# same files (links, never copies).
+# ==============================================================================
+# TLC_ROOT in the environment overrides it (e.g. benchmark_suite.py points it at synthetic data)
+TLC_ROOT = os.environ.get("TLC_ROOT", r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets")
+
+DATASETS = {
+    # TLC downloads: fhvhv_tripdata_YYYY-MM.parquet
+    "raw": {"root": os.path.join(TLC_ROOT, "HVFHV subsets 2019-2025"), "layout": "flat"},
+    # process_data output: year=YYYY/month=MM/data.parquet (or part-*.parquet shards)
+    "processed": {"root": os.path.join(TLC_ROOT, "TLC_NYC_Processed"), "layout": "hive"},
+    # process_data QUARANTINE output: the rows the Great Filter rejected, same layout as "processed"
+    "quarantine": {"root": os.path.join(TLC_ROOT, "TLC_NYC_Quarantine"), "layout": "hive"},
+    # stratified_sampling output: tlc_sample_YYYY.parquet, tlc_sample_YYYY-MM.parquet or tlc_sample_full.parquet.
+    # The 1% sample; the nested 5% / 10% ones (supersets of it) sit in subfolders
+    "samples": {"root": os.path.join(TLC_ROOT, "HVFHV subsets 2019-2025 - Samples"), "layout": "flat"},
+    "samples_5pct": {"root": os.path.join(TLC_ROOT, "HVFHV subsets 2019-2025 - Samples", "5pct"), "layout": "flat"},
+    "samples_10pct": {"root": os.path.join(TLC_ROOT, "HVFHV subsets 2019-2025 - Samples", "10pct"), "layout": "flat"},
+    # aggregate_datasets output: Aggregates_{Raw,Processed}/agg_*.parquet (not month-partitioned)
+    "aggregates": {"root": os.path.join(TLC_ROOT, "HVFHV subsets 2019-2025 - Aggregates"), "layout": "tables"},
+}
+
+# Names used by the flat view of a Hive dataset (what move_files used to produce)
+FLAT_PREFIX = "tlc_uber_"
+# Written inside a materialized view: the links it made, the only regular files it may delete
+VIEW_MANIFEST = "_view_manifest.json"
+
+FLAT_PERIOD = re.compile(r"_(\d{4})(?:-(\d{2}))?(?:[_.]|$)")
+HIVE_PERIOD = re.compile(r"year=(\d{4})[\\/]+month=(\d{1,2})")
+
+
+# --- 1. Discovery ---
+def dataset_root(name):
+    return DATASETS[name]["root"]
+
+
+def _period_key(year, month):
+    return (year if year is not None else -1, month if month is not None else -1)
+
+
+def partitions(name):
+    """
+    Month partitions of a dataset, found in place:
+        [{"year": 2019, "month": 2, "files": [...]}, ...]
+    Yearly files have month None, files without a period (e.g. a full sample) year None too.
+    """
+    spec = DATASETS[name]
+    root = spec["root"]
+    found = {}
+
+    if spec["layout"] == "hive":
+        for f in glob.glob(os.path.join(root, "year=*", "month=*", "*.parquet")):
+            m = HIVE_PERIOD.search(os.path.relpath(f, root))
+            if m:
+                found.setdefault((int(m.group(1)), int(m.group(2))), []).append(f)
+    elif spec["layout"] == "flat":
+        for f in glob.glob(os.path.join(root, "*.parquet")):
+            m = FLAT_PERIOD.search(os.path.basename(f))
+            year = int(m.group(1)) if m else None
+            month = int(m.group(2)) if m and m.group(2) else None
+            found.setdefault((year, month), []).append(f)
+    else:
+        raise ValueError(f"Dataset '{name}' is not month-partitioned (layout: {spec['layout']})")
+
+    return [
+        {"year": y, "month": m, "files": sorted(files)}
+        for (y, m), files in sorted(found.items(), key=lambda kv: _period_key(*kv[0]))
+    ]
+
+
+def _parse_bound(bound):
+    """'2021', '2021-03', (2021, 3) or None -> (year, month) tuple or None."""
+    if bound is None or isinstance(bound, tuple):
+        return bound
+    parts = str(bound).split("-")
+    return (int(parts[0]), int(parts[1]) if len(parts) > 1 else None)
+
+
+def in_range(year, month, start=None, end=None):
+    """Inclusive year/month range test. A yearly partition matches when its year overlaps."""
+    start, end = _parse_bound(start), _parse_bound(end)
+    if year is None:
+        return start is None and end is None
+    if start is not None:
+        if (year, month if month is not None else 12) < (start[0], start[1] or 1):
+            return False
+    if end is not None:
+        if (year, month if month is not None else 1) > (end[0], end[1] or 12):
+            return False
+    return True
+
+
+def select_partitions(name, start=None, end=None):
+    return [p for p in partitions(name) if in_range(p["year"], p["month"], start, end)]
+
+
+def list_files(name, start=None, end=None):
+    """Every file of the dataset whose partition falls in [start, end] (inclusive, 'YYYY[-MM]')."""
+    return [f for p in select_partitions(name, start, end) for f in p["files"]]
+
+
+# --- 2. Scans ---
+def scan(name, start=None, end=None, fill_missing=True):
+    """
+    One LazyFrame over the partitions in [start, end], with canonical dtypes (see tlc_schema).
+    Pruning happens on the partition listing, so out-of-range months are never opened.
+    """
+    files = list_files(name, start, end)
+    if not files:
+        raise FileNotFoundError(f"No '{name}' partitions between {start or 'the start'} and {end or 'the end'}")
+    return pl.concat([scan_dataset(f, fill_missing=fill_missing) for f in files], how="diagonal_relaxed")
+
+
+def table_path(table, mode="Processed"):
+    """Path of an aggregate mart, e.g. table_path('agg_timeline_hourly')."""
+    return os.path.join(dataset_root("aggregates"), f"Aggregates_{mode}", f"{table}.parquet")
+
+
+def scan_table(table, mode="Processed"):
+    return pl.scan_parquet(table_path(table, mode))
+
+
+# --- 3. Views ---
+def view(name, kind="flat"):
+    """
+    {relative path in the view: real file} for a month-partitioned dataset.
+    - flat: tlc_uber_YYYY-MM.parquet (shards: tlc_uber_YYYY-MM_part-00000.parquet)
+    - hive: year=YYYY/month=MM/<file name>
+    """
+    entries = {}
+    for p in partitions(name):
+        if p["year"] is None or p["month"] is None:
+            continue
+        period = f"{p['year']}-{p['month']:02d}"
+        for f in p["files"]:
+            if kind == "flat":
+                stem = os.path.splitext(os.path.basename(f))[0]
+                suffix = "" if len(p["files"]) == 1 else f"_{stem}"
+                rel = f"{FLAT_PREFIX}{period}{suffix}.parquet"
+            elif kind == "hive":
+                rel = os.path.join(f"year={p['year']}", f"month={p['month']:02d}", os.path.basename(f))
+            else:
+                raise ValueError(f"Unknown view '{kind}' (use 'flat' or 'hive')")
+            entries[rel] = f
+    return entries
+
+
+def _link(src, dst):
+    try:
+        os.symlink(os.path.abspath(src), dst)  # Follows the path, so rebuilt months need no re-link
+    except OSError:
+        os.link(src, dst)  # No symlink rights (Windows without Developer Mode): same-volume hard link
+
+
+def _removable(path, rel, recorded):
+    """
+    Whether the view may delete `path`: symlinks always, regular files only when the view
+    created them and another name still holds their bytes. A file with a single link is never
+    removed: it may be the only copy (e.g. a folder the old move_files filled by moving files).
+    """
+    if os.path.islink(path):
+        return True
+    return rel in recorded and os.stat(path).st_nlink > 1
+
+
+def materialize_view(name, kind, target_dir):
+    """
+    Builds a view as links in `target_dir`: symlinks when possible, hard links otherwise.
+    Nothing is copied or moved, so the source keeps its layout (and its manifest stays valid).
+    The links it made are recorded in VIEW_MANIFEST inside `target_dir`.
+
+    Re-run it after every rebuild of the source: links whose partition is gone are removed and
+    hard links that no longer point at the current file are re-linked. Files the view may not
+    delete (see _removable) are left in place and returned, e.g. a hard link whose source was
+    rebuilt or removed now holds the only copy of the old bytes.
+    Returns (links created, links removed, relative paths kept).
+    """
+    entries = view(name, kind)
+    manifest_file = os.path.join(target_dir, VIEW_MANIFEST)
+    manifest = load_manifest(manifest_file)
+    recorded = manifest["partitions"]
+    pattern = os.path.join(target_dir, f"{FLAT_PREFIX}*.parquet" if kind == "flat" else os.path.join("year=*", "month=*", "*"))
+    # Symlinks of an unrecorded earlier view are safe to drop; regular files must be recorded
+    present = {os.path.relpath(f, target_dir) for f in glob.glob(pattern) if os.path.islink(f)}
+
+    created = pruned = 0
+    kept = []
+    for rel in sorted((present | set(recorded)) - set(entries)):
+        path = os.path.join(target_dir, rel)
+        if not os.path.lexists(path):
+            recorded.pop(rel, None)
+            continue
+        if not _removable(path, rel, recorded):
+            kept.append(rel)
+            continue
+        os.remove(path)
+        recorded.pop(rel, None)
+        pruned += 1
+        if kind == "hive":
+            for d in (os.path.dirname(rel), os.path.dirname(os.path.dirname(rel))):
+                if not os.listdir(os.path.join(target_dir, d)):
+                    os.rmdir(os.path.join(target_dir, d))
+
+    for rel, src in entries.items():
+        dst = os.path.join(target_dir, rel)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.lexists(dst):
+            if os.path.exists(dst) and os.path.samefile(src, dst):
+                recorded[rel] = src
+                continue
+            if not _removable(dst, rel, recorded):
+                kept.append(rel)
+                continue
+            os.remove(dst)
+        _link(src, dst)
+        recorded[rel] = src
+        created += 1
+    save_manifest(manifest, manifest_file)
+    return created, pruned, kept
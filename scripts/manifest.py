@@ -0,0 +1,109 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+# --- Configuration ---
+# Files up to this size are hashed whole; larger ones by size + head + tail (for Parquet the
+# tail is the footer: schema, row-group offsets and per-column statistics)
+FULL_HASH_MAX_BYTES = 64 * 1024**2
+EDGE_BYTES = 1024**2
+
+TMP_SUFFIX = ".tmp"
+
+
+# --- 1. Fingerprints ---
+def file_fingerprint(path):
+    """
+    Content fingerprint of a file (not its mtime, so a re-download of identical bytes is not a
+    change). Returns None when the file doesn't exist.
+    """
+    if not os.path.exists(path):
+        return None
+
+    size = os.path.getsize(path)
+    h = hashlib.sha256(str(size).encode())
+    with open(path, "rb") as f:
+        if size <= FULL_HASH_MAX_BYTES:
+            for block in iter(lambda: f.read(EDGE_BYTES), b""):
+                h.update(block)
+        else:
+            h.update(f.read(EDGE_BYTES))
+            f.seek(-EDGE_BYTES, os.SEEK_END)
+            h.update(f.read(EDGE_BYTES))
+    return h.hexdigest()[:16]
+
+
+def text_fingerprint(*parts):
+    """Fingerprint of any strings (source code, config reprs...)."""
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode())
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+# --- 2. Manifest I/O ---
+def load_manifest(path):
+    """{"partitions": {key: entry}}; empty when the manifest doesn't exist yet."""
+    if not os.path.exists(path):
+        return {"partitions": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path):
+    """Atomic: a crash mid-write leaves the previous manifest in place."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + TMP_SUFFIX
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def stale_reason(entry, fingerprints, base_dir):
+    """
+    Why a partition must be rebuilt, or None when it is up to date.
+    `fingerprints` maps each input name to its current fingerprint; every one must match the
+    recorded value and every recorded output file must still exist under `base_dir`.
+    """
+    if entry is None:
+        return "new"
+
+    changed = [k for k, v in fingerprints.items() if entry.get("inputs", {}).get(k) != v]
+    if changed:
+        return f"{', '.join(changed)} changed"
+
+    if not all(os.path.exists(os.path.join(base_dir, f)) for f in entry.get("files", [])):
+        return "output missing"
+
+    return None
+
+
+def make_entry(fingerprints, files, **extra):
+    return {"inputs": dict(fingerprints), "files": sorted(files), "written_at": datetime.now().isoformat(), **extra}
+
+
+# --- 3. Atomic File Writes ---
+def temp_path(path):
+    """Where to write `path` before committing it (never matches a *.parquet glob)."""
+    return path + TMP_SUFFIX
+
+
+def commit_files(pairs, stale_files=()):
+    """
+    Moves every (temp, final) pair into place with os.replace (atomic per file) and then
+    removes `stale_files`: outputs of the previous build that the new one doesn't produce.
+    """
+    for tmp, final in pairs:
+        os.replace(tmp, final)
+    finals = {os.path.abspath(final) for _, final in pairs}
+    for f in stale_files:
+        if os.path.abspath(f) not in finals and os.path.exists(f):
+            os.remove(f)
+
+
+def discard_temp_files(paths):
+    for p in paths:
+        if os.path.exists(p):
+            os.remove(p)
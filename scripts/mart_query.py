@@ -0,0 +1,189 @@
+import os
+
+import polars as pl
+
+from catalog import dataset_root, list_files, scan
+from marts import FINISHED_STATS, TIME_KEYS, rollup
+from tlc_schema import PROCESSED_SCHEMA
+
+# ==============================================================================
+# 🧭 AGGREGATE NAVIGATION
+# "metrics X by keys Y where Z" answered from the smallest mart that holds X, Y and Z exactly
+# (rolled up with marts.rollup), the processed trips only when no mart can. Results are cached
+# in-process until a source file changes.
+# ==============================================================================
+
+# Marts and their keys (beyond the time keys they can derive, see VIRTUAL_KEYS)
+MARTS = {
+    "executive": {"file": "agg_executive_daily.csv", "keys": ["pickup_date"]},
+    "economic": {
+        "file": "agg_pricing_distribution.parquet",
+        "keys": ["pickup_date", "time_of_day_bin", "weather_state", "borough_flow_type"],
+    },
+    "timeline": {
+        "file": "agg_timeline_hourly.parquet",
+        "keys": TIME_KEYS + ["borough_flow_type", "trip_archetype", "cultural_day_type"],
+    },
+    "network": {
+        "file": "agg_network_monthly.parquet",
+        "keys": ["pickup_year", "pickup_month", "PULocationID", "DOLocationID", "pickup_borough", "dropoff_borough"],
+    },
+}
+
+# Same metric, different column name: mart column -> query metric name
+RENAMES = {
+    "executive": {
+        "total_trips": "trip_count",
+        "total_fare_revenue": "total_fare_amt",
+        "total_gross_booking_value": "total_revenue_gross",
+        "total_km_traveled": "total_km",
+        "bad_weather_trip_count": "bad_weather_count",
+        "extreme_weather_trip_count": "extreme_weather_count",
+        "avg_distance_miles": "avg_trip_miles",
+    },
+}
+
+# Time keys a mart can derive exactly from the ones it has
+VIRTUAL_KEYS = {
+    "executive": {
+        "pickup_year": pl.col("pickup_date").dt.year(),
+        "pickup_month": pl.col("pickup_date").dt.month(),
+        "pickup_day": pl.col("pickup_date").dt.day(),
+    },
+    "timeline": {"pickup_date": pl.date("pickup_year", "pickup_month", "pickup_day")},
+}
+VIRTUAL_KEYS["economic"] = VIRTUAL_KEYS["executive"]
+
+# Last resort: every metric as an aggregation over the processed trips
+TRIP_METRICS = {
+    "trip_count": pl.len(),
+    "total_fare_amt": pl.col("base_passenger_fare").sum(),
+    "total_driver_pay": pl.col("driver_pay").sum(),
+    "total_cbd_fee": pl.col("cbd_congestion_fee").sum(),
+    "total_revenue_gross": pl.col("total_rider_cost").sum(),
+    "total_tips": pl.col("tips").sum(),
+    "total_km": pl.col("trip_km").sum(),
+    "bad_weather_count": pl.col("is_bad_weather").sum(),
+    "extreme_weather_count": pl.col("is_extreme_weather").sum(),
+    # Processed trips keep the distance in km only (trip_km = trip_miles * 1.60934)
+    "avg_trip_miles": pl.col("trip_km").mean() / 1.60934,
+    **{
+        name: pl.col(col).mean() if stat == "mean" else pl.col(col).std()
+        for name, (col, stat) in FINISHED_STATS.items()
+        if name not in RENAMES["executive"] and col in PROCESSED_SCHEMA
+    },
+}
+
+# Metrics of raw-only columns (e.g. avg_duration_sec from Uber's trip_time): only a Raw mart has them
+MART_ONLY_METRICS = {
+    name: col for name, (col, _) in FINISHED_STATS.items() if name not in TRIP_METRICS and name not in RENAMES["executive"]
+}
+
+_CACHE = {}
+
+
+# --- 1. Sources ---
+def mart_path(mart, mode="Processed"):
+    return os.path.join(dataset_root("aggregates"), f"Aggregates_{mode}", MARTS[mart]["file"])
+
+
+def scan_mart(mart, mode="Processed"):
+    """The mart under query names, with its derivable time keys added."""
+    path = mart_path(mart, mode)
+    lf = pl.scan_csv(path, try_parse_dates=True) if path.endswith(".csv") else pl.scan_parquet(path)
+    lf = lf.rename(RENAMES.get(mart, {}), strict=False)
+    virtual = VIRTUAL_KEYS.get(mart, {})
+    return lf.with_columns([expr.alias(k) for k, expr in virtual.items()]) if virtual else lf
+
+
+def stat_columns(metric):
+    """Sufficient statistics a finished mean / std is rolled up from."""
+    col, stat = FINISHED_STATS[metric]
+    return [f"{col}_sum", f"{col}_n"] + ([f"{col}_sumsq"] if stat == "std" else [])
+
+
+def can_answer(mart, columns, metrics, by, where_cols):
+    """
+    True when the mart (with `columns`) holds every key, filter column and metric exactly. Keys
+    must be both declared and present: a mode's mart may lack some (e.g. no borough_flow_type
+    in the Raw timeline).
+    """
+    keys = (set(MARTS[mart]["keys"]) | set(VIRTUAL_KEYS.get(mart, {}))) & set(columns)
+    if not set(by) <= keys or not set(where_cols) <= keys:
+        return False
+    for m in metrics:
+        if m not in columns:
+            return False
+        if m in FINISHED_STATS and not set(stat_columns(m)) <= set(columns):
+            return False
+    return True
+
+
+def choose_source(metrics, by=(), where=None, mode="Processed"):
+    """Smallest mart (by file size) that answers the query exactly, else "trips"."""
+    where_cols = where.meta.root_names() if where is not None else []
+    candidates = []
+    for mart in MARTS:
+        path = mart_path(mart, mode)
+        if not os.path.exists(path):
+            continue
+        if can_answer(mart, scan_mart(mart, mode).collect_schema().names(), metrics, by, where_cols):
+            candidates.append((os.path.getsize(path), mart))
+    return min(candidates)[1] if candidates else "trips"
+
+
+def _signature(source, mode):
+    """Changes whenever the source's files do (cache invalidation)."""
+    files = [mart_path(source, mode)] if source != "trips" else list_files("processed")
+    return tuple((f, os.path.getmtime(f), os.path.getsize(f)) for f in files)
+
+
+# --- 2. Queries ---
+def query(metrics, by=(), where=None, mode="Processed", use_cache=True):
+    """
+    Metrics grouped by keys, filtered by an expression on key columns:
+
+        query(["trip_count", "avg_wait_time"], by=["pickup_borough"], where=pl.col("pickup_year") == 2024)
+
+    Metrics use the timeline / network / economic column names (e.g. "trip_count",
+    "total_fare_amt", "avg_trip_km", "std_driver_share"). Time keys: pickup_year, pickup_month,
+    pickup_day, pickup_hour, pickup_date.
+    """
+    metrics, by = list(metrics), list(by)
+    unknown = [m for m in metrics if m not in TRIP_METRICS and m not in MART_ONLY_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics {unknown} (known: {sorted(TRIP_METRICS) + sorted(MART_ONLY_METRICS)})")
+
+    key = (mode, tuple(metrics), tuple(by), where.meta.serialize(format="json") if where is not None else None)
+    if use_cache and key in _CACHE:
+        source, signature, df = _CACHE[key]
+        if _signature(source, mode) == signature:
+            return df
+
+    source = choose_source(metrics, by, where, mode)
+    if source == "trips":
+        if mode != "Processed":
+            raise ValueError(f"No {mode} mart answers {metrics} by {by}; only processed trips can be rescanned")
+        mart_only = [m for m in metrics if m in MART_ONLY_METRICS]
+        if mart_only:
+            cols = sorted({MART_ONLY_METRICS[m] for m in mart_only})
+            raise ValueError(f"{mart_only} need {cols}, which processed trips don't have: query them with mode='Raw'")
+        lf = scan("processed")
+        lf = lf.filter(where) if where is not None else lf
+        aggs = [TRIP_METRICS[m].alias(m) for m in metrics]
+        df = (lf.group_by(by).agg(aggs).sort(by) if by else lf.select(aggs)).collect()
+    else:
+        lf = scan_mart(source, mode)
+        lf = lf.filter(where) if where is not None else lf
+        # Only what the query needs goes into the rollup (finished stats come with their sums)
+        stats = [c for m in metrics if m in FINISHED_STATS for c in stat_columns(m)]
+        lf = lf.select(list(dict.fromkeys(by + metrics + stats)))
+        df = rollup(lf, by=by).select(by + metrics).collect()
+
+    print(f"🧭 {metrics} by {by or 'all'} <- {source} ({df.height:,} rows)")
+    _CACHE[key] = (source, _signature(source, mode), df)
+    return df
+
+
+def clear_cache():
+    _CACHE.clear()
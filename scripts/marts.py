@@ -0,0 +1,258 @@
+import math
+
+import polars as pl
+
+# ==============================================================================
+# 🧮 MART ROLLUPS
+# Finished means / stds can't be re-aggregated, so every mart also stores the sufficient
+# statistics behind them (`<metric>_sum`, `<metric>_n` and, for stds, `<metric>_sumsq`).
+# Quantiles can't either: the economic mart stores a mergeable sketch per group instead.
+# rollup() turns any mart into a coarser one from those alone: exact means and stds,
+# quantiles within the sketch's error bound.
+# ==============================================================================
+
+# Finished mart statistic -> (trip metric whose sums are stored next to it, statistic)
+FINISHED_STATS = {
+    # Timeline
+    "avg_trip_km": ("trip_km", "mean"),
+    "avg_speed_kmh": ("speed_kmh", "mean"),
+    "avg_trip_miles": ("trip_miles", "mean"),
+    # Network
+    "avg_duration_min": ("duration_min", "mean"),
+    "avg_cost": ("total_rider_cost", "mean"),
+    "avg_displacement_speed": ("displacement_speed_kmh", "mean"),
+    "avg_wait_time": ("total_wait_time_min", "mean"),
+    "avg_driver_response": ("driver_response_time_min", "mean"),
+    "avg_duration_sec": ("trip_time", "mean"),
+    # Economic
+    "avg_driver_share": ("driver_revenue_share", "mean"),
+    "std_driver_share": ("driver_revenue_share", "std"),
+    "avg_take_rate": ("uber_take_rate_proxy", "mean"),
+    "avg_tip_pct": ("tipping_pct", "mean"),
+    "avg_hourly_wage": ("pay_per_hour", "mean"),
+    # Executive
+    "avg_distance_miles": ("trip_miles", "mean"),
+}
+
+STAT_SUFFIXES = ("_sum", "_n", "_sumsq")
+
+# Quantile sketches: mart column -> trip metric
+SKETCHES = {
+    "fare_sketch": "base_passenger_fare",
+    "wait_time_sketch": "total_wait_time_min",
+    "pay_per_hour_sketch": "pay_per_hour",
+}
+# Relative error of every sketch quantile (for |values| >= SKETCH_MIN_VALUE; smaller ones
+# share one bucket, reported as 0). Buckets grow by GAMMA, so a metric spanning 0.01 - 10,000
+# needs at most ~700 of them, and a typical group far fewer.
+SKETCH_ALPHA = 0.01
+SKETCH_MIN_VALUE = 0.01
+GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+# ±inf get the outermost buckets (read back as ±inf), so they still count towards the ranks
+INF_BUCKET = 32767
+
+# Hierarchical time keys (timeline / network) and the grains they support
+TIME_KEYS = ["pickup_year", "pickup_month", "pickup_day", "pickup_hour"]
+GRAINS = ["year", "month", "day", "hour"]
+# Date-keyed marts (economic / executive): pickup_date is truncated instead
+DATE_TRUNCATE = {"year": "1y", "month": "1mo", "week": "1w", "day": None}
+
+
+# --- 1. Building the Statistics ---
+def sufficient_stats(aggs):
+    """
+    Sum and non-null count (plus sum of squares for stds) of the metric behind every finished
+    mean / std in `aggs`, to be appended to the same group_by.
+    """
+    stats = {}
+    for expr in aggs:
+        name = expr.meta.output_name()
+        if name not in FINISHED_STATS:
+            continue
+        col, stat = FINISHED_STATS[name]
+        # Float64 sums: Float32 metrics would lose precision over millions of trips
+        stats[f"{col}_sum"] = pl.col(col).cast(pl.Float64).sum()
+        stats[f"{col}_n"] = pl.col(col).count()
+        if stat == "std":
+            stats[f"{col}_sumsq"] = (pl.col(col).cast(pl.Float64) ** 2).sum()
+    return [expr.alias(name) for name, expr in stats.items()]
+
+
+def is_additive(col):
+    """Totals and counts (and the sufficient statistics themselves) roll up by summing."""
+    return col.startswith("total_") or col.endswith(("_count",) + STAT_SUFFIXES)
+
+
+# --- 2. Quantile Sketches ---
+# Log-bucketed histograms (DDSketch-style): a value goes to bucket sign(x) * (ceil(log_GAMMA(|x| /
+# SKETCH_MIN_VALUE)) + 1), 0 below SKETCH_MIN_VALUE, ±INF_BUCKET for ±inf. Each bucket's midpoint is within SKETCH_ALPHA
+# (relative) of every value in it, and two sketches merge by adding their bucket counts, so any
+# union of groups gets quantiles with the same bound. Stored as a sorted List(Struct{bucket, count}).
+def sketch_bucket(expr):
+    mag = expr.abs()
+    k = (((mag / SKETCH_MIN_VALUE).log() / math.log(GAMMA)).ceil() + 1).clip(upper_bound=INF_BUCKET - 1)
+    k = pl.when(mag.is_infinite()).then(INF_BUCKET).otherwise(k)
+    # NaN doesn't fit any bucket (strict=False turns it into a null, dropped below)
+    return pl.when(mag < SKETCH_MIN_VALUE).then(0.0).otherwise(expr.sign() * k).cast(pl.Int16, strict=False)
+
+
+def bucket_value(expr):
+    """Representative value of a bucket (inverse of sketch_bucket, within SKETCH_ALPHA)."""
+    mag = SKETCH_MIN_VALUE * 2 * pl.lit(GAMMA).pow(expr.abs() - 1) / (GAMMA + 1)
+    return (
+        pl.when(expr == 0)
+        .then(0.0)
+        .when(expr.abs() == INF_BUCKET)
+        .then(expr.sign() * float("inf"))
+        .otherwise(expr.sign() * mag)
+    )
+
+
+def nearest_rank(q, n):
+    """0-based rank of the `q` quantile among `n` values, as pl.quantile(q, "nearest") picks it."""
+    return (q * (n - 1) + 0.5).floor()
+
+
+def sketch(col, alias):
+    """Aggregation: quantile sketch of `col` within each group."""
+    return (
+        sketch_bucket(pl.col(col))
+        .alias("bucket")
+        .drop_nulls()
+        .value_counts(name="count")
+        .sort()
+        .alias(alias)
+    )
+
+
+def merge_sketches(lf, keys, col):
+    """One merged sketch per `keys` (all rows when empty): bucket counts are added up."""
+    keys = list(keys) or ["_all"]
+    if keys == ["_all"]:
+        lf = lf.with_columns(pl.lit(0).alias("_all"))
+    merged = (
+        lf.select(keys + [col])
+        .explode(col, empty_as_null=False)
+        .unnest(col)
+        .drop_nulls("bucket")
+        .group_by(keys + ["bucket"])
+        .agg(pl.col("count").cast(pl.Int64).sum())
+        .group_by(keys)
+        .agg(pl.struct("bucket", "count").sort_by("bucket").alias(col))
+    )
+    # Groups whose sketches were all empty keep an empty sketch
+    out = lf.select(keys).unique().join(merged, on=keys, how="left", nulls_equal=True)
+    out = out.with_columns(pl.col(col).fill_null(pl.lit([], dtype=merged.collect_schema()[col])))
+    return out.drop("_all") if keys == ["_all"] else out
+
+
+def sketch_quantile(col, q):
+    """
+    Expression: the `q` quantile of each row's sketch in `col` (nearest rank, like
+    pl.quantile). Within SKETCH_ALPHA of the true quantile, relative; null for an empty sketch.
+    """
+    count = pl.element().struct.field("count")
+    rank = (count.cum_sum() > nearest_rank(q, count.sum())).arg_max()
+    # An empty sketch has no bucket at any rank: null instead of an out-of-bounds error
+    bucket = pl.col(col).list.eval(pl.element().struct.field("bucket").get(rank, null_on_oob=True)).list.first()
+    return bucket_value(bucket).alias(f"{col.removesuffix('_sketch')}_p{round(q * 100, 1):g}")
+
+
+def sketch_quantiles(mart, sketch_col, quantiles=(0.5, 0.9), by=(), grain=None):
+    """
+    Quantiles of a sketch column over any rollup of the mart, e.g. weekly P90 fares by weather:
+
+        sketch_quantiles(economic, "fare_sketch", [0.9], by=["weather_state"], grain="week")
+
+    Every value is within SKETCH_ALPHA (relative) of the exact quantile of the merged groups.
+    """
+    lazy = isinstance(mart, pl.LazyFrame)
+    rolled = rollup(mart if lazy else mart.lazy(), by, grain)
+    keys = [c for c in rolled.collect_schema().names() if c in {*by, "pickup_date", *TIME_KEYS}]
+
+    n = pl.col(sketch_col).list.eval(pl.element().struct.field("count")).list.sum()
+    out = rolled.select(keys + [n.alias("sketch_n")] + [sketch_quantile(sketch_col, q) for q in quantiles])
+    return out if lazy else out.collect()
+
+
+# --- 3. Rollups ---
+def time_keys(schema, grain):
+    """Key expressions for `grain` on a mart with `schema` (hierarchical keys or pickup_date)."""
+    if grain not in GRAINS and grain not in DATE_TRUNCATE:
+        raise ValueError(f"Unknown grain '{grain}' (expected one of {GRAINS + ['week']})")
+
+    if "pickup_date" in schema:
+        if grain not in DATE_TRUNCATE:
+            raise ValueError(f"Date-keyed mart can't be rolled up to '{grain}'")
+        every = DATE_TRUNCATE[grain]
+        return [pl.col("pickup_date").dt.truncate(every) if every else pl.col("pickup_date")]
+
+    if grain not in GRAINS:
+        raise ValueError(f"Mart has no pickup_date to roll up to '{grain}'")
+    keys = TIME_KEYS[: GRAINS.index(grain) + 1]
+    missing = [k for k in keys if k not in schema]
+    if missing:
+        raise ValueError(f"Mart is coarser than '{grain}' (no {missing})")
+    return [pl.col(k) for k in keys]
+
+
+def rollup(mart, by=(), grain=None):
+    """
+    Re-aggregates a mart to the keys in `by` and, optionally, a coarser time `grain`
+    ("year", "month", "week", "day", "hour"). Counts and totals are summed; finished means and
+    stds are recomputed exactly from the stored sums, counts and sums of squares; quantile
+    sketches are merged. Columns that can't be rolled up (exact medians, quantiles, modes) are
+    dropped.
+
+        rollup(timeline, by=["borough_flow_type"], grain="day")
+        rollup(network, by=["PULocationID", "DOLocationID"], grain="year")
+
+    Accepts a DataFrame or LazyFrame and returns the same kind.
+    """
+    lazy = isinstance(mart, pl.LazyFrame)
+    lf = mart if lazy else mart.lazy()
+    dtypes = lf.collect_schema()
+    schema = dtypes.names()
+
+    # With a grain the time keys come from it; finer ones in `by` would undo the rollup
+    by = [k for k in by if grain is None or (k not in TIME_KEYS and k != "pickup_date")]
+    missing = [k for k in by if k not in schema]
+    if missing:
+        raise ValueError(f"Keys not in the mart: {missing}")
+    keys = (time_keys(schema, grain) if grain else []) + [pl.col(k) for k in by]
+    names = [k.meta.output_name() for k in keys]
+    key_names = set(names)
+    lf = lf.with_columns(keys)
+
+    sums = [c for c in schema if c not in key_names and is_additive(c)]
+    finished = [c for c in schema if c in FINISHED_STATS]
+
+    derived = []
+    for c in finished:
+        col, stat = FINISHED_STATS[c]
+        s, n, sq = pl.col(f"{col}_sum"), pl.col(f"{col}_n"), pl.col(f"{col}_sumsq")
+        if f"{col}_sum" not in sums or f"{col}_n" not in sums:
+            raise ValueError(f"'{c}' has no stored sums; rebuild the marts with aggregate_datasets.py")
+        if stat == "mean":
+            derived.append(pl.when(n > 0).then(s / n).alias(c))
+        else:
+            if f"{col}_sumsq" not in sums:
+                raise ValueError(f"'{c}' has no stored sum of squares; rebuild the marts")
+            # Sample std (ddof=1), as pl.std() computed it on the trips
+            var = (sq - s**2 / n) / (n - 1)
+            derived.append(pl.when(n > 1).then(var.clip(lower_bound=0).sqrt()).alias(c))
+
+    totals = [c for c in sums if not c.endswith(STAT_SUFFIXES)]
+    stats = [c for c in sums if c.endswith(STAT_SUFFIXES)]
+    # UInt32 trip counts would overflow once years of months are summed
+    aggs = [(pl.col(c).cast(pl.Int64) if dtypes[c].is_integer() else pl.col(c)).sum() for c in sums]
+
+    # No keys left: one grand-total row (the literal keeps it when there is nothing to sum)
+    out = lf.group_by(names).agg(aggs) if names else lf.select(pl.lit(0).alias("_all"), *aggs)
+    sketches = [c for c in schema if c in SKETCHES]
+    for c in sketches:
+        merged = merge_sketches(lf, names, c)
+        out = out.join(merged, on=names, nulls_equal=True) if names else out.join(merged, how="cross")
+    out = out.with_columns(derived).select(names + totals + finished + stats + sketches)
+    out = out.sort(names) if names else out
+    return out if lazy else out.collect()
@@ -1,70 +1,48 @@
 import os
-import shutil
-import glob
+
+from catalog import view, materialize_view, dataset_root
 
 # --- Configuration ---
-# Where the Hive-style folders are currently:
-SOURCE_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\TLC_NYC_Processed"
+# Dataset to expose and the view to build (see catalog.DATASETS)
+VIEW_DATASET = "processed"
+VIEW_KIND = "flat"  # "flat": tlc_uber_YYYY-MM.parquet, "hive": year=YYYY/month=MM/...
 
-# Where you want the flat files:
+# Where you want the view:
 DEST_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\HVFHV subsets 2019-2025 - Processed"
 
 
 def flatten_dataset():
-    print(f"📦 Starting Dataset Flattening...")
-    print(f"   Source: {SOURCE_DIR}")
+    """
+    Exposes the Hive-partitioned output as flat tlc_uber_YYYY-MM.parquet files.
+
+    Files are linked, not moved: symlinks, or hard links where symlinks aren't allowed. The
+    partitioned tree (and its manifest) stays intact, so incremental runs keep working and
+    scans can still prune by year/month through the catalog. Re-run it after each processing run
+    to drop links to months that are gone (and re-link rebuilt months under hard links). Regular
+    files the view didn't make, e.g. left by the old move-based script, are never deleted.
+    """
+    print(f"📦 Building {VIEW_KIND} view of '{VIEW_DATASET}'...")
+    print(f"   Source: {dataset_root(VIEW_DATASET)}")
     print(f"   Dest:   {DEST_DIR}")
 
-    if not os.path.exists(SOURCE_DIR):
-        print("❌ Source directory does not exist.")
+    entries = view(VIEW_DATASET, VIEW_KIND)
+    if not entries:
+        print("❌ No partition files found. Check the catalog root.")
         return
 
+    print(f"🔍 Found {len(entries)} files. Linking...")
     os.makedirs(DEST_DIR, exist_ok=True)
-
-    # Find all deep 'data.parquet' files
-    # Pattern matches: SOURCE_DIR / year=XXXX / month=XX / data.parquet
-    search_pattern = os.path.join(SOURCE_DIR, "**", "data.parquet")
-    found_files = glob.glob(search_pattern, recursive=True)
-
-    if not found_files:
-        print("❌ No 'data.parquet' files found. Check the path.")
-        return
-
-    print(f"🔍 Found {len(found_files)} files. Moving...")
-
-    moved_count = 0
-    for file_path in found_files:
-        try:
-            # Extract Year and Month from the directory path
-            # Example path: .../year=2019/month=02/data.parquet
-            path_parts = file_path.split(os.sep)
-
-            # Robustly find the parts starting with 'year=' and 'month='
-            year_part = next((p for p in path_parts if p.startswith("year=")), None)
-            month_part = next((p for p in path_parts if p.startswith("month=")), None)
-
-            if year_part and month_part:
-                yyyy = year_part.split("=")[1]
-                mm = month_part.split("=")[1]
-
-                # Construct descriptive new name
-                new_name = f"tlc_uber_{yyyy}-{mm}.parquet"
-                new_path = os.path.join(DEST_DIR, new_name)
-
-                # Move the file
-                shutil.move(file_path, new_path)
-                print(f"   [Move] {yyyy}/{mm} -> {new_name}")
-                moved_count += 1
-            else:
-                print(f"   ⚠️ Skipping non-standard path: {file_path}")
-
-        except Exception as e:
-            print(f"   ❌ Error moving {file_path}: {e}")
+    created, pruned, kept = materialize_view(VIEW_DATASET, VIEW_KIND, DEST_DIR)
 
     print("-" * 40)
     print(f"✅ Operation Complete.")
-    print(f"🎉 Moved {moved_count} files to {DEST_DIR}")
-    print("Note: The empty 'year=...' folders in the source directory can now be safely deleted.")
+    print(f"🔗 {created} new link(s), {len(entries) - created - len(kept)} already in place, 0 bytes copied -> {DEST_DIR}")
+    if pruned:
+        print(f"🧹 Removed {pruned} stale link(s) whose partition no longer exists")
+    if kept:
+        print(f"⚠️ Left {len(kept)} file(s) in place that may be the only copy of their data (move or delete them by hand):")
+        for rel in kept:
+            print(f"   - {rel}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+import os
+import json
+
+import numpy as np
+import polars as pl
+
+from catalog import dataset_root
+from manifest import temp_path
+from marts import rollup
+
+# ==============================================================================
+# 🧊 DENSE OD CUBES
+# The network mart pivoted once into month x origin x destination arrays, one .npy per metric,
+# so notebooks memory-map them and slice a month or an OD block without a pivot or a copy:
+#
+#     cube, index = open_cube("trip_count")
+#     sep_2021 = cube[index["months"].index("2021-09")]          # 263 x 263 view
+#     from_jfk = cube[:, zone_index(132), :]                    # every month, one origin
+# ==============================================================================
+CUBE_DIR = "od_cube"
+INDEX_FILE = "index.json"
+
+# TLC taxi zones 1..263 (264 / 265 are Unknown / N/A and have no place on a map)
+ZONE_COUNT = 263
+
+# Network mart metrics written as cubes (those the mart has: raw marts only carry some)
+CUBE_METRICS = ["trip_count", "avg_duration_min", "avg_duration_sec", "avg_cost", "avg_wait_time"]
+
+
+def zone_index(location_id):
+    """Array position of a LocationID (or an array of them)."""
+    return np.asarray(location_id) - 1
+
+
+def write_cubes(network_file, output_dir):
+    """
+    Builds one month x ZONE_COUNT x ZONE_COUNT array per metric from the network mart, plus the
+    index (months, zone ids, files). Counts are UInt32 with 0 for empty cells; means are Float32
+    with NaN where no trip (or no value) exists. Returns the index.
+    """
+    lf = pl.scan_parquet(network_file)
+    schema = lf.collect_schema().names()
+    metrics = [m for m in CUBE_METRICS if m in schema]
+
+    # One cell per month and OD pair (the mart also keys by borough), means exact from the sums
+    keys = ["pickup_year", "pickup_month", "PULocationID", "DOLocationID"]
+    cells = rollup(lf, by=keys)
+    in_range = pl.col("PULocationID").is_between(1, ZONE_COUNT) & pl.col("DOLocationID").is_between(1, ZONE_COUNT)
+    df = cells.filter(in_range).select(keys + metrics).collect(engine="streaming")
+    dropped = cells.filter(~in_range).select(pl.col("trip_count").sum()).collect().item() or 0
+
+    months = df.select("pickup_year", "pickup_month").unique().sort(["pickup_year", "pickup_month"])
+    labels = [f"{y}-{m:02d}" for y, m in months.iter_rows()]
+    period = pl.col("pickup_year").cast(pl.Int32) * 100 + pl.col("pickup_month")
+    positions = {y * 100 + m: k for k, (y, m) in enumerate(months.iter_rows())}
+    month_idx = df.select(period.replace_strict(positions, return_dtype=pl.Int64).alias("month_idx"))["month_idx"].to_numpy()
+    pu = zone_index(df["PULocationID"].to_numpy())
+    do = zone_index(df["DOLocationID"].to_numpy())
+
+    cube_dir = os.path.join(output_dir, CUBE_DIR)
+    os.makedirs(cube_dir, exist_ok=True)
+    shape = (len(labels), ZONE_COUNT, ZONE_COUNT)
+    files = {}
+    for metric in metrics:
+        is_count = metric == "trip_count"
+        path = os.path.join(cube_dir, f"{metric}.npy")
+        # Written through a memmap (never a second in-RAM copy), renamed into place when complete
+        cube = np.lib.format.open_memmap(temp_path(path), mode="w+", dtype=np.uint32 if is_count else np.float32, shape=shape)
+        cube[:] = 0 if is_count else np.nan
+        cube[month_idx, pu, do] = df[metric].fill_null(0 if is_count else float("nan")).to_numpy()
+        cube.flush()
+        del cube
+        os.replace(temp_path(path), path)
+        files[metric] = os.path.basename(path)
+
+    index = {
+        "months": labels,
+        "zone_ids": list(range(1, ZONE_COUNT + 1)),
+        "shape": list(shape),
+        "files": files,
+        "source": os.path.basename(network_file),
+        "trips_outside_zones": int(dropped),
+    }
+    index_path = os.path.join(cube_dir, INDEX_FILE)
+    with open(temp_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(temp_path(index_path), index_path)
+    return index
+
+
+def load_index(output_dir):
+    with open(os.path.join(output_dir, CUBE_DIR, INDEX_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def open_cube(metric, output_dir=None, mode="Processed"):
+    """(read-only memory-mapped cube, index) for a metric; output_dir defaults to the catalog's."""
+    if output_dir is None:
+        output_dir = os.path.join(dataset_root("aggregates"), f"Aggregates_{mode}")
+    index = load_index(output_dir)
+    if metric not in index["files"]:
+        raise KeyError(f"No '{metric}' cube (available: {sorted(index['files'])})")
+    return np.load(os.path.join(output_dir, CUBE_DIR, index["files"][metric]), mmap_mode="r"), index
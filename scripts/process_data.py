@@ -3,31 +3,115 @@ import numpy as np
 import os
 import glob
 import time
-import gc
+import ast
+import inspect
+from datetime import datetime
+
+import tlc_schema
+from scheduler import run_tasks, estimate_task_bytes, parquet_rows, budget_bytes, current_tuning, report_failures
+from profiling import (
+    no_checkpoint,
+    stage_checkpoint,
+    collect_stage,
+    stage,
+    save_plan,
+    task_name,
+    new_run_id,
+    plan_dir_for,
+    write_run_report,
+    print_stage_summary,
+)
+from catalog import partitions as dataset_partitions, dataset_root
+from tlc_schema import conform, RAW_SCHEMA, RAW_DEFAULTS, PROCESSED_SCHEMA, BOROUGH
+from manifest import (
+    file_fingerprint,
+    text_fingerprint,
+    load_manifest,
+    save_manifest,
+    stale_reason,
+    make_entry,
+    temp_path,
+    commit_files,
+    discard_temp_files,
+    TMP_SUFFIX,
+)
 
 
 # --- Configuration ---
-RAW_DATA_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\HVFHV subsets 2019-2025"
-OUTPUT_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\TLC_NYC_Processed"
+# Reads the "raw" dataset and writes the "processed" one (locations: catalog.DATASETS)
 WEATHER_FILE = r"./nyc_weather_hourly_2019_2025.csv"
 ZONE_FILE = r"./taxi_zones_detailed.csv"
 UBER_LICENSE = "HV0003"
 
-# Performance Tuning
-os.environ["POLARS_MAX_THREADS"] = "15"
-pl.Config.set_streaming_chunk_size(300000)
+# Incremental Runs: <processed root>/_manifest.json records the inputs each partition was built from.
+# The pipeline code is fingerprinted automatically; bump the version for anything it can't see.
+# 2: temp imputed per hour from the weather table (changes temp / temp_bin of hours without a reading)
+MANIFEST_NAME = "_manifest.json"
+PIPELINE_VERSION = 2
+
+# Memory Budget (GB) for the whole run; None = scheduler.DEFAULT_RAM_FRACTION of the RAM free at start.
+# Workers, threads and streaming chunk sizes are derived from it (see scheduler.tune_job). A month
+# estimated over the budget is split into shards that fit, and with sorting on (OUTPUT_LAYOUT) a shard
+# still over it is written unsorted so its sink stays fully streaming.
+MEMORY_BUDGET_GB = None
+# Shards of an over-budget month target this share of the budget (the estimate is rough)
+LOW_MEMORY_SHARD_HEADROOM = 0.8
+
+# Profiling (opt-in): per-stage rows, time & peak memory, query plans and a run report under
+# profiling.PROFILE_DIR. Stages run one at a time, so profile a few months, not the full history.
+PROFILE = False
+
+# Output Layout of the processed files. The default keeps the raw order and a fully streaming sink
+# (a sharded month then reads back exactly like the single-shot output). Sorting is opt-in, e.g.
+# sort_by=["pickup_datetime"]: row-group min/max statistics and page indexes then skip most of a
+# month on date filters (see benchmark_layout.py), but the month (or shard) is materialised before
+# writing, and a sharded month is only sorted within each part-*.parquet file.
+OUTPUT_LAYOUT = {
+    "sort_by": [],
+    "row_group_size": 250_000,
+    "data_page_size": 1024**2,
+    "compression": "zstd",
+    "compression_level": 3,
+    "statistics": "full",  # min/max, null & distinct counts; the writer adds page indexes
+}
+
+# Filter Accounting: every run records, per month, how many rows each Great Filter clause rejected
+# (manifest entries and <processed root>/_rejections.csv). QUARANTINE also writes the rejected rows,
+# tagged with their rejection_reasons, to the catalog's "quarantine" dataset in the same pass
+# (switching it on rebuilds the months that have no quarantine yet).
+REJECTIONS_FILE = "_rejections.csv"
+QUARANTINE = False
+
+# Intra-month Sharding: months above the threshold are split on Parquet row-group boundaries
+# and the shards run as separate scheduler jobs (None disables sharding)
+SHARD_ROW_THRESHOLD = 15_000_000
+SHARD_TARGET_ROWS = 5_000_000
+
+# Origin-Destination Dimension: trips attach it through one integer key
+# od_key = PULocationID * OD_KEY_BASE + DOLocationID (raw IDs run 1-265)
+OD_KEY_BASE = 1000
+AIRPORT_ZONE_IDS = [1, 132, 138]
+
+# Hourly Context Dimension: the weather of every hour the weather table spans, keyed by hours since
+# epoch. Trips outside the span (stray pickups from other years) join the row keyed MISSING_CONTEXT_HOUR:
+# the categories of an hour without a reading, at the mean temp
+MISSING_CONTEXT_HOUR = -1
+
+# Missing temperatures: gaps up to this many hours are interpolated between the neighbouring
+# readings, longer ones take the month x hour-of-day climatology of the weather table
+TEMP_INTERP_MAX_GAP_HOURS = 6
 
 
 # --- 1. Static Asset Loader ---
 def load_static_assets():
-    print("📦 Loading Static Assets (Zones & Weather)...")
+    print("📦 Loading Static Assets (Zones, Weather & Hourly Context)...")
 
     # Zones
     zones = pl.read_csv(ZONE_FILE).with_columns([
         pl.col("LocationID").cast(pl.Int32),
         pl.col("centroid_lat").cast(pl.Float32),
         pl.col("centroid_lon").cast(pl.Float32),
-        pl.col("Borough").cast(pl.Categorical),
+        pl.col("Borough").cast(BOROUGH),
         pl.col("service_zone").cast(pl.Categorical),
     ])
 
@@ -47,103 +131,51 @@ def load_static_assets():
     # Truncate weather to hour for joining
     weather = weather.with_columns(pl.col("datetime").dt.truncate("1h").alias("weather_match_time"))
 
-    return zones, weather
+    # Rebuilt every run (well under a second), so it always matches the zone file and the code
+    od_dim = build_od_dimension(zones)
+    print(f"   🧭 Built OD dimension ({len(od_dim):,} pairs)")
+    context = build_hourly_context(weather)
 
+    return od_dim, context
 
-# --- 2. The Feature Engineering Engine ---
-def build_feature_pipeline(lf, zones, weather):
-    # A. Pre-Processing & Casting
-    schema_cols = lf.collect_schema().names()
 
-    lf = lf.filter(pl.col("hvfhs_license_num") == UBER_LICENSE)
+def od_key_expr(pu="PULocationID", do="DOLocationID"):
+    return (pl.col(pu).cast(pl.Int32) * OD_KEY_BASE + pl.col(do).cast(pl.Int32)).alias("od_key")
 
-    # Define Flags to convert to 1/0 (UInt8)
-    flag_cols = ["wav_request_flag", "wav_match_flag", "shared_request_flag", "shared_match_flag", "access_a_ride_flag"]
-    flag_exprs = []
-    for f in flag_cols:
-        if f in schema_cols:
-            # 'Y' -> 1, else 0. Cast to UInt8.
-            flag_exprs.append(pl.when(pl.col(f).cast(pl.String) == "Y").then(1).otherwise(0).cast(pl.UInt8).alias(f))
-        else:
-            flag_exprs.append(pl.lit(0).cast(pl.UInt8).alias(f))
 
-    lf = lf.with_columns(
-        [
-            # Cast IDs
-            pl.col("PULocationID").cast(pl.Int32),
-            pl.col("DOLocationID").cast(pl.Int32),
-            # Cast Datetimes (Required for Service Metrics)
-            pl.col("pickup_datetime").cast(pl.Datetime),
-            pl.col("dropoff_datetime").cast(pl.Datetime),
-            pl.col("request_datetime").cast(pl.Datetime),
-            pl.col("on_scene_datetime").cast(pl.Datetime),
-            # Cast Floats
-            pl.col("trip_miles").cast(pl.Float32),
-            pl.col("base_passenger_fare").cast(pl.Float32),
-            pl.col("driver_pay").cast(pl.Float32),
-            pl.col("tips").cast(pl.Float32),
-            pl.col("tolls").cast(pl.Float32),
-            pl.col("congestion_surcharge").fill_null(0).cast(pl.Float32),
-            # Optional Financial Cols
-            pl.col("airport_fee").fill_null(0).cast(pl.Float32)
-            if "airport_fee" in schema_cols
-            else pl.lit(0.0).cast(pl.Float32).alias("airport_fee"),
-            pl.col("sales_tax").fill_null(0).cast(pl.Float32)
-            if "sales_tax" in schema_cols
-            else pl.lit(0.0).cast(pl.Float32).alias("sales_tax"),
-            pl.col("bcf").fill_null(0).cast(pl.Float32)
-            if "bcf" in schema_cols
-            else pl.lit(0.0).cast(pl.Float32).alias("bcf"),
-            pl.col("cbd_congestion_fee").fill_null(0).cast(pl.Float32)
-            if "cbd_congestion_fee" in schema_cols
-            else pl.lit(0.0).cast(pl.Float32).alias("cbd_congestion_fee"),
-        ]
-        + flag_exprs
+def build_od_dimension(zones):
+    """
+    One row per (PULocationID, DOLocationID) pair holding every feature that depends only on
+    the pair: zone labels, centroid distance & bearing, and the borough/zone flow categories.
+
+    The ID domain is every raw ID (1-265), including IDs missing from the zone file, and
+    duplicated LocationIDs keep their duplicates, so the single `od_key` join fans trips out
+    exactly like the former pickup and dropoff zone joins did.
+    """
+    ids = pl.DataFrame({"LocationID": pl.int_range(1, 266, eager=True).cast(pl.Int32)})
+    side = ids.join(
+        zones.select(["LocationID", "Borough", "Zone", "centroid_lat", "centroid_lon"]),
+        on="LocationID",
+        how="left",
+        maintain_order="left",
     )
 
-    # B. Geospatial Joins
-    lf = lf.join(zones.lazy(), left_on="PULocationID", right_on="LocationID", how="left").rename({
+    pu = side.rename({
+        "LocationID": "PULocationID",
         "Borough": "pickup_borough",
         "Zone": "pickup_zone",
         "centroid_lat": "pu_lat",
         "centroid_lon": "pu_lon",
     })
-    lf = lf.join(zones.lazy(), left_on="DOLocationID", right_on="LocationID", how="left").rename({
+    do = side.rename({
+        "LocationID": "DOLocationID",
         "Borough": "dropoff_borough",
         "Zone": "dropoff_zone",
         "centroid_lat": "do_lat",
         "centroid_lon": "do_lon",
     })
+    od = pu.join(do, how="cross")
 
-    # C. Core Physics & Time
-    # 1. Calculate raw metrics
-    lf = lf.with_columns([
-        (pl.col("trip_miles") * 1.60934).alias("trip_km"),
-        ((pl.col("dropoff_datetime") - pl.col("pickup_datetime")).dt.total_seconds()).alias("duration_seconds"),
-        # Temporal Features
-        pl.col("pickup_datetime").dt.hour().alias("pickup_hour"),
-        pl.col("pickup_datetime").dt.day().alias("pickup_day"),
-        pl.col("pickup_datetime").dt.month().alias("pickup_month"),
-        pl.col("pickup_datetime").dt.year().alias("pickup_year"),
-        pl.col("pickup_datetime").dt.weekday().alias("pickup_dow"),
-        pl.col("pickup_datetime").dt.date().alias("pickup_date"),
-        # Weather Match Key
-        pl.col("pickup_datetime").dt.truncate("1h").alias("weather_match_time"),
-    ])
-
-    # 2. Service Metrics (Wait Times) with Paradox Cleaning
-    # If the time is negative (Time Travel), we set it to NULL so it doesn't skew averages.
-    wait_calc = (pl.col("pickup_datetime") - pl.col("request_datetime")).dt.total_seconds() / 60
-    response_calc = (pl.col("on_scene_datetime") - pl.col("request_datetime")).dt.total_seconds() / 60
-    boarding_calc = (pl.col("pickup_datetime") - pl.col("on_scene_datetime")).dt.total_seconds() / 60
-
-    lf = lf.with_columns([
-        pl.when(wait_calc < 0).then(None).otherwise(wait_calc).alias("total_wait_time_min"),
-        pl.when(response_calc < 0).then(None).otherwise(response_calc).alias("driver_response_time_min"),
-        pl.when(boarding_calc < 0).then(None).otherwise(boarding_calc).alias("boarding_time_min"),
-    ])
-
-    # D. Derived Physics (Speed, Dist, Bearing)
     # Helper Expressions for Radians
     pu_lat_rad = pl.col("pu_lat").radians()
     pu_lon_rad = pl.col("pu_lon").radians()
@@ -152,8 +184,8 @@ def build_feature_pipeline(lf, zones, weather):
     dlon_rad = do_lon_rad - pu_lon_rad
     dlat_rad = do_lat_rad - pu_lat_rad
 
-    lf = lf.with_columns([
-        (pl.col("duration_seconds") / 60).alias("duration_min"),
+    od = od.with_columns([
+        od_key_expr(),
         # Native Haversine Formula
         (
             6371
@@ -170,66 +202,133 @@ def build_feature_pipeline(lf, zones, weather):
             ).degrees()
             % 360
         ).alias("bearing_degrees"),
+        # Borough Flow
+        pl.concat_str([
+            pl.col("pickup_borough").cast(pl.String),
+            pl.lit(" -> "),
+            pl.col("dropoff_borough").cast(pl.String),
+        ]).alias("borough_flow"),
+        # Borough Transition Type
+        pl.when((pl.col("pickup_borough") == "Manhattan") & (pl.col("dropoff_borough") == "Manhattan"))
+        .then(pl.lit("manhattan_internal"))
+        .when((pl.col("pickup_borough") == "Manhattan") | (pl.col("dropoff_borough") == "Manhattan"))
+        .then(pl.lit("manhattan_outer_commute"))
+        .when(pl.col("pickup_borough") != pl.col("dropoff_borough"))
+        .then(pl.lit("outer_inter"))
+        .otherwise(pl.lit("outer_intra"))
+        .alias("borough_flow_type"),
+        # Trip Zone Type
+        pl.when(pl.col("PULocationID") == pl.col("DOLocationID"))
+        .then(pl.lit("intra_zone"))
+        .when(pl.col("pickup_borough") == pl.col("dropoff_borough"))
+        .then(pl.lit("intra_borough"))
+        .otherwise(pl.lit("inter_borough"))
+        .alias("trip_type_zone"),
+        # Airport Test (consumed by trip_archetype, dropped afterwards)
+        (pl.col("PULocationID").is_in(AIRPORT_ZONE_IDS) | pl.col("DOLocationID").is_in(AIRPORT_ZONE_IDS)).alias(
+            "is_airport_od"
+        ),
     ])
 
-    # E. Advanced Physics Derivatives
-    lf = lf.with_columns([
-        (pl.col("trip_km") / (pl.col("duration_seconds") / 3600)).alias("speed_kmh"),
-        (pl.col("straight_line_dist_km") / (pl.col("duration_min") / 60)).alias("displacement_speed_kmh"),
-        (pl.col("trip_km") / (pl.col("straight_line_dist_km") + 0.01)).alias("tortuosity_index"),
-    ])
+    od = od.drop(["PULocationID", "DOLocationID", "pu_lat", "pu_lon", "do_lat", "do_lon"])
+    return conform(od, PROCESSED_SCHEMA)
 
-    # F. Economic Engine (Full Suite)
-    # 1. Calculate Total Cost first (Base dependency)
-    lf = lf.with_columns([
-        (
-            pl.col("base_passenger_fare")
-            + pl.col("tolls")
-            + pl.col("tips")
-            + pl.col("congestion_surcharge")
-            + pl.col("airport_fee")
-            + pl.col("sales_tax")
-            + pl.col("bcf")
-            + pl.col("cbd_congestion_fee")
-        ).alias("total_rider_cost"),
-    ])
 
-    # 2. Calculate Ratios & Derivatives
-    lf = lf.with_columns([
-        (pl.col("total_rider_cost") / (pl.col("trip_km") + 0.01)).alias("cost_per_km"),
-        (pl.col("driver_pay") / (pl.col("base_passenger_fare") + 0.01)).alias("driver_revenue_share"),
-        (1 - (pl.col("driver_pay") / (pl.col("base_passenger_fare") + 0.01))).alias("uber_take_rate_proxy"),
-        (pl.col("driver_pay") / ((pl.col("duration_min") / 60) + 0.01)).alias("pay_per_hour"),
-        (pl.col("tips") / (pl.col("base_passenger_fare") + 0.01)).alias("tipping_pct"),
-        ((pl.col("tips") / (pl.col("base_passenger_fare") + 0.01)) > 0.25).cast(pl.UInt8).alias("is_generous_tip"),
+def context_hour_expr(col="pickup_datetime"):
+    return (pl.col(col).dt.epoch("s") // 3600).alias("context_hour")
+
+
+def temp_bin_expr(temp):
+    return (
+        pl.when(temp < 0)
+        .then(pl.lit("freezing"))
+        .when(temp.is_between(0, 10))
+        .then(pl.lit("cold"))
+        .when(temp.is_between(10, 20))
+        .then(pl.lit("mild"))
+        .when(temp.is_between(20, 28))
+        .then(pl.lit("warm"))
+        .otherwise(pl.lit("hot"))
+    )
+
+
+def hourly_temps(weather):
+    """One mean reading per weather hour (the table may repeat an hour), hours without one dropped."""
+    return weather.group_by("weather_match_time").agg(pl.col("temp").mean()).drop_nulls("temp")
+
+
+def impute_hourly_temp(ctx, weather):
+    """
+    Fills `temp` for hours without a reading, using only the weather table:
+    1. Linear interpolation between the surrounding readings when the gap is short
+       (<= TEMP_INTERP_MAX_GAP_HOURS).
+    2. Otherwise the mean reading for that calendar month and hour of day across all years.
+    3. Otherwise (no reading at all for that slot) the mean over every hour in the table.
+
+    `ctx` must be sorted by `weather_match_time`.
+    """
+    hourly = hourly_temps(weather)
+    climatology = hourly.group_by([
+        pl.col("weather_match_time").dt.month().alias("clim_month"),
+        pl.col("weather_match_time").dt.hour().alias("clim_hour"),
+    ]).agg(pl.col("temp").mean().alias("temp_climatology"))
+    overall_mean = hourly["temp"].mean()
+
+    # Gap length: distance between the last reading before and the first reading after the hour
+    known_at = pl.when(pl.col("temp").is_not_null()).then(pl.col("weather_match_time"))
+    gap_hours = (known_at.backward_fill() - known_at.forward_fill()).dt.total_hours()
+
+    ctx = ctx.with_columns([
+        pl.col("weather_match_time").dt.month().alias("clim_month"),
+        pl.col("weather_match_time").dt.hour().alias("clim_hour"),
+        pl.col("temp").interpolate_by("weather_match_time").alias("temp_interpolated"),
+        gap_hours.alias("temp_gap_hours"),
     ])
+    ctx = ctx.join(climatology, on=["clim_month", "clim_hour"], how="left", maintain_order="left")
 
-    # 3. Calculate Dependent Flags (MUST be in a new block so driver_revenue_share exists)
-    lf = lf.with_columns([(pl.col("driver_revenue_share") > 1.0).cast(pl.UInt8).alias("is_subsidized")])
+    return ctx.with_columns(
+        pl.coalesce([
+            pl.col("temp"),
+            pl.when(pl.col("temp_gap_hours") <= TEMP_INTERP_MAX_GAP_HOURS).then(pl.col("temp_interpolated")),
+            pl.col("temp_climatology"),
+            pl.lit(overall_mean),
+        ])
+        .cast(pl.Float32)
+        .alias("temp")
+    ).drop(["clim_month", "clim_hour", "temp_interpolated", "temp_gap_hours", "temp_climatology"])
 
-    # G. Weather Join
-    lf = lf.join(weather.lazy(), on="weather_match_time", how="left")
-    lf = lf.with_columns([
+
+def build_hourly_context(weather):
+    """
+    One row per hour of the weather table's span holding every feature that depends only on the
+    hour's weather: raw temp/conditions and the weather categories & flags. Trips attach it with
+    one join on `context_hour` (calendar features are per trip, see calendar_exprs).
+
+    Hours are left-joined to the weather table, so hours without a reading categorise exactly
+    like a trip with a missed weather join did (only `temp` is imputed, see impute_hourly_temp),
+    and duplicated weather hours still fan out. One more row, keyed MISSING_CONTEXT_HOUR, holds
+    those categories for trips outside the span, with the mean temp over every hour (as trips
+    with a missed weather join got), so its temp_bin is that of an average hour.
+    """
+    span = weather["weather_match_time"]
+    hours = pl.datetime_range(span.min(), span.max(), "1h", eager=True)
+    ctx = hours.alias("weather_match_time").to_frame()
+    ctx = ctx.join(weather, on="weather_match_time", how="left", maintain_order="left")
+    ctx = impute_hourly_temp(ctx, weather)
+    outside = weather.clear(1).with_columns(pl.lit(hourly_temps(weather)["temp"].mean(), pl.Float32).alias("temp"))
+    ctx = pl.concat([ctx, outside], how="diagonal_relaxed")
+
+    ctx = ctx.with_columns([
+        context_hour_expr("weather_match_time").fill_null(MISSING_CONTEXT_HOUR),
         pl.col("precip").fill_null(0),
         pl.col("snow").fill_null(0),
         pl.col("snowdepth").fill_null(0),
-        pl.col("temp").fill_null(pl.col("temp").mean()),
-    ])
-
-    # H. Cyclical Time (For ML)
-    lf = lf.with_columns([
-        (np.sin(2 * np.pi * pl.col("pickup_hour") / 24)).alias("cyclical_hour_sin"),
-        (np.cos(2 * np.pi * pl.col("pickup_hour") / 24)).alias("cyclical_hour_cos"),
-        (np.sin(2 * np.pi * pl.col("pickup_month") / 12)).alias("cyclical_month_sin"),
-        (np.cos(2 * np.pi * pl.col("pickup_month") / 12)).alias("cyclical_month_cos"),
-        (np.sin(2 * np.pi * pl.col("pickup_dow") / 7)).alias("cyclical_day_sin"),
-        (np.cos(2 * np.pi * pl.col("pickup_dow") / 7)).alias("cyclical_day_cos"),
     ])
 
-    # I. Categorical Engines
+    # Categorical Engines
 
     # 1. Detailed Weather Categorization
-    lf = lf.with_columns([
+    ctx = ctx.with_columns([
         # Rain Intensity
         pl.when(pl.col("precip") > 5.0)
         .then(pl.lit("heavy"))
@@ -269,7 +368,7 @@ def build_feature_pipeline(lf, zones, weather):
     ])
 
     # 2. High-Level Weather State (Using derived categories)
-    lf = lf.with_columns([
+    ctx = ctx.with_columns([
         pl.when(pl.col("snow_intensity") != "none")
         .then(pl.lit("snowing"))
         .when((pl.col("snow") == 0) & (pl.col("snowdepth") > 5))
@@ -297,21 +396,40 @@ def build_feature_pipeline(lf, zones, weather):
         .cast(pl.UInt8)
         .alias("is_extreme_weather"),
         # Temp Bin
-        pl.when(pl.col("temp") < 0)
-        .then(pl.lit("freezing"))
-        .when(pl.col("temp").is_between(0, 10))
-        .then(pl.lit("cold"))
-        .when(pl.col("temp").is_between(10, 20))
-        .then(pl.lit("mild"))
-        .when(pl.col("temp").is_between(20, 28))
-        .then(pl.lit("warm"))
-        .otherwise(pl.lit("hot"))
-        .alias("temp_bin"),
+        temp_bin_expr(pl.col("temp")).alias("temp_bin"),
     ])
 
-    # 2. Cultural Day Type
-    # Replaces `is_weekend`: if not "workday" then is weekend
-    lf = lf.with_columns(
+    ctx = ctx.select([
+        "context_hour",
+        "temp",
+        "conditions",
+        "rain_intensity",
+        "snow_intensity",
+        "wind_intensity",
+        "visibility_status",
+        "weather_state",
+        "is_bad_weather",
+        "is_extreme_weather",
+        "temp_bin",
+    ])
+    return conform(ctx, PROCESSED_SCHEMA)
+
+
+def calendar_exprs():
+    """
+    Features that depend only on the pickup time, per trip (any timestamp, unlike the weather):
+    cyclical encodings, cultural day type, time of day bin and pandemic phase.
+    """
+    return [
+        # Cyclical Time (For ML)
+        (np.sin(2 * np.pi * pl.col("pickup_hour") / 24)).alias("cyclical_hour_sin"),
+        (np.cos(2 * np.pi * pl.col("pickup_hour") / 24)).alias("cyclical_hour_cos"),
+        (np.sin(2 * np.pi * pl.col("pickup_month") / 12)).alias("cyclical_month_sin"),
+        (np.cos(2 * np.pi * pl.col("pickup_month") / 12)).alias("cyclical_month_cos"),
+        (np.sin(2 * np.pi * pl.col("pickup_dow") / 7)).alias("cyclical_day_sin"),
+        (np.cos(2 * np.pi * pl.col("pickup_dow") / 7)).alias("cyclical_day_cos"),
+        # Cultural Day Type
+        # Replaces `is_weekend`: if not "workday" then is weekend
         pl.when((pl.col("pickup_dow") == 5) & (pl.col("pickup_hour") >= 17))
         .then(pl.lit("weekend_night"))
         .when((pl.col("pickup_dow") == 6) & (pl.col("pickup_hour") < 5))
@@ -325,11 +443,8 @@ def build_feature_pipeline(lf, zones, weather):
         .when((pl.col("pickup_dow") == 1) & (pl.col("pickup_hour") < 6))
         .then(pl.lit("sunday_rest"))
         .otherwise(pl.lit("workday"))
-        .alias("cultural_day_type")
-    )
-
-    # 3. Time of Day Bin
-    lf = lf.with_columns(
+        .alias("cultural_day_type"),
+        # Time of Day Bin
         pl.when(pl.col("pickup_hour").is_between(6, 9))
         .then(pl.lit("morning_rush"))
         .when(pl.col("pickup_hour").is_between(10, 15))
@@ -339,11 +454,8 @@ def build_feature_pipeline(lf, zones, weather):
         .when(pl.col("pickup_hour").is_between(20, 22))
         .then(pl.lit("evening"))
         .otherwise(pl.lit("late_night"))
-        .alias("time_of_day_bin")
-    )
-
-    # 4. Pandemic Phase
-    lf = lf.with_columns(
+        .alias("time_of_day_bin"),
+        # Pandemic Phase
         pl.when(pl.col("pickup_datetime") < pl.datetime(2020, 3, 1))
         .then(pl.lit("pre_pandemic"))
         .when(pl.col("pickup_datetime").is_between(pl.datetime(2020, 3, 1), pl.datetime(2020, 6, 1)))
@@ -351,30 +463,189 @@ def build_feature_pipeline(lf, zones, weather):
         .when(pl.col("pickup_datetime").is_between(pl.datetime(2020, 6, 1), pl.datetime(2021, 9, 1)))
         .then(pl.lit("recovery"))
         .otherwise(pl.lit("new_normal"))
-        .alias("pandemic_phase")
+        .alias("pandemic_phase"),
+    ]
+
+
+# --- 2. The Feature Engineering Engine ---
+def prepare_raw_trips(lf):
+    """Stage A: Uber-only rows with every raw column cast to its processed dtype."""
+    # A. Pre-Processing & Casting (dtypes & missing later-year columns: see tlc_schema)
+    lf = lf.filter(pl.col("hvfhs_license_num") == UBER_LICENSE)
+    lf = conform(lf, RAW_SCHEMA, RAW_DEFAULTS)
+
+    # Define Flags to convert to 1/0 (UInt8)
+    flag_cols = ["wav_request_flag", "wav_match_flag", "shared_request_flag", "shared_match_flag", "access_a_ride_flag"]
+
+    lf = lf.with_columns(
+        [
+            pl.col("congestion_surcharge").fill_null(0),
+            pl.col("airport_fee").fill_null(0),
+            pl.col("sales_tax").fill_null(0),
+            pl.col("bcf").fill_null(0),
+            pl.col("cbd_congestion_fee").fill_null(0),
+        ]
+        # 'Y' -> 1, else 0. Cast to UInt8.
+        + [pl.when(pl.col(f) == "Y").then(1).otherwise(0).cast(pl.UInt8).alias(f) for f in flag_cols]
+    )
+
+    return lf
+
+
+def filter_clauses():
+    """
+    The Great Filter as named clauses, one per rejection reason: a row is kept when every clause
+    holds (a null counts as a rejection, as in filter). All but "speed" only need raw (cast)
+    columns; "speed" needs the derived speed and runs as stage J.
+    """
+    trip_km = pl.col("trip_miles") * 1.60934
+    duration_seconds = (pl.col("dropoff_datetime") - pl.col("pickup_datetime")).dt.total_seconds()
+    return {
+        # 1. Physics & Locations
+        "distance": trip_km.is_between(0.15, 120),
+        "duration": duration_seconds.is_between(60, 15000),
+        "location": pl.col("PULocationID").is_between(1, 263) & pl.col("DOLocationID").is_between(1, 263),
+        # 2. Core Economics
+        "fare": pl.col("base_passenger_fare").is_between(0.10, 300),
+        "pay": pl.col("driver_pay").is_between(0.01, 200),
+        # 3. Tax & Fee Caps (The missing pieces)
+        "surcharge_caps": (
+            pl.col("congestion_surcharge").is_between(0, 2.75)
+            & pl.col("tolls").is_between(0, 50)
+            & pl.col("sales_tax").is_between(0, 40)
+            & pl.col("bcf").is_between(0, 15)
+            & pl.col("airport_fee").is_between(0, 6)
+        ),
+        # 4. Smart Tip Filter: Tip <= 50 OR (Tip > 50 AND Ratio <= 4.0)
+        "smart_tip": (pl.col("tips") <= 50) | ((pl.col("tips") > 50) & (pl.col("tips") <= (pl.col("base_passenger_fare") * 4.0))),
+        # Note: We do NOT filter cbd_congestion_fee (logic was "Leave as is")
+        # 5. Physics check on the derived speed (stage J)
+        "speed": (trip_km / (duration_seconds / 3600)).is_between(1, 100),
+    }
+
+
+def prefilter_expr():
+    """
+    The Great Filter clauses that only need raw (cast) columns. Applied right after stage A so
+    rejected rows never reach the joins or the feature engines; stage J applies the rest, so the
+    split filter keeps exactly the same rows as the single filter did.
+    """
+    return pl.all_horizontal([expr for name, expr in filter_clauses().items() if name != "speed"])
+
+
+def rejection_exprs():
+    """
+    Per clause, a flag that is true where the clause rejects the row; plus every rejected row's
+    reasons as a List(Enum) (empty for kept rows). For the rows of prepare_raw_trips.
+    """
+    rejected = {name: ~expr.fill_null(False) for name, expr in filter_clauses().items()}
+    reasons = pl.concat_list([pl.when(flag).then(pl.lit(name)).otherwise(pl.lit(None, pl.String)) for name, flag in rejected.items()])
+    return rejected, reasons.list.drop_nulls().cast(pl.List(pl.Enum(list(rejected)))).alias("rejection_reasons")
+
+
+def build_feature_pipeline(lf, od_dim, context, checkpoint=no_checkpoint):
+    """
+    The lazy A-J pipeline. `checkpoint(label, lf)` is called at the end of every stage and
+    returns the frame the next stage builds on (profiling materializes each stage there).
+    """
+    lf = checkpoint("A. Pre-Processing & Casting", prepare_raw_trips(lf))
+
+    # The Great Filter, stage 1: raw-column clauses, before any join or feature work
+    lf = checkpoint("A. Great Filter (stage 1)", lf.filter(prefilter_expr()))
+
+    # B. Geospatial Join (zone labels, centroid distance/bearing, flow categories: see build_od_dimension)
+    # Joins keep the raw row order so a month split into shards concatenates back to the same output
+    lf = lf.with_columns(od_key_expr())
+    lf = lf.join(od_dim.lazy(), on="od_key", how="left", maintain_order="left")
+    lf = checkpoint("B. Geospatial Join", lf)
+
+    # C. Core Physics & Time
+    # 1. Calculate raw metrics
+    lf = lf.with_columns([
+        (pl.col("trip_miles") * 1.60934).alias("trip_km"),
+        ((pl.col("dropoff_datetime") - pl.col("pickup_datetime")).dt.total_seconds()).alias("duration_seconds"),
+        # Temporal Features
+        pl.col("pickup_datetime").dt.hour().alias("pickup_hour"),
+        pl.col("pickup_datetime").dt.day().alias("pickup_day"),
+        pl.col("pickup_datetime").dt.month().alias("pickup_month"),
+        pl.col("pickup_datetime").dt.year().alias("pickup_year"),
+        pl.col("pickup_datetime").dt.weekday().alias("pickup_dow"),
+        pl.col("pickup_datetime").dt.date().alias("pickup_date"),
+        # Hourly Context Key
+        context_hour_expr(),
+    ])
+
+    # 2. Service Metrics (Wait Times) with Paradox Cleaning
+    # If the time is negative (Time Travel), we set it to NULL so it doesn't skew averages.
+    wait_calc = (pl.col("pickup_datetime") - pl.col("request_datetime")).dt.total_seconds() / 60
+    response_calc = (pl.col("on_scene_datetime") - pl.col("request_datetime")).dt.total_seconds() / 60
+    boarding_calc = (pl.col("pickup_datetime") - pl.col("on_scene_datetime")).dt.total_seconds() / 60
+
+    lf = lf.with_columns([
+        pl.when(wait_calc < 0).then(None).otherwise(wait_calc).alias("total_wait_time_min"),
+        pl.when(response_calc < 0).then(None).otherwise(response_calc).alias("driver_response_time_min"),
+        pl.when(boarding_calc < 0).then(None).otherwise(boarding_calc).alias("boarding_time_min"),
+    ])
+    lf = checkpoint("C. Core Physics & Time", lf)
+
+    # D. Derived Physics (Distance & Bearing come from the OD dimension)
+    lf = lf.with_columns([
+        (pl.col("duration_seconds") / 60).alias("duration_min"),
+    ])
+    lf = checkpoint("D. Derived Physics", lf)
+
+    # E. Advanced Physics Derivatives
+    lf = lf.with_columns([
+        (pl.col("trip_km") / (pl.col("duration_seconds") / 3600)).alias("speed_kmh"),
+        (pl.col("straight_line_dist_km") / (pl.col("duration_min") / 60)).alias("displacement_speed_kmh"),
+        (pl.col("trip_km") / (pl.col("straight_line_dist_km") + 0.01)).alias("tortuosity_index"),
+    ])
+    lf = checkpoint("E. Advanced Physics Derivatives", lf)
+
+    # F. Economic Engine (Full Suite)
+    # 1. Calculate Total Cost first (Base dependency)
+    lf = lf.with_columns([
+        (
+            pl.col("base_passenger_fare")
+            + pl.col("tolls")
+            + pl.col("tips")
+            + pl.col("congestion_surcharge")
+            + pl.col("airport_fee")
+            + pl.col("sales_tax")
+            + pl.col("bcf")
+            + pl.col("cbd_congestion_fee")
+        ).alias("total_rider_cost"),
+    ])
+
+    # 2. Calculate Ratios & Derivatives
+    lf = lf.with_columns([
+        (pl.col("total_rider_cost") / (pl.col("trip_km") + 0.01)).alias("cost_per_km"),
+        (pl.col("driver_pay") / (pl.col("base_passenger_fare") + 0.01)).alias("driver_revenue_share"),
+        (1 - (pl.col("driver_pay") / (pl.col("base_passenger_fare") + 0.01))).alias("uber_take_rate_proxy"),
+        (pl.col("driver_pay") / ((pl.col("duration_min") / 60) + 0.01)).alias("pay_per_hour"),
+        (pl.col("tips") / (pl.col("base_passenger_fare") + 0.01)).alias("tipping_pct"),
+        ((pl.col("tips") / (pl.col("base_passenger_fare") + 0.01)) > 0.25).cast(pl.UInt8).alias("is_generous_tip"),
+    ])
+
+    # 3. Calculate Dependent Flags (MUST be in a new block so driver_revenue_share exists)
+    lf = lf.with_columns([(pl.col("driver_revenue_share") > 1.0).cast(pl.UInt8).alias("is_subsidized")])
+    lf = checkpoint("F. Economic Engine", lf)
+
+    # G. Calendar Features & Hourly Context Join (weather features: see build_hourly_context)
+    # Trips outside the weather table's span take its no-reading row, so only weather can be missing
+    covered = context.filter(pl.col("context_hour") != MISSING_CONTEXT_HOUR)["context_hour"]
+    in_span = pl.col("context_hour").is_between(covered.min(), covered.max())
+    lf = lf.with_columns(
+        calendar_exprs() + [pl.when(in_span).then(pl.col("context_hour")).otherwise(MISSING_CONTEXT_HOUR).alias("context_hour")]
     )
+    lf = lf.join(context.lazy(), on="context_hour", how="left", maintain_order="left")
+    lf = checkpoint("G. Hourly Context Join", lf)
 
-    # 5. Borough Flow & Trip Archetype & Zone Flow
+    # I. Categorical Engines
+    # 5. Trip Archetype (Borough Flow & Zone Flow come from the OD dimension)
     lf = lf.with_columns([
-        pl.concat_str([pl.col("pickup_borough"), pl.lit(" -> "), pl.col("dropoff_borough")]).alias("borough_flow"),
-        # Borough Transition Type
-        pl.when((pl.col("pickup_borough") == "Manhattan") & (pl.col("dropoff_borough") == "Manhattan"))
-        .then(pl.lit("manhattan_internal"))
-        .when((pl.col("pickup_borough") == "Manhattan") | (pl.col("dropoff_borough") == "Manhattan"))
-        .then(pl.lit("manhattan_outer_commute"))
-        .when(pl.col("pickup_borough") != pl.col("dropoff_borough"))
-        .then(pl.lit("outer_inter"))
-        .otherwise(pl.lit("outer_intra"))
-        .alias("borough_flow_type"),
-        # Trip Zone Type
-        pl.when(pl.col("PULocationID") == pl.col("DOLocationID"))
-        .then(pl.lit("intra_zone"))
-        .when(pl.col("pickup_borough") == pl.col("dropoff_borough"))
-        .then(pl.lit("intra_borough"))
-        .otherwise(pl.lit("inter_borough"))
-        .alias("trip_type_zone"),
         # Archetype
-        pl.when(pl.col("PULocationID").is_in([1, 132, 138]) | pl.col("DOLocationID").is_in([1, 132, 138]))
+        pl.when(pl.col("is_airport_od"))
         .then(pl.lit("airport"))
         # Strict Commute: workday AND (morning rush OR evening rush)
         .when(
@@ -387,105 +658,415 @@ def build_feature_pipeline(lf, zones, weather):
         .otherwise(pl.lit("leisure"))
         .alias("trip_archetype"),
     ])
+    lf = checkpoint("I. Categorical Engines", lf)
+
+    # J. The Great Filter, stage 2: clauses on derived metrics (stage 1 is prefilter_expr)
+    lf = lf.filter(filter_clauses()["speed"])
+
+    # Write Contract: exactly the registry columns in registry order. Everything else (utility
+    # keys, raw weather, IDs, redundant time columns, trip_miles) is dropped here.
+    return checkpoint("J. Great Filter (stage 2)", conform(lf, PROCESSED_SCHEMA, strict=True))
 
-    # J. The Great Filter (Smart Tips + Physics)
-    lf = lf.filter(
-        # 1. Physics & Locations
-        (pl.col("trip_km").is_between(0.15, 120))
-        & (pl.col("duration_seconds").is_between(60, 15000))
-        & (pl.col("speed_kmh").is_between(1, 100))
-        & (pl.col("PULocationID").is_between(1, 263))
-        & (pl.col("DOLocationID").is_between(1, 263))
-        # 2. Core Economics
-        & (pl.col("base_passenger_fare").is_between(0.10, 300))
-        & (pl.col("driver_pay").is_between(0.01, 200))
-        # 3. Tax & Fee Caps (The missing pieces)
-        & (pl.col("congestion_surcharge").is_between(0, 2.75))
-        & (pl.col("tolls").is_between(0, 50))
-        & (pl.col("sales_tax").is_between(0, 40))
-        & (pl.col("bcf").is_between(0, 15))
-        & (pl.col("airport_fee").is_between(0, 6))
-        # 4. Smart Tip Filter: Tip <= 50 OR (Tip > 50 AND Ratio <= 4.0)
-        & ((pl.col("tips") <= 50) | ((pl.col("tips") > 50) & (pl.col("tips") <= (pl.col("base_passenger_fare") * 4.0))))
-        # Note: We do NOT filter cbd_congestion_fee (logic was "Leave as is")
-    )
 
-    # Drop Utility Columns
-    cols_to_drop = [
-        "weather_match_time",
-        "service_zone",
-        "service_zone_right",
-        "pu_lat",
-        "pu_lon",
-        "do_lat",
-        "do_lon",
-        # Raw Weather (Replaced by Categories)
-        "precip",
-        "snow",
-        "snowdepth",
-        "windspeed",
-        "visibility",
-        "feelslike",
-        # IDs (Noise, we're only filtering for Uber anyway)
-        "hvfhs_license_num",
-        "dispatching_base_num",
-        "originating_base_num",
-        # Redundant Time (We have Duration & Metrics)
-        "request_datetime",
-        "on_scene_datetime",
-        "datetime",
-        "trip_time",
-        # Redundant Meta
-        "icon",
-        "trip_miles",
+# --- 3. Intra-Month Sharding ---
+def plan_shards(raw_file, threshold=SHARD_ROW_THRESHOLD, target_rows=SHARD_TARGET_ROWS):
+    """
+    Splits a raw file into (offset, length) row ranges aligned to its Parquet row groups.
+    Returns a single full-file range when the file is under `threshold` rows.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return [(0, None)]
+
+    try:
+        meta = pq.ParquetFile(raw_file).metadata
+    except Exception:
+        # Unreadable footer: run it as one job so the failure is recorded like any other
+        return [(0, None)]
+    if threshold is None or meta.num_rows <= threshold:
+        return [(0, None)]
+
+    shards = []
+    offset, length = 0, 0
+    for i in range(meta.num_row_groups):
+        length += meta.row_group(i).num_rows
+        if length >= target_rows:
+            shards.append((offset, length))
+            offset, length = offset + length, 0
+    if length:
+        shards.append((offset, length))
+
+    return shards
+
+
+# --- 4. Incremental State ---
+def pipeline_fingerprint():
+    """
+    Fingerprint of everything besides the input files that shapes a partition: the code of the
+    asset builders and the feature pipeline, the schema registry, the output layout and the
+    config they read.
+    Code is compared as syntax trees, so comment or formatting edits don't invalidate outputs.
+    """
+    code_units = [
+        load_static_assets,
+        od_key_expr,
+        build_od_dimension,
+        context_hour_expr,
+        temp_bin_expr,
+        hourly_temps,
+        impute_hourly_temp,
+        build_hourly_context,
+        calendar_exprs,
+        prepare_raw_trips,
+        filter_clauses,
+        prefilter_expr,
+        build_feature_pipeline,
+        apply_output_layout,
+        tlc_schema,
     ]
+    trees = [ast.dump(ast.parse(inspect.getsource(unit))) for unit in code_units]
+    config = (
+        UBER_LICENSE,
+        OD_KEY_BASE,
+        AIRPORT_ZONE_IDS,
+        MISSING_CONTEXT_HOUR,
+        TEMP_INTERP_MAX_GAP_HOURS,
+        sorted(OUTPUT_LAYOUT.items()),
+    )
+    return text_fingerprint(PIPELINE_VERSION, *trees, repr(config))
 
-    # Safety check: Only drop columns that actually exist
-    existing_cols = lf.collect_schema().names()
-    final_drop_list = [c for c in cols_to_drop if c in existing_cols]
 
-    lf = lf.drop(final_drop_list)
+def partition_key(yyyy, mm):
+    return f"year={yyyy}/month={mm}"
+
+
+# --- 5. Per-File Task (runs inside a scheduler worker) ---
+def apply_output_layout(lf, layout=None):
+    """Sorts `lf` per the layout and returns it with the matching sink_parquet options."""
+    layout = dict(OUTPUT_LAYOUT if layout is None else layout)
+    sort_by = layout.pop("sort_by", None)
+    if sort_by:
+        lf = lf.sort(sort_by, maintain_order=True)
+    return lf, layout
 
-    return lf
 
+def process_month(raw_file, target_file, od_dim, context, row_range=None, plan_dir=None, quarantine_file=None):
+    """
+    Writes one partition (or shard) and returns its row accounting:
+    Uber rows read, rows surviving the pre-filter, rows the whole Great Filter kept, rows written
+    (more than kept when the OD join fans out, see build_od_dimension), rows it rejected
+    and how many each clause rejected (a row failing several clauses counts for each). With a `quarantine_file`,
+    the rejected rows are written there too, tagged with their `rejection_reasons`.
+    With a `plan_dir` the run is profiled instead (see profile_month).
+    """
+    lf = pl.scan_parquet(raw_file)
+    if row_range is not None:
+        # Slice before any filter so the range addresses raw rows (pushed down to the reader)
+        lf = lf.slice(*row_range)
 
-# --- 3. Main Execution Loop ---
+    if plan_dir is not None:
+        return profile_month(lf, target_file, od_dim, context, plan_dir)
+
+    lf_processed = build_feature_pipeline(lf, od_dim, context)
+    low_memory = current_tuning()["low_memory"]
+
+    # Filter accounting rides along in the same streaming pass (the raw scan is shared)
+    rejected, reasons = rejection_exprs()
+    lf_counts = prepare_raw_trips(lf).select(
+        [
+            pl.len().alias("rows_uber"),
+            prefilter_expr().sum().alias("rows_prefiltered"),
+            pl.any_horizontal(list(rejected.values())).sum().alias("rows_rejected"),
+        ]
+        + [flag.sum().alias(name) for name, flag in rejected.items()]
+    )
+
+    # Written next to the target and only renamed into place by main once the whole month is done
+    tmp_file = temp_path(target_file)
+    os.makedirs(os.path.dirname(target_file), exist_ok=True)
+    # Low-memory plan: skip the sort (it materializes the whole frame) and stream straight to disk
+    layout = {**OUTPUT_LAYOUT, "sort_by": []} if low_memory else None
+    lf_processed, sink_options = apply_output_layout(lf_processed, layout)
+    sinks = [lf_processed.sink_parquet(tmp_file, lazy=True, **sink_options)]
+
+    if quarantine_file is not None:
+        # Rejected rows as stage A left them (raw order, no sort), plus why they were rejected
+        os.makedirs(os.path.dirname(quarantine_file), exist_ok=True)
+        lf_rejected = prepare_raw_trips(lf).filter(pl.any_horizontal(list(rejected.values()))).with_columns(reasons)
+        lf_rejected, quarantine_options = apply_output_layout(lf_rejected, {**OUTPUT_LAYOUT, "sort_by": []})
+        sinks.append(lf_rejected.sink_parquet(temp_path(quarantine_file), lazy=True, **quarantine_options))
+
+    counts = pl.collect_all(sinks + [lf_counts], engine="streaming")[-1]
+
+    stats = counts.row(0, named=True)
+    stats = {
+        "rows_uber": stats["rows_uber"],
+        "rows_prefiltered": stats["rows_prefiltered"],
+        "rows_kept": stats["rows_uber"] - stats["rows_rejected"],
+        "rows_rejected": stats["rows_rejected"],
+        "rejected": {name: stats[name] for name in rejected},
+    }
+    stats["rows_written"] = pl.scan_parquet(tmp_file).select(pl.len()).collect().item()
+    stats["low_memory"] = low_memory
+    return stats
+
+
+def profile_month(lf, target_file, od_dim, context, plan_dir):
+    """
+    Profiled process_month: saves the optimized streaming plan, then runs the pipeline one stage
+    at a time (Parquet decode, A-J, write) and records rows in/out, wall time and peak RSS of
+    each. Output is identical; time and memory are those of stage-by-stage execution, not of
+    the fused streaming run.
+    """
+    lf_processed, sink_options = apply_output_layout(build_feature_pipeline(lf, od_dim, context))
+    save_plan(lf_processed, plan_dir, task_name(target_file))
+
+    stages = []
+    df_raw = collect_stage(stages, "Read (Parquet decode)", lf)
+    lf_processed = build_feature_pipeline(df_raw.lazy(), od_dim, context, checkpoint=stage_checkpoint(stages))
+    del df_raw
+    lf_processed, _ = apply_output_layout(lf_processed)
+
+    tmp_file = temp_path(target_file)
+    os.makedirs(os.path.dirname(target_file), exist_ok=True)
+    with stage(stages, "Write (sort & sink)", stages[-1]["rows_out"]) as record:
+        lf_processed.sink_parquet(tmp_file, **sink_options)
+        record["rows_out"] = pl.scan_parquet(tmp_file).select(pl.len()).collect().item()
+        record["bytes_out"] = os.path.getsize(tmp_file)
+
+    rows_out = {s["stage"]: s["rows_out"] for s in stages}
+    return {
+        "rows_uber": rows_out["A. Pre-Processing & Casting"],
+        "rows_prefiltered": rows_out["A. Great Filter (stage 1)"],
+        "rows_written": record["rows_out"],
+        "stages": stages,
+    }
+
+
+def report_filter_savings(results):
+    """
+    Prints how much of the join & feature-engineering work the pre-filter skipped, and how many
+    rows each Great Filter clause rejected.
+    """
+    stats = [r["value"] for r in results if r["ok"]]
+    if not stats:
+        return
+
+    rows_uber = sum(s["rows_uber"] for s in stats)
+    rows_pre = sum(s["rows_prefiltered"] for s in stats)
+    rows_out = sum(s["rows_written"] for s in stats)
+    # Profiled runs don't count the kept rows: their fan-out shows up as 0
+    rows_kept = sum(s.get("rows_kept", s["rows_written"]) for s in stats)
+    skipped = rows_uber - rows_pre
+
+    print(f"🧹 Great Filter: {rows_uber:,} Uber rows -> {rows_pre:,} after pre-filter -> {rows_kept:,} kept -> {rows_out:,} written")
+    if rows_uber:
+        print(f"   Pre-filter skipped joins & feature engineering for {skipped:,} rows ({skipped / rows_uber:.1%})")
+        print(f"   Residual filter dropped {rows_pre - rows_kept:,} more rows")
+        if rows_out != rows_kept:
+            print(f"   OD join fan-out added {rows_out - rows_kept:,} rows (duplicated LocationIDs in the zone table)")
+        rows_rejected = sum(s.get("rows_rejected", 0) for s in stats)
+        print(f"   Great Filter rejected {rows_rejected:,} Uber rows ({rows_rejected / rows_uber:.1%}), by clause:")
+        # A row failing several clauses counts for each, so these add up to more than the rejections
+        rejected = {}
+        for s in stats:
+            for clause, n in s.get("rejected", {}).items():
+                rejected[clause] = rejected.get(clause, 0) + n
+        for clause, n in sorted(rejected.items(), key=lambda kv: -kv[1]):
+            print(f"   - {clause:<15} rejected {n:>12,} rows ({n / rows_uber:.2%})")
+
+
+def write_rejections(manifest, path):
+    """One row per month with its row counts and per-clause rejections (from the manifest)."""
+    rows = [
+        {
+            "partition": key,
+            "raw_file": e.get("raw_file"),
+            "rows_uber": e.get("rows_uber"),
+            "rows_rejected": e.get("rows_rejected"),
+            "rows_written": e.get("rows_written"),
+            **e["rejected"],
+        }
+        for key, e in sorted(manifest["partitions"].items())
+        if "rejected" in e
+    ]
+    if rows:
+        pl.DataFrame(rows, infer_schema_length=None).write_csv(temp_path(path))
+        os.replace(temp_path(path), path)
+
+
+# --- 6. Main Execution Loop ---
 def main():
     print("🚀 Orion: Initializing Master ETL Pipeline...")
-    zones, weather = load_static_assets()
-    all_files = sorted(glob.glob(os.path.join(RAW_DATA_DIR, "*.parquet")))
+    run_id = new_run_id("process_data")
+    plan_dir = plan_dir_for(run_id) if PROFILE else None
+    started_at = datetime.now().isoformat()
+    od_dim, context = load_static_assets()
+    output_dir = dataset_root("processed")
+    quarantine_dir = dataset_root("quarantine")
+    # Profiled runs execute stage by stage and write no quarantine
+    quarantine = QUARANTINE and not PROFILE
+    raw_months = [p for p in dataset_partitions("raw") if p["month"] is not None]
+    all_files = [(f, p["year"], p["month"]) for p in raw_months for f in p["files"]]
+
+    manifest_file = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_file)
+    shared_inputs = {
+        "zones": file_fingerprint(ZONE_FILE),
+        "weather": file_fingerprint(WEATHER_FILE),
+        "pipeline": pipeline_fingerprint(),
+    }
+    if quarantine:
+        # Months built without a quarantine are stale while it's on (and stay valid once it's off)
+        shared_inputs["quarantine"] = "on"
+
+    budget = budget_bytes(MEMORY_BUDGET_GB)
 
-    print(f"📂 Found {len(all_files)} raw files. Starting Processing...")
+    # Leftovers of an interrupted run: never valid output
+    for root in (output_dir, quarantine_dir):
+        discard_temp_files(glob.glob(os.path.join(root, "year=*", "month=*", "*" + TMP_SUFFIX)))
 
-    for i, f in enumerate(all_files, 1):
+    print(f"📂 Found {len(all_files)} raw files. Checking the manifest...")
+
+    jobs = []
+    partitions = {}
+    for i, (f, year, month) in enumerate(all_files, 1):
         filename = os.path.basename(f)
-        try:
-            date_part = filename.split("_")[-1].replace(".parquet", "")
-            yyyy, mm = date_part.split("-")
-        except:
-            continue
+        yyyy, mm = str(year), f"{month:02d}"
 
-        target_dir = os.path.join(OUTPUT_DIR, f"year={yyyy}", f"month={mm}")
-        target_file = os.path.join(target_dir, "data.parquet")
+        key = partition_key(yyyy, mm)
+        target_dir = os.path.join(output_dir, f"year={yyyy}", f"month={mm}")
+        quarantine_target_dir = os.path.join(quarantine_dir, f"year={yyyy}", f"month={mm}")
+        inputs = {"raw": file_fingerprint(f), **shared_inputs}
 
-        if os.path.exists(target_file):
-            print(f"[{i}/{len(all_files)}] ⏭️ Skipping {filename}")
+        reason = stale_reason(manifest["partitions"].get(key), inputs, target_dir)
+        if reason is None:
+            print(f"[{i}/{len(all_files)}] ⏭️ Up to date {filename}")
             continue
+        print(f"[{i}/{len(all_files)}] 🔁 Stale {filename} ({reason})")
 
-        print(f"[{i}/{len(all_files)}] 🔨 Processing {filename}...", end="", flush=True)
-        start_t = time.time()
+        # A partition is either one data.parquet or a set of part-*.parquet shards
+        est_bytes, rows = estimate_task_bytes(f), parquet_rows(f)
+        if budget and rows and est_bytes > budget:
+            # Low-memory plan: shards small enough to fit the budget on their own
+            shard_rows = max(1, int(rows * budget * LOW_MEMORY_SHARD_HEADROOM / est_bytes))
+            shards = plan_shards(f, threshold=0, target_rows=shard_rows)
+            print(f"   🪫 {filename} needs ~{est_bytes / 1e9:.1f} GB, over the {budget / 1e9:.1f} GB budget")
+        else:
+            shards = plan_shards(f)
+
+        if len(shards) == 1:
+            targets = [os.path.join(target_dir, "data.parquet")]
+            quarantine_targets = [os.path.join(quarantine_target_dir, "data.parquet")] if quarantine else [None]
+            jobs.append({
+                "key": f,
+                "args": (f, targets[0], od_dim, context, None, plan_dir, quarantine_targets[0]),
+                "est_bytes": est_bytes,
+                "rows": rows,
+                "partition": key,
+            })
+        else:
+            print(f"   ✂️ Sharding {filename} into {len(shards)} parts")
+            total_rows = sum(length for _, length in shards)
+            targets, quarantine_targets = [], []
+            for k, (offset, length) in enumerate(shards):
+                part_file = os.path.join(target_dir, f"part-{k:05d}.parquet")
+                quarantine_file = os.path.join(quarantine_target_dir, f"part-{k:05d}.parquet") if quarantine else None
+                targets.append(part_file)
+                quarantine_targets.append(quarantine_file)
+                jobs.append({
+                    "key": f"{f}#part-{k:05d}",
+                    "args": (f, part_file, od_dim, context, (offset, length), plan_dir, quarantine_file),
+                    "est_bytes": int(est_bytes * length / total_rows),
+                    "rows": length,
+                    "partition": key,
+                })
 
-        try:
-            lf = pl.scan_parquet(f)
-            lf_processed = build_feature_pipeline(lf, zones, weather)
-            os.makedirs(target_dir, exist_ok=True)
-            lf_processed.sink_parquet(target_file)
+        partitions[key] = {
+            "raw_file": filename,
+            "target_dir": target_dir,
+            "targets": targets,
+            "quarantine_dir": quarantine_target_dir,
+            "quarantine_targets": [q for q in quarantine_targets if q is not None],
+            "inputs": inputs,
+            "pending": len(targets),
+            "failed": False,
+            "rows_uber": 0,
+            "rows_rejected": 0,
+            "rows_written": 0,
+            "rejected": {},
+            "unsorted": False,
+        }
 
-            print(f" Done ({time.time() - start_t:.1f}s).")
-        except Exception as e:
-            print(f" ❌ FAILED: {e}")
+    if not jobs:
+        print("✅ Every partition is up to date.")
+        return
+
+    def commit_partition(idx, record):
+        # A month is only valid with all of its shards: commit once the last one is in
+        key = jobs[idx]["partition"]
+        part = partitions[key]
+        part["pending"] -= 1
+        if record["ok"]:
+            stats = record["value"]
+            part["rows_uber"] += stats["rows_uber"]
+            part["rows_rejected"] += stats.get("rows_rejected", 0)
+            part["rows_written"] += stats["rows_written"]
+            part["unsorted"] |= stats.get("low_memory", False)
+            for clause, n in stats.get("rejected", {}).items():
+                part["rejected"][clause] = part["rejected"].get(clause, 0) + n
+        else:
+            part["failed"] = True
+        if part["pending"]:
+            return
+
+        temps = [temp_path(t) for t in part["targets"]]
+        quarantine_temps = [temp_path(q) for q in part["quarantine_targets"]]
+        if part["failed"]:
+            print(f"   🧹 Discarding partial build of {key} (previous output kept)")
+            discard_temp_files(temps + quarantine_temps)
+            return
+
+        previous = glob.glob(os.path.join(part["target_dir"], "*.parquet"))
+        commit_files(list(zip(temps, part["targets"])), stale_files=previous)
+        if part["quarantine_targets"]:
+            previous = glob.glob(os.path.join(part["quarantine_dir"], "*.parquet"))
+            commit_files(list(zip(quarantine_temps, part["quarantine_targets"])), stale_files=previous)
+        extra = {"rows_rejected": part["rows_rejected"], "rejected": part["rejected"]} if part["rejected"] else {}
+        manifest["partitions"][key] = make_entry(
+            part["inputs"],
+            [os.path.basename(t) for t in part["targets"]],
+            raw_file=part["raw_file"],
+            rows_uber=part["rows_uber"],
+            rows_written=part["rows_written"],
+            unsorted=part["unsorted"],
+            **extra,
+        )
+        save_manifest(manifest, manifest_file)
+
+    start_t = time.time()
+    results = run_tasks(
+        process_month, jobs, label="🔨 Processing", on_result=commit_partition, memory_budget_gb=MEMORY_BUDGET_GB
+    )
+    report_failures(results)
+    report_filter_savings(results)
+    write_rejections(manifest, os.path.join(output_dir, REJECTIONS_FILE))
+
+    if PROFILE:
+        for r in results:
+            r["stages"] = r["value"].pop("stages") if r["ok"] else []
+        report_file = write_run_report(
+            run_id,
+            "process_data",
+            results,
+            config={"output_layout": OUTPUT_LAYOUT, "shard_row_threshold": SHARD_ROW_THRESHOLD, "pipeline": shared_inputs["pipeline"]},
+            started_at=started_at,
+        )
+        print_stage_summary(report_file)
+        print(f"📊 Run report: {report_file} (query plans in {plan_dir})")
 
-        gc.collect()
+    print(f"⏱️ Total: {(time.time() - start_t) / 60:.2f} min")
 
 
 if __name__ == "__main__":
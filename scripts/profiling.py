@@ -0,0 +1,247 @@
+import os
+import re
+import json
+import time
+import glob
+import platform
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import polars as pl
+
+# ==============================================================================
+# ⏱️ STAGE PROFILER (opt-in)
+# Rows in/out, wall time and peak memory per labelled stage, optimized query plans and one
+# JSON + Parquet report per run. Scripts switch it on with their PROFILE flag.
+# ==============================================================================
+PROFILE_DIR = r"./profiles"
+
+# How often the background sampler reads the process RSS while a stage runs
+RSS_SAMPLE_SECONDS = 0.02
+
+
+# --- 1. Memory Probes ---
+def rss_bytes():
+    """Resident memory of this process, or None when it can't be read (psutil is optional)."""
+    try:
+        import psutil
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def _lifetime_peak_bytes():
+    # Fallback without psutil: the process high-water mark (never resets, so only an upper bound)
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if platform.system() == "Darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+@contextmanager
+def peak_memory():
+    """Yields a dict whose "peak_rss_bytes" holds the highest RSS seen inside the block."""
+    result = {"rss_start_bytes": rss_bytes(), "peak_rss_bytes": None}
+    if result["rss_start_bytes"] is None:
+        yield result
+        result["peak_rss_bytes"] = _lifetime_peak_bytes()
+        return
+
+    peak = [result["rss_start_bytes"]]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(RSS_SAMPLE_SECONDS):
+            peak[0] = max(peak[0], rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield result
+    finally:
+        done.set()
+        sampler.join()
+        result["peak_rss_bytes"] = max(peak[0], rss_bytes())
+
+
+# --- 2. Stages ---
+@contextmanager
+def stage(records, label, rows_in=None):
+    """
+    Times one stage and appends its record to `records`. The caller fills "rows_out"
+    (and optionally "bytes_out") on the yielded record.
+    """
+    record = {"stage": label, "rows_in": rows_in, "rows_out": None, "bytes_out": None}
+    start_t = time.perf_counter()
+    with peak_memory() as mem:
+        yield record
+    record["seconds"] = time.perf_counter() - start_t
+    record.update(mem)
+    records.append(record)
+
+
+def collect_stage(records, label, lf, rows_in=None, engine="auto"):
+    """Collects `lf` as one stage and returns the DataFrame."""
+    with stage(records, label, rows_in) as record:
+        df = lf.collect(engine=engine)
+        record["rows_out"] = df.height
+        record["bytes_out"] = df.estimated_size()
+    return df
+
+
+def stage_checkpoint(records):
+    """
+    Checkpoint for a lazy pipeline built as a chain of stages: each call materializes the stage
+    so its cost is measured on its own, then hands the next stage an in-memory frame. Rows in
+    are the previous stage's rows out.
+    """
+
+    def checkpoint(label, lf):
+        rows_in = records[-1]["rows_out"] if records else None
+        return collect_stage(records, label, lf, rows_in).lazy()
+
+    return checkpoint
+
+
+def no_checkpoint(label, lf):
+    return lf
+
+
+# --- 3. Query Plans ---
+def safe_name(text):
+    return re.sub(r"[^A-Za-z0-9_.=-]+", "_", str(text)).strip("_")
+
+
+def task_name(path):
+    """Short unique label for a file: Hive partition folders are kept (every month is data.parquet)."""
+    parts = os.path.normpath(str(path)).split(os.sep)
+    return "_".join([p for p in parts[:-1] if "=" in p] + parts[-1:])
+
+
+def save_plan(lf, plan_dir, name):
+    """Writes the optimized plan of `lf` (as the streaming engine will run it) to `plan_dir`."""
+    os.makedirs(plan_dir, exist_ok=True)
+    path = os.path.join(plan_dir, f"{safe_name(name)}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(lf.explain(engine="streaming"))
+    return path
+
+
+def save_plans(lfs, plan_dir, name):
+    """Writes the joint optimized plan of queries collected together (shared subplans show as CACHE)."""
+    os.makedirs(plan_dir, exist_ok=True)
+    path = os.path.join(plan_dir, f"{safe_name(name)}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(pl.explain_all(lfs))
+    return path
+
+
+# --- 4. Run Reports ---
+def new_run_id(script):
+    return f"{safe_name(script)}_{datetime.now():%Y%m%d-%H%M%S}"
+
+
+def plan_dir_for(run_id, profile_dir=None):
+    return os.path.join(profile_dir or PROFILE_DIR, f"{run_id}_plans")
+
+
+def host_info():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "polars": pl.__version__,
+        "cpu_count": os.cpu_count(),
+        "polars_threads": pl.thread_pool_size(),
+    }
+
+
+def write_run_report(run_id, script, records, config=None, profile_dir=None, started_at=None):
+    """
+    Writes `<run_id>.json` (run metadata + every task with its stages) and `<run_id>.parquet`
+    (one row per task stage) to the profile directory. `records` are scheduler records with the
+    task's stage list under "stages". Returns the Parquet path.
+    """
+    profile_dir = profile_dir or PROFILE_DIR
+    os.makedirs(profile_dir, exist_ok=True)
+
+    tasks, rows = [], []
+    for r in records:
+        stages = r.get("stages") or []
+        tasks.append({
+            "task": str(r["key"]),
+            "ok": r["ok"],
+            "error": r["error"],
+            "seconds": r["seconds"],
+            "est_bytes": r.get("est_bytes"),
+            "tuning": r.get("tuning"),
+            "stages": stages,
+        })
+        for k, s in enumerate(stages):
+            rows.append({
+                "run_id": run_id,
+                "script": script,
+                "task": task_name(r["key"]),
+                "stage_idx": k,
+                **s,
+            })
+
+    report = {
+        "run_id": run_id,
+        "script": script,
+        "started_at": started_at,
+        "finished_at": datetime.now().isoformat(),
+        "host": host_info(),
+        "config": config or {},
+        "tasks": tasks,
+    }
+    with open(os.path.join(profile_dir, f"{run_id}.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    path = os.path.join(profile_dir, f"{run_id}.parquet")
+    schema = {
+        "rows_in": pl.Int64,
+        "rows_out": pl.Int64,
+        "bytes_out": pl.Int64,
+        "seconds": pl.Float64,
+        "rss_start_bytes": pl.Int64,
+        "peak_rss_bytes": pl.Int64,
+    }
+    df = pl.DataFrame(rows, schema_overrides=schema, infer_schema_length=None) if rows else pl.DataFrame(
+        schema={"run_id": pl.String, "script": pl.String, "task": pl.String, "stage_idx": pl.Int64, "stage": pl.String, **schema}
+    )
+    df.write_parquet(path)
+    return path
+
+
+def print_stage_summary(parquet_path):
+    """Stage totals of one run: where the time and the memory went."""
+    df = pl.read_parquet(parquet_path)
+    if df.is_empty():
+        return
+    summary = (
+        df.group_by("stage", maintain_order=True)
+        .agg([
+            pl.col("seconds").sum().round(2).alias("total_s"),
+            pl.col("rows_in").sum().alias("rows_in"),
+            pl.col("rows_out").sum().alias("rows_out"),
+            (pl.col("peak_rss_bytes").max() / 1e6).round(0).alias("max_peak_rss_mb"),
+        ])
+        .with_columns((pl.col("total_s") / pl.col("total_s").sum()).round(3).alias("share"))
+    )
+    print("\n--- STAGE PROFILE ---")
+    with pl.Config(tbl_rows=40, tbl_width_chars=140, tbl_hide_dataframe_shape=True):
+        print(summary)
+
+
+def load_reports(profile_dir=None, script=None):
+    """Every run's stage table in one frame (filter on run_id to compare runs)."""
+    files = sorted(glob.glob(os.path.join(profile_dir or PROFILE_DIR, "*.parquet")))
+    if not files:
+        raise FileNotFoundError(f"No run reports in {profile_dir or PROFILE_DIR}")
+    df = pl.concat([pl.read_parquet(f) for f in files], how="diagonal_relaxed")
+    return df.filter(pl.col("script") == script) if script else df
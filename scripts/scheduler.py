@@ -0,0 +1,343 @@
+import os
+import gc
+import time
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# --- Configuration ---
+# Rough in-memory footprint of a month relative to its Parquet size on disk
+# (decompression + dictionary decode + join/agg buffers). Tuned on the 2019-2025 HVFHV files.
+DEFAULT_EXPANSION = 6.0
+
+# Share of the currently free RAM the scheduler may hand out to workers
+DEFAULT_RAM_FRACTION = 0.7
+
+# Never split the CPU so thin that a worker can't parallelise its own Parquet decode
+MIN_THREADS_PER_WORKER = 2
+
+# Streaming engine sizing (see tune_job): each Polars thread keeps about this many chunks in
+# flight, and streaming buffers may use this share of a job's memory allowance (the rest is
+# join tables, aggregation state and the output)
+CHUNKS_IN_FLIGHT_PER_THREAD = 4
+STREAMING_BUFFER_SHARE = 0.25
+MIN_CHUNK_ROWS = 10_000
+MAX_CHUNK_ROWS = 1_000_000
+
+# What a task sees from current_tuning() when it runs outside the scheduler
+DEFAULT_TUNING = {"threads": None, "chunk_rows": None, "low_memory": False, "allowance_bytes": None}
+_tuning = dict(DEFAULT_TUNING)
+
+
+# --- 1. Machine Probing ---
+def available_memory_bytes():
+    """
+    Free RAM in bytes. Uses psutil when installed, falls back to sysconf (Linux/macOS).
+    Returns None when it can't be determined (the scheduler then runs one file at a time).
+    """
+    try:
+        import psutil
+
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def estimate_task_bytes(file_path, expansion=DEFAULT_EXPANSION):
+    """Peak RAM estimate for one task working on `file_path`."""
+    try:
+        return int(os.path.getsize(file_path) * expansion)
+    except OSError:
+        return 0
+
+
+def parquet_rows(file_path):
+    """Row count from the Parquet footer, or None when the file can't be read."""
+    try:
+        import polars as pl
+
+        return pl.scan_parquet(file_path).select(pl.len()).collect().item()
+    except Exception:
+        return None
+
+
+def budget_bytes(memory_budget_gb=None, ram_fraction=DEFAULT_RAM_FRACTION, free_bytes=None):
+    """
+    The RAM the batch may use: `memory_budget_gb` when given, else `ram_fraction` of the RAM
+    free right now. None when neither is known.
+    """
+    if memory_budget_gb:
+        return int(memory_budget_gb * 1e9)
+    if free_bytes is None:
+        free_bytes = available_memory_bytes()
+    return int(free_bytes * ram_fraction) if free_bytes else None
+
+
+# --- 2. Job Construction ---
+def make_file_jobs(files, task_args=(), expansion=DEFAULT_EXPANSION):
+    """
+    One job per file: the task is called as `task_fn(file_path, *task_args)`.
+    """
+    return [
+        {"key": f, "args": (f, *task_args), "est_bytes": estimate_task_bytes(f, expansion), "rows": parquet_rows(f)}
+        for f in files
+    ]
+
+
+def _row_bytes(job):
+    # In-memory bytes per row the estimate implies (None when the row count is unknown)
+    return job["est_bytes"] / job["rows"] if job.get("rows") and job["est_bytes"] else None
+
+
+def plan_schedule(jobs, max_workers=None, ram_fraction=DEFAULT_RAM_FRACTION, free_bytes=None, memory_budget_gb=None):
+    """
+    Decides how many workers to run and how many Polars threads each one gets.
+
+    Worker count is bounded by CPU count, job count and how many median-sized jobs fit in
+    the RAM budget. The budget itself is enforced per job at admission time (see `run_tasks`).
+    Threads are the CPU share of a worker, capped at what its memory share can feed with
+    minimum-size streaming chunks.
+    """
+    cpus = os.cpu_count() or 1
+    budget = budget_bytes(memory_budget_gb, ram_fraction, free_bytes)
+
+    estimates = sorted(j["est_bytes"] for j in jobs) or [0]
+    median_est = max(estimates[len(estimates) // 2], 1)
+
+    workers = min(max_workers or cpus, max(1, cpus // MIN_THREADS_PER_WORKER), max(1, len(jobs)))
+    if budget is None:
+        workers = 1
+    else:
+        workers = max(1, min(workers, budget // median_est))
+
+    threads = max(1, cpus // workers)
+    row_bytes = sorted(b for b in map(_row_bytes, jobs) if b)
+    if budget and row_bytes:
+        per_thread = CHUNKS_IN_FLIGHT_PER_THREAD * MIN_CHUNK_ROWS * row_bytes[len(row_bytes) // 2]
+        threads = max(1, min(threads, int(budget // workers * STREAMING_BUFFER_SHARE // per_thread)))
+
+    return {
+        "workers": int(workers),
+        "threads_per_worker": threads,
+        "budget_bytes": budget,
+    }
+
+
+def tune_job(job, plan):
+    """
+    Per-job settings under the plan: the streaming chunk size its memory allowance affords and
+    whether it needs the task's low-memory plan (estimate over the whole budget).
+
+    A job's allowance is its worker's share of the budget, or more when the scheduler admits it
+    with room to spare (its estimate, up to the whole budget).
+    """
+    budget, threads = plan["budget_bytes"], plan["threads_per_worker"]
+    if not budget:
+        return {**DEFAULT_TUNING, "threads": threads}
+
+    allowance = max(budget // plan["workers"], min(job["est_bytes"], budget))
+    chunk_rows = None
+    row_bytes = _row_bytes(job)
+    if row_bytes:
+        chunk_rows = int(allowance * STREAMING_BUFFER_SHARE / (threads * CHUNKS_IN_FLIGHT_PER_THREAD * row_bytes))
+        chunk_rows = min(max(chunk_rows, MIN_CHUNK_ROWS), MAX_CHUNK_ROWS)
+
+    return {
+        "threads": threads,
+        "chunk_rows": chunk_rows,
+        "low_memory": job["est_bytes"] > budget,
+        "allowance_bytes": allowance,
+    }
+
+
+def current_tuning():
+    """The settings the running job was given (tasks check "low_memory" to switch plans)."""
+    return dict(_tuning)
+
+
+# --- 3. Worker Side ---
+def _init_worker(threads):
+    # Must happen before Polars builds its thread pool in this process
+    os.environ["POLARS_MAX_THREADS"] = str(threads)
+
+
+def _run_job(task_fn, args, tuning=None):
+    global _tuning
+    _tuning = {**DEFAULT_TUNING, **(tuning or {})}
+    if _tuning["chunk_rows"]:
+        import polars as pl
+
+        pl.Config.set_streaming_chunk_size(_tuning["chunk_rows"])
+
+    start_t = time.time()
+    try:
+        value = task_fn(*args)
+        record = {"ok": True, "value": value, "error": None, "traceback": None}
+    except Exception as e:
+        record = {"ok": False, "value": None, "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+
+    record["seconds"] = time.time() - start_t
+    gc.collect()
+    return record
+
+
+# --- 4. The Scheduler ---
+def run_tasks(
+    task_fn,
+    jobs,
+    max_workers=None,
+    ram_fraction=DEFAULT_RAM_FRACTION,
+    label="Processing",
+    on_result=None,
+    memory_budget_gb=None,
+):
+    """
+    Runs every job in a spawn-based process pool under a RAM budget (`memory_budget_gb`, or
+    `ram_fraction` of the free RAM). Each job gets a streaming chunk size sized to its share of
+    the budget, and jobs estimated over the whole budget are flagged for a low-memory plan
+    (see `tune_job` / `current_tuning`).
+
+    Jobs are admitted largest-first while the sum of in-flight estimates stays under the
+    budget (a lone job is always admitted so oversized files still run, just alone).
+    `task_fn` must be a module-level function so it can be pickled into the workers.
+    `on_result(index, record)` is called in the parent as each job finishes (e.g. to commit its
+    output right away instead of after the whole batch). A worker killed by the OS fails the jobs
+    in flight with it; the rest of the batch runs on a fresh pool.
+
+    Returns one record per job, in input order:
+        {"key", "ok", "value", "error", "traceback", "seconds", "est_bytes", "tuning"}
+    """
+    if not jobs:
+        return []
+
+    plan = plan_schedule(jobs, max_workers=max_workers, ram_fraction=ram_fraction, memory_budget_gb=memory_budget_gb)
+    workers = plan["workers"]
+    budget = plan["budget_bytes"] or 0
+    budget_label = f"{budget / 1e9:.1f} GB" if budget else "unknown"
+    print(f"🧮 Scheduler: {workers} worker(s) x {plan['threads_per_worker']} threads, RAM budget {budget_label}")
+
+    tunings = [tune_job(j, plan) for j in jobs]
+    chunks = sorted(t["chunk_rows"] for t in tunings if t["chunk_rows"])
+    if chunks:
+        chunk_label = f"{chunks[0]:,}" if chunks[0] == chunks[-1] else f"{chunks[0]:,}-{chunks[-1]:,}"
+        print(f"   Streaming chunks: {chunk_label} rows")
+    low_memory = sum(t["low_memory"] for t in tunings)
+    if low_memory:
+        print(f"   🪫 {low_memory} job(s) estimated over the budget will use their low-memory plan")
+
+    results = [None] * len(jobs)
+    pending = sorted(range(len(jobs)), key=lambda i: -jobs[i]["est_bytes"])
+    in_flight = {}
+    reserved = 0
+    finished = 0
+
+    # Spawned children inherit the environment, so the thread share applies from import time
+    previous_threads = os.environ.get("POLARS_MAX_THREADS")
+    os.environ["POLARS_MAX_THREADS"] = str(plan["threads_per_worker"])
+
+    def new_pool():
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(plan["threads_per_worker"],),
+        )
+
+    def failed_record(error):
+        return {"ok": False, "value": None, "error": error, "traceback": None, "seconds": None}
+
+    def finish(idx, record):
+        nonlocal finished
+        finished += 1
+        record["key"] = jobs[idx]["key"]
+        record["est_bytes"] = jobs[idx]["est_bytes"]
+        record["tuning"] = tunings[idx]
+        results[idx] = record
+
+        name = os.path.basename(str(record["key"]))
+        plan_note = " 🪫 low-memory plan" if tunings[idx]["low_memory"] else ""
+        if record["ok"]:
+            print(f"[{finished}/{len(jobs)}] {label} {name}... Done ({record['seconds']:.1f}s){plan_note}")
+        else:
+            print(f"[{finished}/{len(jobs)}] {label} {name}... ❌ FAILED: {record['error']}")
+
+        if on_result is not None:
+            on_result(idx, record)
+
+    pool = new_pool()
+    # A worker killed by the OS (usually out of memory) breaks the whole pool: every job in flight
+    # fails with it, and the remaining ones go to a fresh pool. A pool that breaks before running
+    # anything (nothing to blame) fails the rest of the batch instead of looping.
+    broken, ran_on_pool = False, 0
+    try:
+        while pending or in_flight:
+            # Admit as many jobs as the RAM budget allows
+            while pending and len(in_flight) < workers and not broken:
+                fit = next((i for i in pending if not budget or reserved + jobs[i]["est_bytes"] <= budget), None)
+                if fit is None:
+                    if in_flight:
+                        break
+                    fit = pending[0]
+
+                try:
+                    future = pool.submit(_run_job, task_fn, jobs[fit]["args"], tunings[fit])
+                except BrokenProcessPool:
+                    broken = True
+                    break
+                pending.remove(fit)
+                in_flight[future] = fit
+                reserved += jobs[fit]["est_bytes"]
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED) if in_flight else (set(), None)
+            for future in done:
+                idx = in_flight.pop(future)
+                reserved -= jobs[idx]["est_bytes"]
+                ran_on_pool += 1
+
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    # Usually the OS killed a worker for running out of memory
+                    broken = True
+                    record = failed_record(f"BrokenProcessPool: {e}")
+                finish(idx, record)
+
+            if broken and not in_flight and pending:
+                pool.shutdown(wait=False, cancel_futures=True)
+                if not ran_on_pool:
+                    for idx in list(pending):
+                        pending.remove(idx)
+                        finish(idx, failed_record("BrokenProcessPool: the worker pool could not be restarted"))
+                    break
+                print(f"   ♻️ Worker pool broke, restarting it for {len(pending)} remaining job(s)")
+                pool = new_pool()
+                broken, ran_on_pool = False, 0
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if previous_threads is None:
+            os.environ.pop("POLARS_MAX_THREADS", None)
+        else:
+            os.environ["POLARS_MAX_THREADS"] = previous_threads
+
+    return results
+
+
+def run_file_tasks(task_fn, files, task_args=(), expansion=DEFAULT_EXPANSION, **kwargs):
+    """Convenience wrapper: one job per file, sized from the file on disk."""
+    return run_tasks(task_fn, make_file_jobs(files, task_args, expansion), **kwargs)
+
+
+def report_failures(results):
+    """Prints a summary of failed jobs and returns them."""
+    failures = [r for r in results if not r["ok"]]
+    if failures:
+        print(f"\n⚠️ {len(failures)} of {len(results)} task(s) failed:")
+        for r in failures:
+            print(f"   - {os.path.basename(str(r['key']))}: {r['error']}")
+    return failures
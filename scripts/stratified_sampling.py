@@ -1,47 +1,221 @@
 import polars as pl
+import numpy as np
 import os
-import glob
 import time
-import gc
+import shutil
+
+from scheduler import run_tasks, run_file_tasks, make_file_jobs, report_failures
+from tlc_schema import scan_dataset
+from catalog import partitions, dataset_root
+from manifest import temp_path, commit_files, discard_temp_files
+from profiling import task_name, safe_name
 
 # ==============================================================================
 # ⚙️ CONFIGURATION
 # ==============================================================================
-INPUT_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\HVFHV subsets 2019-2025 - Processed"
-OUTPUT_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\HVFHV subsets 2019-2025 - Samples"
-
-# Fraction of data to keep (0.01 = 1%, 0.10 = 10%)
-SAMPLE_FRACTION = 0.01
+# Reads the "processed" dataset in place
+INPUT_DATASET = "processed"
+
+# Nested samples drawn in one scan: fraction -> catalog dataset it is written to (see catalog.DATASETS).
+# A trip is kept when the hash of its content falls under its stratum's rate x 2^64, and rates only
+# grow with the fraction, so each sample is a strict subset of the next larger one.
+SAMPLES = {
+    0.01: "samples",
+    0.05: "samples_5pct",
+    0.10: "samples_10pct",
+}
 
 # Options: "yearly", "monthly", "single"
 SPLIT_MODE = "yearly"
 
-# Seed for reproducibility (Ensures you get the exact same sample every time)
+# Strata: each month is split on these columns and every stratum is sampled at its own rate
+# ([] = one stratum per month, i.e. a uniform sample)
+STRATA = ["trip_archetype", "borough_flow_type", "weather_state", "pickup_hour"]
+
+# How a month's sample size (fraction x its trips) is shared between its strata:
+#   "proportional": n_h ~ N_h, the same rate everywhere (the plain random sample, spread evenly)
+#   "equal":        the same n_h for every stratum, so rare strata get as many rows as common ones
+#   "neyman":       n_h ~ N_h x S_h, S_h the std of NEYMAN_COLUMN in the stratum (most precise means)
+# Only "proportional" keeps the samples representative as they are. With "equal" or "neyman", unweighted
+# statistics over-represent rare strata: weigh by sample_weight (the audit and drift reports don't).
+ALLOCATION = "proportional"
+NEYMAN_COLUMN = "total_rider_cost"
+
+# Expected rows kept from every stratum at least (all of it when smaller), so rare ones never vanish
+MIN_PER_STRATUM = 2
+
+# Per-stratum sizes, rates and weights, written next to each sample
+ALLOCATION_FILE = "_allocation.csv"
+
+# Seed of the row hash (Ensures you get the exact same sample every time). The hash is our own
+# (splitmix64 over the column values, see row_hash), not Polars', so it doesn't change with the library version
 RANDOM_SEED = 105
 
-# Performance
-os.environ["POLARS_MAX_THREADS"] = "14"
+# Columns that identify a trip, hashed together (those missing from the input are skipped). Content,
+# not position: a month gives the same sample whether it is read whole or in shards.
+HASH_COLUMNS = [
+    "pickup_datetime",
+    "dropoff_datetime",
+    "PULocationID",
+    "DOLocationID",
+    "base_passenger_fare",
+    "driver_pay",
+    "tips",
+    "trip_km",
+]
+
+# Floats are hashed as round(value * HASH_FLOAT_SCALE): exact for fares and distances, whatever their dtype
+HASH_FLOAT_SCALE = 10_000
+
+# Per-file samples wait here (under each output root) until their year/month/full file is assembled
+PARTS_DIR = "_parts"
+
+# Memory Budget (GB); None = scheduler.DEFAULT_RAM_FRACTION of the free RAM (threads follow from it)
+MEMORY_BUDGET_GB = None
 # ==============================================================================
 
 
+# --- 1. Allocation ---
+def stratum_stats(file_path, strata, value_column=None):
+    """Trips per stratum of one file, with the sums behind `value_column`'s std when given (streaming)."""
+    lf = scan_dataset(file_path)
+    aggs = [pl.len().alias("rows")]
+    if value_column:
+        v = pl.col(value_column).cast(pl.Float64)
+        aggs += [v.count().alias("n"), v.sum().alias("sum"), (v * v).sum().alias("sumsq")]
+    lf = lf.group_by(strata).agg(aggs) if strata else lf.select(aggs)
+    return lf.collect(engine="streaming")
+
+
+def allocate(rows, scores, sample_size, min_rows):
+    """
+    Expected sample rows per stratum: n_h = clip(lam x score_h, min(min_rows, N_h), N_h), with lam
+    set so they add up to `sample_size` (more when the minimums alone exceed it, zero-score strata
+    topped up when the others are exhausted). n_h never shrinks as `sample_size` grows, which keeps
+    samples of growing fractions nested.
+    """
+    low = np.minimum(min_rows, rows)
+    if scores.sum() <= 0:
+        scores = rows  # e.g. Neyman on a constant column: nothing to weigh by, fall back to proportional
+    if low.sum() >= sample_size:
+        return low
+    if sample_size >= rows.sum():
+        return rows
+
+    def sizes(lam):
+        return np.clip(lam * scores, low, rows)
+
+    # Past `full`, every stratum with a score is taken whole
+    positive = scores > 0
+    full = (rows[positive] / scores[positive]).max()
+    if sizes(full).sum() < sample_size:
+        # The rest goes to the zero-score strata (e.g. Neyman on one-trip or constant strata), in
+        # proportion to the trips they have left
+        n = sizes(full)
+        room = rows - n
+        return n + room * (sample_size - n.sum()) / room.sum()
+
+    lo, hi = 0.0, full
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        lo, hi = (mid, hi) if sizes(mid).sum() < sample_size else (lo, mid)
+    return sizes(hi)
+
+
+def allocation_table(stats, fractions, allocation, min_rows):
+    """
+    One row per month and stratum: its trips ("rows") and, per fraction, the expected sample rows
+    ("expected_<k>") and the rate every trip of the stratum is kept at ("rate_<k>").
+    """
+    if allocation not in ("proportional", "equal", "neyman"):
+        raise ValueError(f"Unknown allocation '{allocation}' (use 'proportional', 'equal' or 'neyman')")
+
+    if allocation == "neyman":
+        std = ((pl.col("sumsq") - pl.col("sum") ** 2 / pl.col("n")) / (pl.col("n") - 1)).clip(lower_bound=0).sqrt()
+        stats = stats.with_columns(std.fill_nan(None).fill_null(0.0).alias("std"))
+
+    frames = []
+    for (period,), month in stats.partition_by("period", as_dict=True, maintain_order=True).items():
+        rows = month["rows"].to_numpy().astype(np.float64)
+        if allocation == "proportional":
+            scores = rows
+        elif allocation == "equal":
+            scores = np.ones_like(rows)
+        else:
+            scores = rows * month["std"].to_numpy()
+
+        cols = {}
+        for k, fraction in enumerate(fractions):
+            expected = allocate(rows, scores, fraction * rows.sum(), min_rows)
+            cols[f"expected_{k}"] = expected
+            cols[f"rate_{k}"] = expected / rows
+        frames.append(month.drop("n", "sum", "sumsq", "std", strict=False).with_columns(**{c: pl.Series(v) for c, v in cols.items()}))
+    return pl.concat(frames)
+
+
+# --- 2. Sampling ---
+def hash_key(col, dtype):
+    """A column as Int64 with the same value on every Polars version (nulls -> Int64 min)."""
+    if dtype == pl.Datetime:
+        key = pl.col(col).dt.epoch("us")
+    elif dtype.is_float():
+        key = (pl.col(col).cast(pl.Float64) * HASH_FLOAT_SCALE).round()
+    elif dtype.is_integer() or dtype in (pl.Boolean, pl.Date):
+        key = pl.col(col)
+    else:
+        raise ValueError(f"Hash column '{col}' has unsupported dtype {dtype}")
+    return key.cast(pl.Int64).fill_null(-(2**63)).alias(col)
+
+
+def splitmix64(x):
+    """splitmix64 finalizer on a uint64 array (wrapping arithmetic, as specified)."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def row_hash(schema, seed=RANDOM_SEED, hash_columns=None):
+    """
+    UInt64 hash of a trip's identifying columns, uniform over the range. Computed with numpy
+    from canonical Int64 values (see hash_key), so a Polars upgrade never changes the samples.
+    """
+    cols = [c for c in (hash_columns or HASH_COLUMNS) if c in schema]
+    if not cols:
+        raise ValueError(f"None of the hash columns {hash_columns or HASH_COLUMNS} are in the input")
+
+    def combine(keys):
+        frame = keys.struct.unnest()
+        h = np.full(len(frame), seed, dtype=np.uint64)
+        for c in cols:
+            h = splitmix64(h ^ splitmix64(frame[c].to_numpy().view(np.uint64)))
+        return pl.Series(keys.name, h, dtype=pl.UInt64)
+
+    keys = pl.struct([hash_key(c, schema[c]) for c in cols])
+    return keys.map_batches(combine, return_dtype=pl.UInt64, is_elementwise=True)
+
+
+def keep_threshold(rate):
+    """UInt64 bound under which a row hash falls with probability `rate`."""
+    return pl.when(rate >= 1).then(pl.lit(2**64 - 1, dtype=pl.UInt64)).otherwise((rate * 2.0**64).cast(pl.UInt64))
+
+
 class SamplingEngine:
-    def __init__(self, mode, output_dir):
+    def __init__(self, mode, output_dirs):
         self.mode = mode
-        self.output_dir = output_dir
-        self.buffer = []
+        self.output_dirs = output_dirs  # One per sample fraction, smallest first
+        self.buffer = []  # Per-file part paths, one list per output dir
         self.current_group_key = None  # Tracks Year or Filename depending on mode
 
-        os.makedirs(output_dir, exist_ok=True)
+        for output_dir in output_dirs:
+            os.makedirs(output_dir, exist_ok=True)
 
     def flush(self):
-        """Writes the current buffer to disk and clears memory."""
+        """Assembles the buffered parts of the current group into one file per sample, streaming."""
         if not self.buffer:
             return
 
-        print(f"   💾 Flushing buffer to disk ({len(self.buffer)} chunks)...", end="")
-
-        # Concatenate buffer
-        df_chunk = pl.concat(self.buffer)
+        print(f"   💾 Flushing {len(self.buffer)} file(s) of {self.current_group_key}...")
 
         # Determine Filename
         if self.mode == "single":
@@ -51,21 +225,23 @@ class SamplingEngine:
         elif self.mode == "monthly":
             fname = f"tlc_sample_{self.current_group_key}.parquet"
 
-        out_path = os.path.join(self.output_dir, fname)
+        for k, output_dir in enumerate(self.output_dirs):
+            parts = [paths[k] for paths in self.buffer]
+            out_path = os.path.join(output_dir, fname)
 
-        # For 'single' mode, we might need to append if memory is tight,
-        # but for 1-10% samples, writing once at the end (or checking existing) is safer.
-        # Here, if file exists and we are in 'yearly' loop (unlikely with logic below), we overwrite.
-
-        df_chunk.write_parquet(out_path)
-        print(f" Saved: {fname} ({len(df_chunk):,} rows)")
+            # Parts are concatenated from disk, so a year of 10% samples never sits in memory
+            lf = pl.concat([pl.scan_parquet(p) for p in parts], how="diagonal_relaxed")
+            lf.sink_parquet(temp_path(out_path))
+            commit_files([(temp_path(out_path), out_path)])
+            rows = pl.scan_parquet(out_path).select(pl.len()).collect().item()
+            discard_temp_files(parts)
+            print(f"      Saved: {os.path.relpath(out_path, self.output_dirs[0])} ({rows:,} rows)")
 
         # cleanup
         self.buffer = []
-        gc.collect()
 
-    def add_chunk(self, df, key):
-        """Adds data to buffer. Flushes if the group key changes (e.g. Year changes)."""
+    def add_chunk(self, part_paths, key):
+        """Adds a file's parts to the buffer. Flushes if the group key changes (e.g. Year changes)."""
 
         # Initialize key on first run
         if self.current_group_key is None:
@@ -77,90 +253,172 @@ class SamplingEngine:
             self.flush()
             self.current_group_key = key
 
-        elif self.mode == "monthly":
+        elif self.mode == "monthly" and key != self.current_group_key:
+            # Shards of one month arrive back to back, so a month flushes once it is complete
+            self.flush()
             self.current_group_key = key
-            self.buffer.append(df)
-            self.flush()  # Monthly flushes immediately
-            return
 
         # Add to buffer
-        self.buffer.append(df)
-
-
-def extract_metadata(filename):
-    """Extracts YYYY and YYYY-MM from filename 'tlc_uber_2019-01.parquet'"""
-    base = os.path.basename(filename).replace(".parquet", "")
-    parts = base.split("_")[-1].split("-")  # ['2019', '01']
-    year = parts[0]
-    month = parts[1]
-    return year, f"{year}-{month}"
+        self.buffer.append(part_paths)
+
+
+def sample_file(file_path, fractions, parts_dirs, rates, strata, seed=RANDOM_SEED, hash_columns=None):
+    """
+    Draws every sample of one file in a single streaming scan and writes each to its parts dir.
+    `rates` holds the keep rate of each stratum of the file's month per fraction ("rate_<k>"); a
+    kept trip gets sample_weight = 1 / rate (the trips it stands for).
+    Returns (part paths, rows in, rows per sample).
+    """
+    # Load File
+    lf = scan_dataset(file_path)
+    h = row_hash(lf.collect_schema(), seed, hash_columns)
+    rate_cols = [f"rate_{k}" for k in range(len(fractions))]
+    rates = rates.lazy().select(strata + rate_cols)
+
+    # Every trip gets its stratum's rates (a small lookup), then rows under the largest threshold are
+    # the only ones that go further; the smaller samples are subsets of them. Sinks and counts share
+    # the one scan (never collected whole).
+    lf_hashed = lf.with_columns(h.alias("_sample_hash"))
+    if strata:
+        lf_hashed = lf_hashed.join(rates, on=strata, how="left", nulls_equal=True, maintain_order="left")
+    else:
+        lf_hashed = lf_hashed.join(rates, how="cross")
+    keep = [pl.col("_sample_hash") < keep_threshold(pl.col(c)) for c in rate_cols]
+    lf_kept = lf_hashed.filter(keep[-1])
+
+    name = safe_name(os.path.splitext(task_name(file_path))[0]) + ".parquet"
+    part_paths = [os.path.join(d, name) for d in parts_dirs]
+    sinks = [
+        lf_kept.filter(kept)
+        .with_columns((1 / pl.col(c)).alias("sample_weight"))
+        .drop("_sample_hash", *rate_cols)
+        .sink_parquet(temp_path(p), lazy=True)
+        for kept, c, p in zip(keep, rate_cols, part_paths)
+    ]
+    lf_counts = lf_hashed.select(
+        pl.len().alias("rows_in"),
+        *[kept.sum().alias(f"rows_{k}") for k, kept in enumerate(keep)],
+    )
+    counts = pl.collect_all(sinks + [lf_counts], engine="streaming")[-1].row(0)
+    commit_files([(temp_path(p), p) for p in part_paths])
+
+    return part_paths, counts[0], list(counts[1:])
 
 
 def main():
+    fractions = sorted(SAMPLES)
     print(f"🚀 Orion: Initializing Stratified Sampler")
     print(f"   Mode: {SPLIT_MODE.upper()}")
-    print(f"   Rate: {SAMPLE_FRACTION * 100}%")
+    print(f"   Rates: {' ⊂ '.join(f'{f * 100:g}%' for f in fractions)}")
+    print(f"   Strata: {', '.join(STRATA) or 'none'} ({ALLOCATION} allocation)")
     print(f"   Seed: {RANDOM_SEED}")
-
-    files = sorted(glob.glob(os.path.join(INPUT_DIR, "*.parquet")))
+    if not all(0 < f <= 1 for f in fractions):
+        raise ValueError(f"Sample fractions must be in (0, 1], got {fractions}")
+
+    # Year & month come from the catalog partition, not the file name (shards share a month)
+    periods = {}
+    for p in partitions(INPUT_DATASET):
+        if p["month"] is None:
+            continue
+        for f in p["files"]:
+            periods[f] = (str(p["year"]), f"{p['year']}-{p['month']:02d}")
+
+    files = list(periods)
     if not files:
         print("❌ No files found.")
         return
 
-    engine = SamplingEngine(SPLIT_MODE, OUTPUT_DIR)
+    output_dirs = [dataset_root(SAMPLES[f]) for f in fractions]
+    parts_dirs = [os.path.join(d, PARTS_DIR) for d in output_dirs]
+    for d in parts_dirs:
+        os.makedirs(d, exist_ok=True)
+    engine = SamplingEngine(SPLIT_MODE, output_dirs)
 
     total_rows_in = 0
-    total_rows_out = 0
+    total_rows_out = [0] * len(fractions)
     start_time = time.time()
 
-    for i, f in enumerate(files, 1):
-        filename = os.path.basename(f)
-        year, yyyy_mm = extract_metadata(filename)
-
-        print(f"[{i}/{len(files)}] Sampling {filename}...", end="", flush=True)
-
-        try:
-            # Load File
-            lf = pl.scan_parquet(f)
-
-            # Stratified Random Sample
-            # We collect() here because sampling a LazyFrame often requires loading into memory anyway
-            # to ensure exact row counts and seed stability per file.
-            df = lf.collect()
-            rows_in = len(df)
-
-            # Apply Sample
-            df_sample = df.sample(fraction=SAMPLE_FRACTION, seed=RANDOM_SEED)
-            rows_out = len(df_sample)
-
-            # Update Stats
-            total_rows_in += rows_in
-            total_rows_out += rows_out
-
-            # Pass to Engine
-            # Key depends on mode:
-            # Yearly -> Pass '2019'
-            # Monthly -> Pass '2019-01'
-            # Single -> Pass 'ALL' (Dummy key)
-
-            group_key = year if SPLIT_MODE == "yearly" else yyyy_mm
-            if SPLIT_MODE == "single":
-                group_key = "ALL"
-
-            engine.add_chunk(df_sample, group_key)
-
-            print(f" Done. ({rows_out:,} / {rows_in:,} rows)")
-
-        except Exception as e:
-            print(f" ❌ Failed: {e}")
+    # Pass 1: stratum sizes (and stds) per month, shards of a month summed
+    value_column = NEYMAN_COLUMN if ALLOCATION == "neyman" else None
+    counted = run_file_tasks(
+        stratum_stats,
+        files,
+        task_args=(STRATA, value_column),
+        label="Counting strata",
+        memory_budget_gb=MEMORY_BUDGET_GB,
+    )
+    report_failures(counted)
+    counted = [(f, res) for f, res in zip(files, counted) if res["ok"]]
+    if not counted:
+        return
+    stats = (
+        pl.concat([res["value"].with_columns(period=pl.lit(periods[f][1])) for f, res in counted])
+        .group_by(["period"] + STRATA, maintain_order=True)
+        .agg(pl.all().sum())
+        .sort(["period"] + STRATA, nulls_last=True)
+    )
+    table = allocation_table(stats, fractions, ALLOCATION, MIN_PER_STRATUM)
+    print(f"🧮 {table.height:,} strata in {table['period'].n_unique()} month(s)")
+
+    for k, output_dir in enumerate(output_dirs):
+        path = os.path.join(output_dir, ALLOCATION_FILE)
+        table.select(
+            "period",
+            *STRATA,
+            "rows",
+            pl.col(f"expected_{k}").alias("expected_rows"),
+            pl.col(f"rate_{k}").alias("rate"),
+            (1 / pl.col(f"rate_{k}")).alias("sample_weight"),
+        ).write_csv(temp_path(path))
+        commit_files([(temp_path(path), path)])
+
+    # Pass 2: samples are drawn in parallel, each file with its month's rates; the engine is fed in
+    # file order so yearly buffers stay contiguous
+    files = [f for f, _ in counted]
+    rates = table.partition_by("period", as_dict=True)
+    jobs = make_file_jobs(files)
+    for job in jobs:
+        month_rates = rates[(periods[job["key"]][1],)]
+        job["args"] = (job["key"], fractions, parts_dirs, month_rates, STRATA, RANDOM_SEED, HASH_COLUMNS)
+    results = run_tasks(sample_file, jobs, label="Sampling", memory_budget_gb=MEMORY_BUDGET_GB)
+
+    for f, res in zip(files, results):
+        if not res["ok"]:
+            continue
+
+        year, yyyy_mm = periods[f]
+        part_paths, rows_in, rows_out = res["value"]
+
+        # Update Stats
+        total_rows_in += rows_in
+        total_rows_out = [t + r for t, r in zip(total_rows_out, rows_out)]
+
+        # Pass to Engine
+        # Key depends on mode:
+        # Yearly -> Pass '2019'
+        # Monthly -> Pass '2019-01'
+        # Single -> Pass 'ALL' (Dummy key)
+
+        group_key = year if SPLIT_MODE == "yearly" else yyyy_mm
+        if SPLIT_MODE == "single":
+            group_key = "ALL"
+
+        engine.add_chunk(part_paths, group_key)
 
     # Final Flush (for the last batch in buffer)
     engine.flush()
+    report_failures(results)
+
+    # Parts of failed files are left behind with the folder; the next run rewrites them
+    for d in parts_dirs:
+        if not os.listdir(d):
+            shutil.rmtree(d)
 
     print("\n" + "=" * 50)
     print(f"✅ Sampling Complete in {(time.time() - start_time) / 60:.2f} min")
-    print(f"📉 Reduction: {total_rows_in:,} -> {total_rows_out:,} rows")
-    print(f"💾 Output: {OUTPUT_DIR}")
+    for fraction, rows_out in zip(fractions, total_rows_out):
+        print(f"📉 {fraction * 100:g}%: {total_rows_in:,} -> {rows_out:,} rows ({SAMPLES[fraction]})")
+    print(f"💾 Output: {output_dirs[0]}")
     print("=" * 50)
 
 
@@ -0,0 +1,372 @@
+import polars as pl
+import numpy as np
+import os
+import glob
+import time
+from datetime import datetime
+
+# ==============================================================================
+# 🧪 SYNTHETIC HVFHV GENERATOR
+# Writes raw fhvhv_tripdata_YYYY-MM.parquet files shaped like the TLC downloads (same columns,
+# per-year dtype drift, nulls, Y/N flags, paradox rows) plus an hourly weather CSV, so the whole
+# pipeline can run offline at any row count. Output is deterministic for a given seed.
+# ==============================================================================
+
+# --- Configuration ---
+OUTPUT_DIR = r"./synthetic/HVFHV subsets 2019-2025"
+WEATHER_OUTPUT = r"./synthetic/nyc_weather_hourly_2019_2025.csv"
+ZONE_FILE = r"./taxi_zones_detailed.csv"
+
+PERIODS = ["2019-02", "2020-06", "2022-10", "2025-01"]
+ROWS_PER_MONTH = 1_000_000
+SEED = 42
+
+# Rows generated per batch: bounds the generator's memory whatever the month size
+BATCH_ROWS = 1_000_000
+# The TLC files use ~1M-row row groups (the sharding in process_data splits on them)
+ROW_GROUP_SIZE = 1_000_000
+
+# Platform mix (HV0003 = Uber, HV0005 = Lyft; Juno/Via left the market in 2019-2020)
+LICENSE_MIX = {
+    2019: {"HV0003": 0.70, "HV0005": 0.22, "HV0004": 0.03, "HV0002": 0.05},
+    2020: {"HV0003": 0.72, "HV0005": 0.26, "HV0004": 0.02},
+    "later": {"HV0003": 0.73, "HV0005": 0.27},
+}
+BASES = {"HV0003": ["B02764", "B02872", "B02875", "B03404"], "HV0005": ["B03406"], "HV0004": ["B02800"], "HV0002": ["B03136"]}
+
+# Share of rows turned into each paradox the audit and the Great Filter look for
+PARADOX_RATES = {
+    "time_travel": 0.0005,  # dropoff before pickup
+    "teleport": 0.001,  # > 2 miles in under a minute
+    "zero_pay": 0.0005,  # driver paid $0 for a real trip
+    "negative_fare": 0.0002,  # refunds / adjustments
+    "negative_wait": 0.001,  # request stamped after pickup
+    "unknown_zone": 0.003,  # LocationID 264/265 (Unknown / N/A)
+}
+
+# Relative trips per hour of day (00..23): late-night dip, morning and evening peaks
+HOUR_PROFILE = np.array([
+    0.9, 0.6, 0.4, 0.3, 0.3, 0.5, 0.9, 1.3, 1.5, 1.2, 1.0, 1.0,
+    1.1, 1.1, 1.2, 1.3, 1.5, 1.7, 1.8, 1.6, 1.4, 1.3, 1.2, 1.1,
+])
+# Mon..Sun
+DOW_PROFILE = np.array([0.9, 0.95, 1.0, 1.05, 1.2, 1.25, 1.0])
+# Typical speed (mph) per hour of day: slowest at the peaks
+HOUR_SPEED_MPH = np.array([
+    19, 21, 22, 23, 23, 21, 17, 13, 11, 12, 12, 12,
+    12, 12, 12, 11, 10, 10, 11, 13, 15, 16, 17, 18,
+], dtype=float)
+
+# Zone demand weight by borough; the airports get their own boost
+BOROUGH_WEIGHT = {"Manhattan": 4.0, "Brooklyn": 1.6, "Queens": 1.4, "Bronx": 1.0, "Staten Island": 0.25, "EWR": 0.05}
+AIRPORT_BOOST = {132: 25.0, 138: 18.0, 1: 1.0}
+# ==============================================================================
+
+
+# --- 1. Raw Schema Drift ---
+def raw_schema(year, month):
+    """
+    Column dtypes of a TLC file for that month. What drifts across the real downloads: the
+    timestamp unit, airport_fee (all-null before 2022), congestion_surcharge (not charged
+    before Feb 2019) and cbd_congestion_fee (added Jan 2025).
+    """
+    ts = pl.Datetime("ns") if year < 2023 else pl.Datetime("us")
+    schema = {
+        "hvfhs_license_num": pl.String,
+        "dispatching_base_num": pl.String,
+        "originating_base_num": pl.String,
+        "request_datetime": ts,
+        "on_scene_datetime": ts,
+        "pickup_datetime": ts,
+        "dropoff_datetime": ts,
+        "PULocationID": pl.Int64,
+        "DOLocationID": pl.Int64,
+        "trip_miles": pl.Float64,
+        "trip_time": pl.Int64,
+        "base_passenger_fare": pl.Float64,
+        "tolls": pl.Float64,
+        "bcf": pl.Float64,
+        "sales_tax": pl.Float64,
+        "congestion_surcharge": pl.Float64 if (year, month) >= (2019, 2) else pl.Null,
+        "airport_fee": pl.Float64 if year >= 2022 else pl.Null,
+        "tips": pl.Float64,
+        "driver_pay": pl.Float64,
+        "shared_request_flag": pl.String,
+        "shared_match_flag": pl.String,
+        "access_a_ride_flag": pl.String,
+        "wav_request_flag": pl.String,
+        "wav_match_flag": pl.String,
+    }
+    if year >= 2025:
+        schema["cbd_congestion_fee"] = pl.Float64
+    return schema
+
+
+# --- 2. Zones & Calendar ---
+def load_zone_weights(zone_file=ZONE_FILE):
+    """(zone ids, demand weights, Manhattan mask) for IDs 1..263; uniform when the zone file is missing."""
+    ids = np.arange(1, 264)
+    if not os.path.exists(zone_file):
+        return ids, np.full(len(ids), 1 / len(ids)), np.zeros(len(ids), dtype=bool)
+
+    zones = pl.read_csv(zone_file).unique("LocationID", keep="first").filter(pl.col("LocationID").is_between(1, 263))
+    borough = dict(zip(zones["LocationID"].to_list(), zones["Borough"].to_list()))
+    weights = np.array([BOROUGH_WEIGHT.get(borough.get(i), 0.5) * AIRPORT_BOOST.get(i, 1.0) for i in ids])
+    manhattan = np.array([borough.get(i) == "Manhattan" for i in ids])
+    return ids, weights / weights.sum(), manhattan
+
+
+def hour_weights(year, month):
+    """Start of every hour in the month and its share of the month's trips."""
+    start = datetime(year, month, 1)
+    end = datetime(year + (month == 12), month % 12 + 1, 1)
+    hours = np.arange(np.datetime64(start, "h"), np.datetime64(end, "h"))
+    hod = (hours - hours.astype("datetime64[D]")).astype(int)
+    dow = (hours.astype("datetime64[D]").view("int64") + 3) % 7  # 1970-01-01 was a Thursday
+    w = HOUR_PROFILE[hod] * DOW_PROFILE[dow]
+    return hours.astype("datetime64[us]"), w / w.sum()
+
+
+def license_mix(year):
+    return LICENSE_MIX.get(year, LICENSE_MIX["later"])
+
+
+# --- 3. Trip Generator ---
+def generate_batch(rng, year, month, pickup_hours, zones):
+    """One trip per entry of `pickup_hours` (the start of its pickup hour), as numpy columns."""
+    zone_ids, zone_p, manhattan = zones
+    n = len(pickup_hours)
+
+    # Time: a uniform instant inside each trip's hour, kept in pickup order
+    pickup = np.sort(pickup_hours + rng.integers(0, 3_600_000_000, n).astype("timedelta64[us]"))
+    hod = ((pickup - pickup.astype("datetime64[D]")) // np.timedelta64(1, "h")).astype(int)
+
+    # Platform
+    mix = license_mix(year)
+    lic = rng.choice(list(mix), n, p=list(mix.values()))
+    dispatch = np.empty(n, dtype="<U6")
+    for code, bases in BASES.items():
+        mask = lic == code
+        dispatch[mask] = rng.choice(bases, mask.sum())
+    origin = pl.Series(dispatch).scatter(np.flatnonzero(rng.random(n) < 0.25), None)
+
+    # Space: heavy-tailed zone popularity, same-zone trips a little more likely than chance
+    pu_idx = rng.choice(len(zone_ids), n, p=zone_p)
+    do_idx = np.where(rng.random(n) < 0.08, pu_idx, rng.choice(len(zone_ids), n, p=zone_p))
+    pu, do = zone_ids[pu_idx], zone_ids[do_idx]
+
+    # Physics: lognormal distance, hour-dependent speed, trip_time a little off the timestamps
+    miles = np.round(rng.lognormal(1.2, 0.75, n), 3)
+    speed = HOUR_SPEED_MPH[hod] * rng.lognormal(0, 0.25, n)
+    seconds = np.maximum(60, miles / speed * 3600 + rng.normal(120, 60, n)).astype(np.int64)
+    dropoff = pickup + (seconds + rng.integers(-30, 30, n)).astype("timedelta64[s]")
+
+    # Service: request -> driver on scene -> pickup
+    wait = rng.gamma(2.0, 150, n).astype(np.int64)
+    request = pickup - wait.astype("timedelta64[s]")
+    on_scene = (request + (wait * rng.uniform(0.5, 0.95, n)).astype("timedelta64[s]")).astype("datetime64[us]")
+    on_scene_null = (lic != "HV0003") & (rng.random(n) < 0.6) | (rng.random(n) < 0.01)
+
+    # Economics (base fare grows ~4%/year, surge noise on top)
+    inflation = 1.04 ** (year - 2019)
+    fare = (2.5 + 1.4 * miles + 0.45 * seconds / 60) * inflation * rng.lognormal(0, 0.25, n)
+    fare = np.round(fare, 2)
+    tolls = np.where(rng.random(n) < 0.06, rng.choice([6.55, 6.94, 10.17, 17.0], n), 0.0)
+    tips = np.where(rng.random(n) < 0.12 + 0.03 * (year - 2019), np.round(fare * rng.uniform(0.1, 0.3, n), 2), 0.0)
+    driver_pay = np.round(fare * rng.beta(14, 5, n), 2)
+    bcf = np.round(fare * 0.0275, 2)
+    sales_tax = np.round(fare * 0.08875, 2)
+    touches_manhattan = manhattan[pu_idx] | manhattan[do_idx]
+    congestion = np.where(touches_manhattan, 2.75, 0.0)
+    congestion_null = rng.random(n) < 0.002
+    airport = np.where(np.isin(pu, [132, 138]) | np.isin(do, [132, 138]), 2.5, 0.0)
+    cbd = np.where(manhattan[pu_idx] & (rng.random(n) < 0.8), 1.5, 0.0)
+
+    # Flags: pooling stopped in March 2020, WAV is rare, blank access_a_ride on non-Uber rows
+    shared_rate = 0.07 if (year, month) < (2020, 3) else 0.0
+    shared_req = rng.random(n) < shared_rate
+    shared_match = shared_req & (rng.random(n) < 0.6)
+    wav_req = rng.random(n) < 0.006
+    wav_match = wav_req & (rng.random(n) < 0.8) | (rng.random(n) < 0.05)
+
+    cols = {
+        "hvfhs_license_num": lic,
+        "dispatching_base_num": dispatch,
+        "originating_base_num": origin,
+        "request_datetime": request,
+        "on_scene_datetime": np.where(on_scene_null, np.datetime64("NaT"), on_scene),
+        "pickup_datetime": pickup,
+        "dropoff_datetime": dropoff,
+        "PULocationID": pu,
+        "DOLocationID": do,
+        "trip_miles": miles,
+        "trip_time": seconds,
+        "base_passenger_fare": fare,
+        "tolls": tolls,
+        "bcf": bcf,
+        "sales_tax": sales_tax,
+        "congestion_surcharge": np.where(congestion_null, np.nan, congestion),
+        "airport_fee": airport,
+        "tips": tips,
+        "driver_pay": driver_pay,
+        "shared_request_flag": np.where(shared_req, "Y", "N"),
+        "shared_match_flag": np.where(shared_match, "Y", "N"),
+        "access_a_ride_flag": np.where(lic == "HV0003", "N", " "),
+        "wav_request_flag": np.where(wav_req, "Y", "N"),
+        "wav_match_flag": np.where(wav_match, "Y", "N"),
+        "cbd_congestion_fee": cbd,
+    }
+    inject_paradoxes(rng, cols, n)
+    return cols
+
+
+def inject_paradoxes(rng, cols, n):
+    """Overwrites a random share of rows with each paradox in PARADOX_RATES (in place)."""
+
+    def pick(rate):
+        return rng.random(n) < rate
+
+    m = pick(PARADOX_RATES["time_travel"])
+    cols["dropoff_datetime"][m] = cols["pickup_datetime"][m] - rng.integers(60, 3600, m.sum()).astype("timedelta64[s]")
+
+    m = pick(PARADOX_RATES["teleport"])
+    cols["trip_miles"][m] = np.round(rng.uniform(2.5, 30, m.sum()), 3)
+    cols["trip_time"][m] = rng.integers(1, 60, m.sum())
+    cols["dropoff_datetime"][m] = cols["pickup_datetime"][m] + cols["trip_time"][m].astype("timedelta64[s]")
+
+    m = pick(PARADOX_RATES["zero_pay"])
+    cols["driver_pay"][m] = 0.0
+
+    m = pick(PARADOX_RATES["negative_fare"])
+    cols["base_passenger_fare"][m] = -np.abs(cols["base_passenger_fare"][m])
+
+    m = pick(PARADOX_RATES["negative_wait"])
+    cols["request_datetime"][m] = cols["pickup_datetime"][m] + rng.integers(1, 600, m.sum()).astype("timedelta64[s]")
+
+    m = pick(PARADOX_RATES["unknown_zone"])
+    cols["PULocationID"][m] = rng.choice([264, 265], m.sum())
+
+
+def to_frame(cols, schema):
+    """Numpy columns -> DataFrame with the month's raw dtypes (missing columns dropped, drifted ones nulled)."""
+    df = pl.DataFrame({c: cols[c] for c in schema if schema[c] != pl.Null})
+    df = df.with_columns(pl.col(pl.Float64).fill_nan(None))
+    return df.with_columns([
+        pl.lit(None).alias(c) if dtype == pl.Null else pl.col(c).cast(dtype) for c, dtype in schema.items()
+    ]).select(list(schema))
+
+
+def generate_month(year, month, n_rows, output_dir=OUTPUT_DIR, seed=SEED, zones=None):
+    """
+    Writes fhvhv_tripdata_YYYY-MM.parquet with `n_rows` trips, generated BATCH_ROWS at a time
+    walking through the month hour by hour (batches go to temp files and are streamed into one).
+    """
+    zones = zones or load_zone_weights()
+    rng = np.random.default_rng([seed, year, month])
+    schema = raw_schema(year, month)
+    hours, weights = hour_weights(year, month)
+
+    # Trips per hour for the whole month, then batches walk through the hours in order
+    per_hour = rng.multinomial(n_rows, weights)
+    bounds = np.concatenate([[0], np.cumsum(per_hour)])
+
+    os.makedirs(output_dir, exist_ok=True)
+    target = os.path.join(output_dir, f"fhvhv_tripdata_{year}-{month:02d}.parquet")
+    parts = []
+    try:
+        for k, start in enumerate(range(0, n_rows, BATCH_ROWS)):
+            stop = min(start + BATCH_ROWS, n_rows)
+            h0 = np.searchsorted(bounds, start, side="right") - 1
+            h1 = np.searchsorted(bounds, stop, side="left")
+            batch_hours = np.repeat(hours[h0:h1], per_hour[h0:h1])[start - bounds[h0] : stop - bounds[h0]]
+            cols = generate_batch(rng, year, month, batch_hours, zones)
+            part = f"{target}.batch-{k:05d}"
+            to_frame(cols, schema).write_parquet(part)
+            parts.append(part)
+
+        pl.scan_parquet(parts).sink_parquet(target + ".tmp", row_group_size=ROW_GROUP_SIZE)
+        os.replace(target + ".tmp", target)
+    finally:
+        for p in parts:
+            if os.path.exists(p):
+                os.remove(p)
+
+    return target
+
+
+# --- 4. Weather ---
+def generate_weather(path=WEATHER_OUTPUT, start=datetime(2019, 1, 1), end=datetime(2026, 1, 1), seed=SEED):
+    """
+    Hourly weather CSV in the Visual Crossing export format process_data reads: seasonal + daily
+    temperature cycle, showers, winter snow, a few missing hours and missing temperatures.
+    """
+    rng = np.random.default_rng([seed, 0])
+    hours = pl.datetime_range(start, end, "1h", closed="left", eager=True)
+    k = len(hours)
+    doy = hours.dt.ordinal_day().to_numpy()
+    hod = hours.dt.hour().to_numpy()
+
+    temp = 12.5 - 11 * np.cos(2 * np.pi * (doy - 20) / 365) - 3 * np.cos(2 * np.pi * (hod - 3) / 24) + rng.normal(0, 2.5, k)
+    raining = rng.random(k) < 0.08
+    cold = temp < 1
+    snowing = cold & (rng.random(k) < 0.06)
+    snowdepth = np.where(cold, rng.gamma(1.0, 4.0, k) * (rng.random(k) < 0.3), 0.0)
+
+    weather = pl.DataFrame({
+        "datetime": hours.dt.strftime("%Y-%m-%dT%H:%M:%S"),
+        "temp": np.where(rng.random(k) < 0.01, np.nan, temp).round(1),
+        "feelslike": (temp - rng.gamma(1.5, 1.2, k)).round(1),
+        "precip": np.where(raining, rng.gamma(0.8, 1.8, k), 0.0).round(2),
+        "snow": np.where(snowing, rng.gamma(1.2, 4.0, k), 0.0).round(2),
+        "snowdepth": snowdepth.round(2),
+        "windspeed": rng.gamma(3.0, 5.0, k).round(1),
+        "visibility": np.clip(16 - rng.gamma(0.6, 3.0, k), 0.1, 16).round(1),
+        "conditions": np.where(snowing, "Snow, Overcast", np.where(raining, "Rain, Overcast", rng.choice(["Clear", "Partially cloudy", "Overcast"], k))),
+        "icon": np.where(snowing, "snow", np.where(raining, "rain", "cloudy")),
+    })
+    # Gaps like the real export: dropped hours and missing temperatures
+    weather = weather.with_columns(pl.col("temp").fill_nan(None)).filter(rng.random(k) > 0.002)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    weather.write_csv(path)
+    return path
+
+
+# --- 5. Main ---
+def parse_period(period):
+    year, month = period.split("-")
+    return int(year), int(month)
+
+
+def generate_dataset(periods=PERIODS, rows_per_month=ROWS_PER_MONTH, output_dir=OUTPUT_DIR, weather_output=WEATHER_OUTPUT, seed=SEED):
+    """Every month in `periods` (skipping files already there) plus the weather CSV. Returns the raw files."""
+    zones = load_zone_weights()
+    files = []
+    for i, period in enumerate(periods, 1):
+        year, month = parse_period(period)
+        target = os.path.join(output_dir, f"fhvhv_tripdata_{year}-{month:02d}.parquet")
+        if os.path.exists(target):
+            print(f"[{i}/{len(periods)}] ⏭️ Exists {os.path.basename(target)}")
+        else:
+            start_t = time.time()
+            generate_month(year, month, rows_per_month, output_dir, seed, zones)
+            print(f"[{i}/{len(periods)}] 🧪 {os.path.basename(target)}: {rows_per_month:,} rows ({time.time() - start_t:.1f}s)")
+        files.append(target)
+
+    if weather_output and not os.path.exists(weather_output):
+        generate_weather(weather_output, seed=seed)
+        print(f"🌦️ Weather -> {weather_output}")
+    return files
+
+
+def main():
+    print("🚀 Orion: Synthetic HVFHV Generator")
+    print(f"📂 Output: {OUTPUT_DIR} ({len(PERIODS)} months x {ROWS_PER_MONTH:,} rows, seed {SEED})")
+    start_t = time.time()
+    generate_dataset()
+    size = sum(os.path.getsize(f) for f in glob.glob(os.path.join(OUTPUT_DIR, "*.parquet")))
+    print(f"✅ Done: {size / 1e6:,.1f} MB in {(time.time() - start_t) / 60:.2f} min")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import polars as pl
+
+# ==============================================================================
+# 📐 CANONICAL SCHEMAS
+# Single source of truth for the dtypes of the raw HVFHV files and of the processed dataset.
+# Every script reads through `scan_dataset` and process_data writes through `conform`, so
+# files written by the pipeline scan back with no cast pass at all.
+# ==============================================================================
+
+# --- 1. Closed Vocabularies (stored as pl.Enum: physical UInt8/UInt32 codes, fixed category order) ---
+BOROUGHS = ["Bronx", "Brooklyn", "EWR", "Manhattan", "Queens", "Staten Island", "Unknown", "N/A"]
+
+BOROUGH = pl.Enum(BOROUGHS)
+BOROUGH_FLOW = pl.Enum([f"{a} -> {b}" for a in BOROUGHS for b in BOROUGHS])
+BOROUGH_FLOW_TYPE = pl.Enum(["manhattan_internal", "manhattan_outer_commute", "outer_inter", "outer_intra"])
+TRIP_TYPE_ZONE = pl.Enum(["intra_zone", "intra_borough", "inter_borough"])
+
+RAIN_INTENSITY = pl.Enum(["none", "light", "moderate", "heavy"])
+SNOW_INTENSITY = pl.Enum(["none", "trace_light", "moderate", "heavy", "severe"])
+WIND_INTENSITY = pl.Enum(["calm", "breezy", "windy", "gale"])
+VISIBILITY_STATUS = pl.Enum(["clear", "reduced", "poor_fog"])
+WEATHER_STATE = pl.Enum(["clear_cloudy", "raining", "snow_on_ground", "snowing"])
+TEMP_BIN = pl.Enum(["freezing", "cold", "mild", "warm", "hot"])
+
+CULTURAL_DAY_TYPE = pl.Enum(["workday", "weekend_night", "weekend_day", "sunday_rest"])
+TIME_OF_DAY_BIN = pl.Enum(["morning_rush", "midday", "evening_rush", "evening", "late_night"])
+PANDEMIC_PHASE = pl.Enum(["pre_pandemic", "lockdown", "recovery", "new_normal"])
+TRIP_ARCHETYPE = pl.Enum(["airport", "commute", "nightlife", "leisure"])
+
+
+# --- 2. Raw TLC Schema (the columns the pipeline consumes) ---
+RAW_SCHEMA = {
+    "hvfhs_license_num": pl.String,
+    "dispatching_base_num": pl.String,
+    "originating_base_num": pl.String,
+    "request_datetime": pl.Datetime("us"),
+    "on_scene_datetime": pl.Datetime("us"),
+    "pickup_datetime": pl.Datetime("us"),
+    "dropoff_datetime": pl.Datetime("us"),
+    "PULocationID": pl.Int32,
+    "DOLocationID": pl.Int32,
+    "trip_miles": pl.Float32,
+    "trip_time": pl.Int32,
+    "base_passenger_fare": pl.Float32,
+    "tolls": pl.Float32,
+    "bcf": pl.Float32,
+    "sales_tax": pl.Float32,
+    "congestion_surcharge": pl.Float32,
+    "airport_fee": pl.Float32,
+    "tips": pl.Float32,
+    "driver_pay": pl.Float32,
+    "shared_request_flag": pl.String,
+    "shared_match_flag": pl.String,
+    "access_a_ride_flag": pl.String,
+    "wav_request_flag": pl.String,
+    "wav_match_flag": pl.String,
+    "cbd_congestion_fee": pl.Float32,
+}
+
+# Schema evolution: columns some months don't have, and the value those months get.
+# - airport_fee, sales_tax, bcf: absent from some early monthly files
+# - cbd_congestion_fee: Congestion Relief Zone toll, added with the 2025-01 files
+# - request flags: missing on a few early files, treated as "not requested"
+RAW_DEFAULTS = {
+    "airport_fee": 0.0,
+    "sales_tax": 0.0,
+    "bcf": 0.0,
+    "cbd_congestion_fee": 0.0,
+    "shared_request_flag": "N",
+    "shared_match_flag": "N",
+    "access_a_ride_flag": "N",
+    "wav_request_flag": "N",
+    "wav_match_flag": "N",
+}
+
+
+# --- 3. Processed Dataset Schema (column order = file column order) ---
+PROCESSED_SCHEMA = {
+    # Raw Survivors
+    "pickup_datetime": pl.Datetime("us"),
+    "dropoff_datetime": pl.Datetime("us"),
+    "PULocationID": pl.Int32,
+    "DOLocationID": pl.Int32,
+    "base_passenger_fare": pl.Float32,
+    "tolls": pl.Float32,
+    "bcf": pl.Float32,
+    "sales_tax": pl.Float32,
+    "congestion_surcharge": pl.Float32,
+    "tips": pl.Float32,
+    "driver_pay": pl.Float32,
+    "shared_request_flag": pl.UInt8,
+    "shared_match_flag": pl.UInt8,
+    "access_a_ride_flag": pl.UInt8,
+    "wav_request_flag": pl.UInt8,
+    "wav_match_flag": pl.UInt8,
+    "airport_fee": pl.Float32,
+    "cbd_congestion_fee": pl.Float32,
+    # Geospatial (OD dimension). Zone names come from the zone file, so they stay open-ended.
+    "pickup_borough": BOROUGH,
+    "pickup_zone": pl.Categorical,
+    "dropoff_borough": BOROUGH,
+    "dropoff_zone": pl.Categorical,
+    "straight_line_dist_km": pl.Float32,
+    "bearing_degrees": pl.Float32,
+    "borough_flow": BOROUGH_FLOW,
+    "borough_flow_type": BOROUGH_FLOW_TYPE,
+    "trip_type_zone": TRIP_TYPE_ZONE,
+    # Physics & Time
+    "trip_km": pl.Float32,
+    "duration_seconds": pl.Int32,
+    "pickup_hour": pl.Int8,
+    "pickup_day": pl.Int8,
+    "pickup_month": pl.Int8,
+    "pickup_year": pl.Int16,
+    "pickup_dow": pl.Int8,
+    "pickup_date": pl.Date,
+    "total_wait_time_min": pl.Float32,
+    "driver_response_time_min": pl.Float32,
+    "boarding_time_min": pl.Float32,
+    "duration_min": pl.Float32,
+    "speed_kmh": pl.Float32,
+    "displacement_speed_kmh": pl.Float32,
+    "tortuosity_index": pl.Float32,
+    # Economics
+    "total_rider_cost": pl.Float32,
+    "cost_per_km": pl.Float32,
+    "driver_revenue_share": pl.Float32,
+    "uber_take_rate_proxy": pl.Float32,
+    "pay_per_hour": pl.Float32,
+    "tipping_pct": pl.Float32,
+    "is_generous_tip": pl.UInt8,
+    "is_subsidized": pl.UInt8,
+    # Hourly Context. Visual Crossing `conditions` are free-text combinations: open-ended.
+    "temp": pl.Float32,
+    "conditions": pl.Categorical,
+    "cyclical_hour_sin": pl.Float32,
+    "cyclical_hour_cos": pl.Float32,
+    "cyclical_month_sin": pl.Float32,
+    "cyclical_month_cos": pl.Float32,
+    "cyclical_day_sin": pl.Float32,
+    "cyclical_day_cos": pl.Float32,
+    "rain_intensity": RAIN_INTENSITY,
+    "snow_intensity": SNOW_INTENSITY,
+    "wind_intensity": WIND_INTENSITY,
+    "visibility_status": VISIBILITY_STATUS,
+    "weather_state": WEATHER_STATE,
+    "is_bad_weather": pl.UInt8,
+    "is_extreme_weather": pl.UInt8,
+    "temp_bin": TEMP_BIN,
+    "cultural_day_type": CULTURAL_DAY_TYPE,
+    "time_of_day_bin": TIME_OF_DAY_BIN,
+    "pandemic_phase": PANDEMIC_PHASE,
+    "trip_archetype": TRIP_ARCHETYPE,
+}
+
+
+# --- 4. Conforming & Reading ---
+def conform(lf, schema, defaults=None, strict=False):
+    """
+    Casts a LazyFrame/DataFrame to the registry dtypes.
+
+    Only columns whose dtype differs are cast, so data that already follows the registry goes
+    through untouched. `defaults` ({column: value}) adds columns the input lacks (schema
+    evolution). With `strict`, the result holds exactly the registry columns, in registry order;
+    otherwise columns outside the registry are kept as they are.
+    """
+    current = lf.collect_schema()
+    exprs = []
+
+    for col, dtype in schema.items():
+        if col in current:
+            if current[col] != dtype:
+                exprs.append(pl.col(col).cast(dtype))
+        elif defaults and col in defaults:
+            exprs.append(pl.lit(defaults[col]).cast(dtype).alias(col))
+
+    if exprs:
+        lf = lf.with_columns(exprs)
+
+    if strict:
+        lf = lf.select(list(schema))
+
+    return lf
+
+
+def is_processed(lf):
+    """True for the processed dataset (and samples of it), False for raw TLC files."""
+    return "trip_archetype" in lf.collect_schema().names()
+
+
+def scan_dataset(source, fill_missing=True):
+    """
+    Lazily scans raw or processed Parquet (a path, glob or list) with canonical dtypes.
+    `fill_missing` applies RAW_DEFAULTS to raw files; turn it off to see what a file really has.
+    """
+    lf = pl.scan_parquet(source)
+    if is_processed(lf):
+        return conform(lf, PROCESSED_SCHEMA)
+    return conform(lf, RAW_SCHEMA, RAW_DEFAULTS if fill_missing else None)
@@ -1,54 +1,119 @@
 import polars as pl
 import os
+import ast
+import sys
 import glob
 import time
-import gc
+import inspect
+from datetime import date, datetime
+
+import marts
+import tlc_schema
+import audit_drift
+from scheduler import run_tasks, current_tuning, report_failures, estimate_task_bytes, parquet_rows
+from tlc_schema import scan_dataset, RAW_SCHEMA, PROCESSED_SCHEMA
+from catalog import select_partitions, dataset_root
+from marts import sketch_bucket, bucket_value, nearest_rank, SKETCH_ALPHA, SKETCH_MIN_VALUE
+from manifest import (
+    TMP_SUFFIX,
+    file_fingerprint,
+    text_fingerprint,
+    load_manifest,
+    save_manifest,
+    stale_reason,
+    make_entry,
+    temp_path,
+    commit_files,
+    discard_temp_files,
+)
+from profiling import stage, save_plans, task_name, safe_name, new_run_id, plan_dir_for, write_run_report, print_stage_summary
 
 # --- Configuration ---
-# Change this to point to Raw OR Processed OR Sample folder
-INPUT_DIR = r"X:\Programming\Python\Projects\Data processing\TLC NYC datasets\HVFHV subsets 2019-2025"
+# Change this to audit Raw OR Processed OR Sample data (catalog dataset name: "raw", "processed", "samples")
+INPUT_DATASET = "raw"
+# Optional inclusive period ("YYYY" or "YYYY-MM"); months outside it are never opened
+START_PERIOD = None
+END_PERIOD = None
 OUTPUT_FILE = "TLC_Universal_Audit_Report_Raw.csv"
 
-# Tuning
-os.environ["POLARS_MAX_THREADS"] = "15"
-
-
-def build_audit_expressions(schema):
+# "exact": sort-based quantiles. "approx": one streaming pass, quantiles read from log-bucket sketches
+# (marts.SKETCH_ALPHA relative error; every other column stays exact). `--approx` on the command line.
+# "metadata" (`--metadata`): row counts, null counts, min and max from the Parquet footers alone, no
+# data page decoded; files whose footers lack a statistic get a full ESCALATION_MODE scan instead.
+AUDIT_MODE = "exact"
+ESCALATION_MODE = "exact"
+
+# Result Cache: each scanned file's report rows are kept under AUDIT_CACHE_DIR/<dataset>/<mode>/, keyed
+# by the file's content and the audit code, so re-runs only scan new or changed files (None = off).
+# Bump the version for anything the code fingerprint can't see.
+AUDIT_CACHE_DIR = r"./audit_cache"
+AUDIT_CACHE_VERSION = 1
+
+# Drift: after the report is saved, line it up with the other tiers' reports (see audit_drift.py)
+DRIFT_AFTER_AUDIT = True
+
+# Memory Budget (GB); None = scheduler.DEFAULT_RAM_FRACTION of the free RAM. Threads and streaming
+# chunk sizes follow from it; files estimated over it are audited on the streaming engine.
+MEMORY_BUDGET_GB = None
+
+# Profiling (opt-in): per-file rows, time & peak memory, query plans and a run report under
+# profiling.PROFILE_DIR
+PROFILE = False
+
+
+# Numeric columns profiled wherever they exist
+AUDIT_TARGETS = [
+    "trip_miles",
+    "trip_km",
+    "trip_time",
+    "duration_seconds",
+    "duration_min",
+    "base_passenger_fare",
+    "driver_pay",
+    "tips",
+    "tolls",
+    "congestion_surcharge",
+    "airport_fee",
+    "bcf",
+    "cbd_congestion_fee",
+    "sales_tax",
+    "speed_kmh",
+    "displacement_speed_kmh",
+    "tortuosity_index",
+    "total_rider_cost",
+    "cost_per_km",
+    "driver_revenue_share",
+    "pay_per_hour",
+    "total_wait_time_min",
+    "driver_response_time_min",
+]
+# Categorical & flag columns (null counts; flags also count their 1s)
+CATEGORICAL_TARGETS = [
+    "weather_state",
+    "trip_archetype",
+    "borough_flow_type",
+    "is_bad_weather",
+    "is_extreme_weather",
+    "is_generous_tip",
+]
+# Raw files have no trip_km: the audit derives it (and the metadata tier its statistics) from miles
+KM_PER_MILE = 1.60934
+
+# Report column suffix -> quantile
+AUDIT_QUANTILES = {"p01": 0.01, "p50": 0.50, "p99": 0.99, "p99.9": 0.999}
+
+
+def build_audit_expressions(schema, quantiles=True):
     """
     Dynamically builds expressions based on what columns exist (Raw vs Processed).
+    `quantiles=False` leaves the quantile columns out (approx mode reads them from sketches).
     """
     exprs = [pl.len().alias("total_rows")]
     cols = set(schema)
 
     # 1. Numerical Deep Dives (Metric Agnostic)
-    # We look for ANY of these potential columns
-    targets = [
-        "trip_miles",
-        "trip_km",
-        "trip_time",
-        "duration_seconds",
-        "duration_min",
-        "base_passenger_fare",
-        "driver_pay",
-        "tips",
-        "tolls",
-        "congestion_surcharge",
-        "airport_fee",
-        "bcf",
-        "cbd_congestion_fee",
-        "sales_tax",
-        "speed_kmh",
-        "displacement_speed_kmh",
-        "tortuosity_index",
-        "total_rider_cost",
-        "cost_per_km",
-        "driver_revenue_share",
-        "pay_per_hour",
-        "total_wait_time_min",
-        "driver_response_time_min",
-    ]
-
-    for col in targets:
+    # We look for ANY of the potential columns
+    for col in AUDIT_TARGETS:
         if col in cols:
             exprs.extend([
                 pl.col(col).null_count().alias(f"{col}_nulls"),
@@ -57,23 +122,13 @@ def build_audit_expressions(schema):
                 pl.col(col).mean().alias(f"{col}_mean"),
                 pl.col(col).std().alias(f"{col}_std"),
                 pl.col(col).min().alias(f"{col}_min"),
-                pl.col(col).quantile(0.01).alias(f"{col}_p01"),
-                pl.col(col).quantile(0.50).alias(f"{col}_p50"),
-                pl.col(col).quantile(0.99).alias(f"{col}_p99"),
-                pl.col(col).quantile(0.999).alias(f"{col}_p99.9"),
-                pl.col(col).max().alias(f"{col}_max"),
             ])
+            if quantiles:
+                exprs.extend(pl.col(col).quantile(q).alias(f"{col}_{name}") for name, q in AUDIT_QUANTILES.items())
+            exprs.append(pl.col(col).max().alias(f"{col}_max"))
 
     # 2. Categorical & Flag Checks
-    cat_targets = [
-        "weather_state",
-        "trip_archetype",
-        "borough_flow_type",
-        "is_bad_weather",
-        "is_extreme_weather",
-        "is_generous_tip",
-    ]
-    for col in cat_targets:
+    for col in CATEGORICAL_TARGETS:
         if col in cols:
             exprs.append(pl.col(col).null_count().alias(f"{col}_nulls"))
             # For flags, count the '1's
@@ -108,93 +163,334 @@ def build_audit_expressions(schema):
     return exprs
 
 
-def process_file(file_path):
+def histogram_queries(lf, group_key, columns):
+    """
+    Approx mode: per month, a log-bucket histogram (see marts.sketch_bucket) of each column as
+    (month, bucket, count, column) rows. Streams with a few hundred groups of state per column.
+    """
+    return [
+        lf.group_by(group_key, sketch_bucket(pl.col(c)).alias("bucket"))
+        .agg(pl.len().alias("count"))
+        .drop_nulls("bucket")
+        .with_columns(pl.lit(c).alias("column"))
+        for c in columns
+    ]
+
+
+def histogram_quantiles(hist, group_key):
+    """AUDIT_QUANTILES of every histogram as report columns (`<column>_p50`...), nearest rank."""
+    ranked = hist.sort([group_key, "column", "bucket"]).with_columns(
+        pl.col("count").cum_sum().over([group_key, "column"]).alias("cum"),
+        pl.col("count").sum().over([group_key, "column"]).alias("n"),
+    )
+    per_column = ranked.group_by([group_key, "column"]).agg([
+        bucket_value(pl.col("bucket").filter(pl.col("cum") > nearest_rank(q, pl.col("n"))).min()).alias(name)
+        for name, q in AUDIT_QUANTILES.items()
+    ])
+    return (
+        per_column.unpivot(index=[group_key, "column"], variable_name="quantile")
+        .with_columns((pl.col("column") + "_" + pl.col("quantile")).alias("name"))
+        .pivot(on="name", index=group_key, values="value")
+    )
+
+
+def process_file(files, plan_dir=None, mode="exact"):
+    """
+    Audits one partition (a file, or every shard of a month) and returns (report rows, stage
+    records); the stages are only recorded when profiling (`plan_dir` set). Errors propagate so
+    the scheduler can record them per partition.
+    `mode` "approx" reads the quantiles from sketches in the same streaming pass (see AUDIT_MODE).
+    """
+    # Canonical dtypes, but no default-filled columns: the audit reports what the file really has
+    lf = scan_dataset(files, fill_missing=False)
+
+    # --- 1. DETECT & STANDARDIZE TO METRIC (For Apples-to-Apples Comparison) ---
+    # We peek at the schema to see if we are in "Raw Mode"
+    raw_schema = lf.collect_schema().names()
+
+    virtual_cols = []
+
+    # If Raw (has miles, missing km), create virtual KM column
+    if "trip_miles" in raw_schema and "trip_km" not in raw_schema:
+        virtual_cols.append((pl.col("trip_miles") * KM_PER_MILE).alias("trip_km"))
+
+    # If Raw (has miles+time, missing speed), create virtual Speed column
+    if "trip_miles" in raw_schema and "trip_time" in raw_schema and "speed_kmh" not in raw_schema:
+        # Speed = (Miles * 1.6) / (Seconds / 3600)
+        # We stick to simple math here just for auditing distributions
+        speed_expr = (pl.col("trip_miles") * KM_PER_MILE) / (pl.col("trip_time") / 3600)
+        virtual_cols.append(speed_expr.fill_nan(0).fill_null(0).alias("speed_kmh"))
+
+    # Apply the virtual columns
+    if virtual_cols:
+        lf = lf.with_columns(virtual_cols)
+
+    # --- 2. REFRESH SCHEMA ---
+    # Now that we added columns, we get the schema again so the Audit Engine sees them
+    schema = lf.collect_schema().names()
+
+    # --- 3. GROUPING LOGIC (Unchanged) ---
+    if "pickup_month" not in schema:
+        # Raw Data: Create month from datetime
+        lf = lf.with_columns([pl.col("pickup_datetime").dt.truncate("1mo").cast(pl.Date).alias("audit_month")])
+        group_key = "audit_month"
+    elif "pickup_date" in schema:
+        # Processed Data: Truncate existing date
+        lf = lf.with_columns(pl.col("pickup_date").dt.truncate("1mo").alias("audit_month"))
+        group_key = "audit_month"
+    else:
+        # Fallback
+        lf = lf.with_columns(pl.col("pickup_datetime").dt.truncate("1mo").cast(pl.Date).alias("audit_month"))
+        group_key = "audit_month"
+
+    # --- 4. BUILD EXPRESSIONS ---
+    approx = mode == "approx"
+    exprs = build_audit_expressions(schema, quantiles=not approx)
+
+    # --- 5. AGGREGATE ---
+    lf_audit = lf.group_by(group_key).agg(exprs)
+    queries = [lf_audit]
+    if approx:
+        # Same scan, one pass: collect_all shares it between the aggregate and the histograms.
+        # Memory stays at a streaming chunk where exact quantiles hold every column of the month
+        queries += histogram_queries(lf, group_key, [c for c in AUDIT_TARGETS if c in schema])
+    engine = "streaming" if approx or current_tuning()["low_memory"] else "auto"
+    stages = []
+    if plan_dir is None:
+        frames = pl.collect_all(queries, engine=engine)
+    else:
+        save_plans(queries, plan_dir, unit_name(files))
+        with stage(stages, "Read (row count)") as record:
+            record["rows_out"] = rows_in = lf.select(pl.len()).collect().item()
+        with stage(stages, f"Audit aggregate ({mode})", rows_in) as record:
+            frames = pl.collect_all(queries, engine=engine)
+            record["rows_out"] = frames[0].height
+
+    df = frames[0]
+    if approx:
+        # Back to the exact report's column order
+        order = [e.meta.output_name() for e in build_audit_expressions(schema)]
+        df = df.join(histogram_quantiles(pl.concat(frames[1:]), group_key), on=group_key, how="left")
+        df = df.select([group_key] + [pl.col(c) if c in df.columns else pl.lit(None, pl.Float64).alias(c) for c in order])
+
+    df = df.with_columns(
+        pl.lit(mode).alias("audit_mode"),
+        pl.lit(SKETCH_ALPHA if approx else 0.0).alias("quantile_rel_error"),
+        # Sketch values below this magnitude read back as 0: each quantile is within
+        # max(quantile_rel_error * |q|, quantile_abs_floor) of the exact one
+        pl.lit(SKETCH_MIN_VALUE if approx else 0.0).alias("quantile_abs_floor"),
+    )
+
+    # --- 6. TYPE SAFETY (Unchanged) ---
+    return standardize_types(df, group_key), stages
+
+
+def standardize_types(df, group_key="audit_month"):
+    """Int64 counts and Float64 statistics, whatever the source dtypes were."""
+    casts = []
+    for col in df.columns:
+        if col == group_key:
+            continue
+        if any(x in col for x in ["_nulls", "_zeros", "_negatives", "_count", "total_rows"]):
+            casts.append(pl.col(col).cast(pl.Int64))
+        elif any(x in col for x in ["_mean", "_std", "_min", "_max", "_p01", "_p50", "_p99"]):
+            casts.append(pl.col(col).cast(pl.Float64))
+
+    if casts:
+        df = df.with_columns(casts)
+
+    return df
+
+
+def footer_audit(files):
+    """
+    Metadata tier: report rows for one partition from its Parquet footers alone (per row group:
+    row count, null counts, min / max). Returns (rows, []) or, when a row group can't be placed in
+    a month or an audited column has no statistics, (None, [what is missing]) for a full scan.
+    """
     try:
-        lf = pl.scan_parquet(file_path)
-
-        # --- 1. DETECT & STANDARDIZE TO METRIC (For Apples-to-Apples Comparison) ---
-        # We peek at the schema to see if we are in "Raw Mode"
-        raw_schema = lf.collect_schema().names()
-
-        virtual_cols = []
-
-        # If Raw (has miles, missing km), create virtual KM column
-        if "trip_miles" in raw_schema and "trip_km" not in raw_schema:
-            virtual_cols.append((pl.col("trip_miles") * 1.60934).alias("trip_km"))
-
-        # If Raw (has miles+time, missing speed), create virtual Speed column
-        if "trip_miles" in raw_schema and "trip_time" in raw_schema and "speed_kmh" not in raw_schema:
-            # Speed = (Miles * 1.6) / (Seconds / 3600)
-            # We stick to simple math here just for auditing distributions
-            speed_expr = (pl.col("trip_miles") * 1.60934) / (pl.col("trip_time") / 3600)
-            virtual_cols.append(speed_expr.fill_nan(0).fill_null(0).alias("speed_kmh"))
-
-        # Apply the virtual columns
-        if virtual_cols:
-            lf = lf.with_columns(virtual_cols)
-
-        # --- 2. REFRESH SCHEMA ---
-        # Now that we added columns, we get the schema again so the Audit Engine sees them
-        schema = lf.collect_schema().names()
-
-        # --- 3. GROUPING LOGIC (Unchanged) ---
-        if "pickup_month" not in schema:
-            # Raw Data: Create month from datetime
-            lf = lf.with_columns([pl.col("pickup_datetime").dt.truncate("1mo").cast(pl.Date).alias("audit_month")])
-            group_key = "audit_month"
-        elif "pickup_date" in schema:
-            # Processed Data: Truncate existing date
-            lf = lf.with_columns(pl.col("pickup_date").dt.truncate("1mo").alias("audit_month"))
-            group_key = "audit_month"
-        else:
-            # Fallback
-            lf = lf.with_columns(pl.col("pickup_datetime").dt.truncate("1mo").cast(pl.Date).alias("audit_month"))
-            group_key = "audit_month"
-
-        # --- 4. BUILD EXPRESSIONS ---
-        exprs = build_audit_expressions(schema)
-
-        # --- 5. AGGREGATE ---
-        df = lf.group_by(group_key).agg(exprs).collect()
-
-        # --- 6. TYPE SAFETY (Unchanged) ---
-        casts = []
-        for col in df.columns:
-            if col == group_key:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None, ["all (pyarrow not installed)"]
+
+    metas = [pq.ParquetFile(f).metadata for f in files]
+    meta = metas[0]
+    idx = {meta.schema.column(i).name: i for i in range(meta.num_columns)}
+    # The month each row group belongs to, like process_file groups the rows
+    key = "pickup_date" if "pickup_date" in idx else "pickup_datetime"
+    numeric = [c for c in AUDIT_TARGETS if c in idx]
+    categorical = [c for c in CATEGORICAL_TARGETS if c in idx]
+
+    months, missing = {}, []
+    # Shards of a month share its schema (process_data writes them from one plan)
+    row_groups = [(m, g) for m in metas for g in range(m.num_row_groups)]
+    for meta, g in row_groups:
+        rg = meta.row_group(g)
+        if rg.num_rows == 0:
+            continue
+        stats = rg.column(idx[key]).statistics if key in idx else None
+        if stats is None or not stats.has_min_max or stats.null_count != 0:
+            return None, [key]
+        lo, hi = stats.min, stats.max
+        if (lo.year, lo.month) != (hi.year, hi.month):
+            return None, [f"{key} (row group {g} spans months)"]
+
+        row = months.setdefault(date(lo.year, lo.month, 1), {"total_rows": 0})
+        row["total_rows"] += rg.num_rows
+        for col in numeric + categorical:
+            stats = rg.column(idx[col]).statistics
+            if stats is None or not stats.has_null_count:
+                missing.append(col)
                 continue
-            if any(x in col for x in ["_nulls", "_zeros", "_negatives", "_count", "total_rows"]):
-                casts.append(pl.col(col).cast(pl.Int64))
-            elif any(x in col for x in ["_mean", "_std", "_min", "_max", "_p01", "_p50", "_p99"]):
-                casts.append(pl.col(col).cast(pl.Float64))
+            row[f"{col}_nulls"] = row.get(f"{col}_nulls", 0) + stats.null_count
+            if col in categorical or stats.null_count == rg.num_rows:
+                continue
+            if not stats.has_min_max:
+                missing.append(col)
+                continue
+            row[f"{col}_min"] = min(row.get(f"{col}_min", stats.min), stats.min)
+            row[f"{col}_max"] = max(row.get(f"{col}_max", stats.max), stats.max)
+
+    if missing:
+        return None, list(dict.fromkeys(missing))
+
+    rows = []
+    for month, row in sorted(months.items()):
+        out = {"audit_month": month, "audit_mode": "metadata", "quantile_rel_error": None, "quantile_abs_floor": None, "total_rows": row["total_rows"]}
+        for col in numeric:
+            out.update({f"{col}_{stat}": row.get(f"{col}_{stat}") for stat in ("nulls", "min", "max")})
+        out.update({f"{col}_nulls": row.get(f"{col}_nulls") for col in categorical})
+        rows.append(out)
+    df = pl.DataFrame(rows, schema_overrides={"quantile_rel_error": pl.Float64, "quantile_abs_floor": pl.Float64}, infer_schema_length=None)
+
+    # Footer values in the dtypes process_file aggregates (scan_dataset conforms to the registry)
+    registry = PROCESSED_SCHEMA if "trip_archetype" in idx else RAW_SCHEMA
+    df = df.with_columns([
+        pl.col(f"{col}_{stat}").cast(registry[col]) for col in numeric if col in registry for stat in ("min", "max")
+    ])
+    if "trip_miles" in numeric and "trip_km" not in numeric:
+        df = df.with_columns(
+            pl.col("trip_miles_nulls").alias("trip_km_nulls"),
+            (pl.col("trip_miles_min") * KM_PER_MILE).alias("trip_km_min"),
+            (pl.col("trip_miles_max") * KM_PER_MILE).alias("trip_km_max"),
+        )
+    return standardize_types(df), []
+
+
+# --- Result Cache ---
+def audit_fingerprint():
+    """
+    Fingerprint of the code and expression set that shape a file's report rows (compared as
+    syntax trees, like aggregate_datasets'), plus the audited columns and quantiles.
+    """
+    code_units = [process_file, build_audit_expressions, histogram_queries, histogram_quantiles, standardize_types, marts, tlc_schema]
+    trees = [ast.dump(ast.parse(inspect.getsource(unit))) for unit in code_units]
+    return text_fingerprint(AUDIT_CACHE_VERSION, AUDIT_TARGETS, CATEGORICAL_TARGETS, AUDIT_QUANTILES, KM_PER_MILE, *trees)
+
 
-        if casts:
-            df = df.with_columns(casts)
+def unit_name(files):
+    """Label of an audited partition: its file, or its year=/month= folder when sharded."""
+    if len(files) == 1:
+        return os.path.splitext(task_name(files[0]))[0]
+    return task_name(os.path.dirname(files[0]))
 
-        return df
 
-    except Exception as e:
-        print(f"❌ Error auditing {os.path.basename(file_path)}: {e}")
-        return None
+def cache_file(files, mode):
+    """A partition's cached report rows, relative to the dataset's cache folder."""
+    return os.path.join(mode, safe_name(unit_name(files)) + ".parquet")
 
 
 def main():
     print(f"🚀 Orion: Initializing Universal Audit...")
-    print(f"📂 Target: {INPUT_DIR}")
+    run_id = new_run_id("tlc_universal_audit")
+    plan_dir = plan_dir_for(run_id) if PROFILE else None
+    started_at = datetime.now().isoformat()
+    print(f"📂 Target: {INPUT_DATASET} ({dataset_root(INPUT_DATASET)})")
 
-    files = sorted(glob.glob(os.path.join(INPUT_DIR, "**", "*.parquet"), recursive=True))
-    print(f"🔍 Found {len(files)} files.")
+    # One audit unit per partition, so a sharded month gets one report row, not one per shard
+    units = [tuple(p["files"]) for p in select_partitions(INPUT_DATASET, START_PERIOD, END_PERIOD)]
+    print(f"🔍 Found {sum(len(u) for u in units)} files in {len(units)} partition(s).")
 
-    results = []
     start_t = time.time()
 
-    for i, f in enumerate(files, 1):
-        print(f"[{i}/{len(files)}] Scanning {os.path.basename(f)}...", end="", flush=True)
-        res = process_file(f)
-        if res is not None:
-            results.append(res)
-            print(" Done.")
-
-        gc.collect()
+    print(f"🎯 Mode: {AUDIT_MODE}" + (f" (quantiles within {SKETCH_ALPHA:.0%}, relative)" if AUDIT_MODE == "approx" else ""))
+    results, escalated = [], {}
+    scan_units, scan_mode = units, AUDIT_MODE
+    if AUDIT_MODE == "metadata":
+        for u in units:
+            df, missing = footer_audit(u)
+            if df is None:
+                escalated[u] = missing
+                print(f"   ⚠️ {unit_name(u)}: no footer statistics for {', '.join(missing)} -> full scan")
+            else:
+                results.append(df)
+        print(f"📑 {len(results)} of {len(units)} partitions audited from their footers ({time.time() - start_t:.1f}s)")
+        scan_units, scan_mode = list(escalated), ESCALATION_MODE
+
+    frames, to_scan, inputs = {}, scan_units, {}
+    cache_dir = os.path.join(AUDIT_CACHE_DIR, INPUT_DATASET) if AUDIT_CACHE_DIR else None
+    if cache_dir and scan_units:
+        manifest_file = os.path.join(cache_dir, "_manifest.json")
+        manifest = load_manifest(manifest_file)
+        code = audit_fingerprint()
+        discard_temp_files(glob.glob(os.path.join(cache_dir, "**", "*" + TMP_SUFFIX), recursive=True))
+        to_scan = []
+        for u in scan_units:
+            inputs[u] = {"file": text_fingerprint(*(file_fingerprint(f) for f in u)), "code": code}
+            entry = manifest["partitions"].get(cache_file(u, scan_mode))
+            if stale_reason(entry, inputs[u], cache_dir) is None:
+                frames[u] = pl.read_parquet(os.path.join(cache_dir, entry["files"][0]))
+            else:
+                to_scan.append(u)
+        print(f"💾 Cache: {len(frames)} of {len(scan_units)} partition(s) up to date, {len(to_scan)} to scan")
+
+    def cache_result(idx, record):
+        if not cache_dir or not record["ok"]:
+            return
+        u = to_scan[idx]
+        rel = cache_file(u, scan_mode)
+        path = os.path.join(cache_dir, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        record["value"][0].write_parquet(temp_path(path))
+        commit_files([(temp_path(path), path)])
+        manifest["partitions"][rel] = make_entry(inputs[u], [rel])
+        save_manifest(manifest, manifest_file)
+
+    jobs = [
+        {
+            "key": unit_name(u),
+            "args": (list(u), plan_dir, scan_mode),
+            "est_bytes": sum(estimate_task_bytes(f) for f in u),
+            "rows": sum(parquet_rows(f) or 0 for f in u) or None,
+        }
+        for u in to_scan
+    ]
+    records = run_tasks(
+        process_file,
+        jobs,
+        label="Scanning",
+        on_result=cache_result,
+        memory_budget_gb=MEMORY_BUDGET_GB,
+    )
+    for u, r in zip(to_scan, records):
+        if r["ok"]:
+            frames[u], r["stages"] = r["value"]
+    for u, df in frames.items():
+        if u in escalated:
+            df = df.with_columns(pl.lit(", ".join(escalated[u])).alias("missing_stats"))
+        results.append(df)
+    report_failures(records)
+
+    if PROFILE:
+        report_file = write_run_report(
+            run_id,
+            "tlc_universal_audit",
+            records,
+            config={"input": INPUT_DATASET, "start": START_PERIOD, "end": END_PERIOD, "mode": AUDIT_MODE},
+            started_at=started_at,
+        )
+        print_stage_summary(report_file)
+        print(f"📊 Run report: {report_file} (query plans in {plan_dir})")
 
     if results:
         print("\n🔗 Compiling Report...")
@@ -207,7 +503,8 @@ def main():
 
         # Reorder: Date, Rows, Paradoxes... then the rest
         cols = final_df.columns
-        priority = ["audit_month", "total_rows"] + [c for c in cols if "paradox" in c]
+        priority = ["audit_month", "audit_mode", "missing_stats", "quantile_rel_error", "quantile_abs_floor", "total_rows"]
+        priority = [c for c in priority if c in cols] + [c for c in cols if "paradox" in c]
         rest = [c for c in cols if c not in priority]
 
         final_df = final_df.select(priority + rest)
@@ -222,6 +519,13 @@ def main():
         for p in [c for c in cols if "paradox" in c]:
             print(f"{p}: {final_df[p].sum():,.0f}")
 
+        if DRIFT_AFTER_AUDIT:
+            audit_drift.run()
+
 
 if __name__ == "__main__":
+    if "--approx" in sys.argv[1:]:
+        AUDIT_MODE = "approx"
+    elif "--metadata" in sys.argv[1:]:
+        AUDIT_MODE = "metadata"
     main()
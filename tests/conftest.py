@@ -0,0 +1,65 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+# ==============================================================================
+# 🧪 TEST FIXTURES
+# Every test runs on synthetic_data.py months under a throwaway TLC_ROOT, set before any script
+# imports the catalog (scheduler workers inherit it through the environment).
+# ==============================================================================
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(REPO_DIR, "scripts")
+ZONE_SOURCE = os.path.join(REPO_DIR, "external_data", "taxi_zones_detailed.csv")
+
+TLC_ROOT = tempfile.mkdtemp(prefix="tlc_tests_")
+os.environ["TLC_ROOT"] = TLC_ROOT
+sys.path.insert(0, SCRIPTS_DIR)
+
+# Small months: every script runs end to end in seconds
+PERIODS = ["2019-02", "2021-09"]
+ROWS_PER_MONTH = 20_000
+RAW_FOLDER = "HVFHV subsets 2019-2025"
+
+
+@pytest.fixture(scope="session")
+def tlc_root():
+    """Raw months, weather and zones under TLC_ROOT, where the scripts look for them (cwd)."""
+    import synthetic_data
+
+    previous_cwd = os.getcwd()
+    os.chdir(TLC_ROOT)
+    shutil.copyfile(ZONE_SOURCE, "taxi_zones_detailed.csv")
+    synthetic_data.generate_dataset(
+        PERIODS,
+        ROWS_PER_MONTH,
+        output_dir=os.path.join(TLC_ROOT, RAW_FOLDER),
+        weather_output=os.path.join(TLC_ROOT, "nyc_weather_hourly_2019_2025.csv"),
+    )
+    yield TLC_ROOT
+    os.chdir(previous_cwd)
+    shutil.rmtree(TLC_ROOT, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def processed(tlc_root):
+    """The processed dataset (with its quarantine), built once by process_data."""
+    import process_data
+    from catalog import dataset_root
+
+    process_data.QUARANTINE = True
+    process_data.main()
+    return dataset_root("processed")
+
+
+@pytest.fixture(scope="session")
+def marts(processed):
+    """Aggregates_Processed, built once by aggregate_datasets."""
+    import aggregate_datasets
+    from catalog import dataset_root
+
+    aggregate_datasets.INPUT_DATASET = "processed"
+    aggregate_datasets.main()
+    return os.path.join(dataset_root("aggregates"), "Aggregates_Processed")
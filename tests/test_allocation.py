@@ -0,0 +1,74 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from stratified_sampling import allocate, allocation_table
+
+ROWS = np.array([50_000.0, 20_000.0, 5_000.0, 300.0, 1.0])
+
+
+def check(n, rows, sample_size, min_rows):
+    assert not np.isnan(n).any()
+    assert (n <= rows + 1e-9).all()
+    assert (n >= np.minimum(min_rows, rows) - 1e-9).all()
+    assert n.sum() == pytest.approx(max(min(sample_size, rows.sum()), np.minimum(min_rows, rows).sum()))
+
+
+@pytest.mark.parametrize("scores", [ROWS, np.ones_like(ROWS), ROWS * np.array([2.0, 0.5, 10.0, 0.0, 0.0])])
+@pytest.mark.parametrize("sample_size", [1, 100, 753.3, 7_530, 60_000, 75_301, 1e9])
+def test_allocation_adds_up_within_bounds(scores, sample_size):
+    check(allocate(ROWS, scores, sample_size, 2), ROWS, sample_size, 2)
+
+
+def test_proportional_allocation_keeps_one_rate():
+    n = allocate(ROWS, ROWS, 0.1 * ROWS.sum(), 0)
+    assert n / ROWS == pytest.approx(np.full(len(ROWS), 0.1))
+
+
+def test_rare_strata_get_their_minimum():
+    n = allocate(ROWS, ROWS, 0.001 * ROWS.sum(), 2)
+    assert n[-2] == 2.0  # 0.1% of 300 is under the minimum
+    assert n[-1] == 1.0  # Smaller than the minimum: taken whole
+    assert n[0] / ROWS[0] == pytest.approx(n[1] / ROWS[1])
+    check(n, ROWS, 0.001 * ROWS.sum(), 2)
+
+
+def test_zero_scores_take_what_the_others_leave():
+    assert allocate(np.array([1000.0, 1000.0, 10.0]), np.array([0.0, 0.0, 5.0]), 500, 2) == pytest.approx([245, 245, 10])
+    # Nothing to weigh by: proportional
+    assert allocate(ROWS, np.zeros_like(ROWS), 0.1 * ROWS.sum(), 0) == pytest.approx(0.1 * ROWS)
+
+
+@pytest.mark.parametrize("scores", [ROWS, np.ones_like(ROWS), ROWS * np.array([2.0, 0.5, 10.0, 0.0, 0.0])])
+def test_stratum_sizes_never_shrink_as_the_sample_grows(scores):
+    # What keeps samples of growing fractions nested
+    sizes = [allocate(ROWS, scores, s, 2) for s in np.linspace(0, 1.1 * ROWS.sum(), 60)]
+    assert all((b >= a - 1e-6).all() for a, b in zip(sizes, sizes[1:]))
+
+
+def test_allocation_table_rates_per_month_and_method():
+    stats = pl.DataFrame(
+        {
+            "period": ["2021-09"] * 3 + ["2019-02"] * 2,
+            "stratum": ["a", "b", "c", "a", "b"],
+            "rows": [9_000, 900, 100, 500, 500],
+            "n": [9_000, 900, 100, 500, 500],
+            "sum": [90_000.0, 9_000.0, 1_000.0, 5_000.0, 5_000.0],
+            "sumsq": [1_800_000.0, 99_000.0, 10_000.0, 100_000.0, 50_000.0],
+        }
+    )
+    proportional = allocation_table(stats, [0.1, 0.2], "proportional", 2)
+    assert proportional["rate_0"].to_list() == pytest.approx([0.1] * 5)
+    assert proportional["expected_1"].sum() == pytest.approx(0.2 * 11_000)
+
+    equal = allocation_table(stats, [0.1], "equal", 2).filter(pl.col("period") == "2021-09")
+    assert equal["expected_0"].to_list() == pytest.approx([450, 450, 100])
+
+    neyman = allocation_table(stats, [0.1], "neyman", 2).filter(pl.col("period") == "2019-02")
+    # Same sizes, twice the variance of the second stratum: the first one gets more rows
+    assert neyman["expected_0"][0] > neyman["expected_0"][1]
+    assert neyman["expected_0"].sum() == pytest.approx(100)
+    assert "std" not in neyman.columns
+
+    with pytest.raises(ValueError, match="Unknown allocation"):
+        allocation_table(stats, [0.1], "optimal", 2)
@@ -0,0 +1,81 @@
+from datetime import date
+
+import polars as pl
+import pytest
+
+import audit_drift
+from audit_drift import MIN_EFFECT, Z_CRITICAL, compare, load_report
+
+MONTH = date(2021, 9, 1)
+
+
+def report(rows=100_000, mean=20.0, std=10.0, nulls=1_000, zeros=500, negatives=0, month=MONTH):
+    """One month of a tlc_universal_audit report, for a single metric."""
+    return pl.DataFrame(
+        {
+            "audit_month": [month],
+            "total_rows": [rows],
+            "fare_mean": [mean],
+            "fare_std": [std],
+            "fare_nulls": [nulls],
+            "fare_zeros": [zeros],
+            "fare_negatives": [negatives],
+        }
+    )
+
+
+def shifts(a, b):
+    drift = compare(a, b, "a", "b")
+    return {row["statistic"]: row for row in drift.iter_rows(named=True)}
+
+
+def test_identical_reports_flag_nothing():
+    out = shifts(report(), report())
+    assert set(out) == {"mean", "nulls_rate", "zeros_rate", "negatives_rate"}
+    assert not any(row["flagged"] for row in out.values())
+    assert all(row["z"] == 0 for row in out.values())
+
+
+def test_large_mean_shift_is_flagged():
+    row = shifts(report(), report(mean=25.0))["mean"]
+    assert row["effect"] == pytest.approx(0.5)
+    assert row["z"] >= Z_CRITICAL and row["flagged"]
+
+
+def test_significant_but_negligible_shift_is_not_flagged():
+    # Millions of trips make any difference significant: the effect size has to matter too
+    row = shifts(report(rows=10_000_000), report(rows=10_000_000, mean=20.5))["mean"]
+    assert row["z"] >= Z_CRITICAL
+    assert abs(row["effect"]) < MIN_EFFECT and not row["flagged"]
+
+
+def test_large_but_noisy_shift_is_not_flagged():
+    row = shifts(report(rows=20, nulls=0, zeros=0), report(rows=20, nulls=0, zeros=0, mean=25.0))["mean"]
+    assert abs(row["effect"]) >= MIN_EFFECT
+    assert abs(row["z"]) < Z_CRITICAL and not row["flagged"]
+
+
+def test_rate_shift_is_flagged():
+    out = shifts(report(), report(nulls=10_000))
+    assert out["nulls_rate"]["value_a"] == pytest.approx(0.01)
+    assert out["nulls_rate"]["value_b"] == pytest.approx(0.1)
+    assert out["nulls_rate"]["flagged"]
+    assert not out["zeros_rate"]["flagged"]
+
+
+def test_constant_metrics_support_no_test():
+    row = shifts(report(std=0.0), report(std=0.0, mean=21.0))["mean"]
+    assert row["z"] is None and not row["flagged"]
+
+
+def test_run_compares_each_month_on_its_own_partition(tmp_path, capsys):
+    # The previous raw file's stray trips of this month are a small row of their own
+    paths = {"raw": tmp_path / "raw.csv", "processed": tmp_path / "processed.csv"}
+    pl.concat([report(rows=12, mean=80.0), report()]).write_csv(paths["raw"])
+    report(mean=25.0).write_csv(paths["processed"])
+
+    assert load_report(paths["raw"])["fare_mean"].to_list() == [20.0]
+    drift = audit_drift.run({k: str(v) for k, v in paths.items()}, [("raw", "processed")], str(tmp_path / "drift.csv"))
+    assert drift.filter("flagged").select("audit_month", "metric", "statistic").rows() == [(MONTH, "fare", "mean")]
+    assert pl.read_csv(tmp_path / "drift.csv").height == drift.height
+    assert "1 of 4 shifts flagged" in capsys.readouterr().out
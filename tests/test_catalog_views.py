@@ -0,0 +1,88 @@
+import os
+import shutil
+
+import polars as pl
+import pytest
+
+import catalog
+from catalog import FLAT_PREFIX, materialize_view, view
+
+
+@pytest.fixture
+def source(processed, tmp_path, monkeypatch):
+    """A private copy of the processed dataset (tests here rebuild and delete its months)."""
+    copy = tmp_path / "processed"
+    shutil.copytree(processed, copy)
+    monkeypatch.setitem(catalog.DATASETS["processed"], "root", str(copy))
+    return copy
+
+
+def rebuild(path):
+    """What process_data does to a rebuilt month: a new file renamed over the old one."""
+    shutil.copyfile(path, str(path) + ".tmp")
+    os.replace(str(path) + ".tmp", path)
+
+
+def test_scan_prunes_to_the_requested_months(processed):
+    assert catalog.scan("processed", "2021-01", "2021-12").select(pl.col("pickup_year").unique()).collect().to_series().to_list() == [2021]
+    assert [p["month"] for p in catalog.select_partitions("processed", "2019", "2019")] == [2]
+
+
+def test_views_expose_every_partition_file(source):
+    assert sorted(view("processed", "flat")) == [f"{FLAT_PREFIX}2019-02.parquet", f"{FLAT_PREFIX}2021-09.parquet"]
+    assert sorted(view("processed", "hive")) == [os.path.join("year=2019", "month=02", "data.parquet"), os.path.join("year=2021", "month=09", "data.parquet")]
+
+
+def test_view_links_read_back_as_the_source(source, tmp_path):
+    target = tmp_path / "flat"
+    assert materialize_view("processed", "flat", str(target)) == (2, 0, [])
+    for rel, src in view("processed", "flat").items():
+        assert pl.read_parquet(target / rel).equals(pl.read_parquet(src))
+    # Nothing left to do on a second run
+    assert materialize_view("processed", "flat", str(target)) == (0, 0, [])
+
+
+def test_links_of_removed_months_are_pruned_and_rebuilt_months_followed(source, tmp_path):
+    target = tmp_path / "hive"
+    materialize_view("processed", "hive", str(target))
+    rebuild(source / "year=2019" / "month=02" / "data.parquet")
+    shutil.rmtree(source / "year=2021")
+
+    assert materialize_view("processed", "hive", str(target)) == (0, 1, [])
+    assert not (target / "year=2021").exists()
+    assert pl.read_parquet(target / "year=2019" / "month=02" / "data.parquet").height > 0
+
+
+def test_regular_files_the_view_did_not_make_are_never_deleted(source, tmp_path):
+    # A folder the old move-based script filled: these files are the only copy of their data
+    target = tmp_path / "flat"
+    target.mkdir()
+    gone = target / f"{FLAT_PREFIX}2018-01.parquet"
+    live = target / f"{FLAT_PREFIX}2019-02.parquet"
+    shutil.copyfile(source / "year=2019" / "month=02" / "data.parquet", gone)
+    shutil.copyfile(source / "year=2019" / "month=02" / "data.parquet", live)
+
+    created, pruned, kept = materialize_view("processed", "flat", str(target))
+    assert (created, pruned) == (1, 0)
+    assert kept == [live.name]
+    assert gone.exists() and live.exists() and not live.is_symlink()
+
+
+def test_hard_link_views_never_delete_the_last_copy(source, tmp_path, monkeypatch):
+    def no_symlinks(*args):
+        raise OSError("symlinks not allowed")
+
+    monkeypatch.setattr(catalog.os, "symlink", no_symlinks)
+    target = tmp_path / "hive"
+    assert materialize_view("processed", "hive", str(target))[0] == 2
+    linked = target / "year=2021" / "month=09" / "data.parquet"
+    assert os.stat(linked).st_nlink == 2
+
+    # Rebuilt month: the old link now holds the only copy of the old bytes, so it stays
+    rebuild(source / "year=2019" / "month=02" / "data.parquet")
+    # Removed month: the view's link is the last copy too
+    shutil.rmtree(source / "year=2021")
+    created, pruned, kept = materialize_view("processed", "hive", str(target))
+    assert (created, pruned) == (0, 0)
+    assert sorted(kept) == [os.path.join("year=2019", "month=02", "data.parquet"), os.path.join("year=2021", "month=09", "data.parquet")]
+    assert linked.exists()
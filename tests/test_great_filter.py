@@ -0,0 +1,68 @@
+import glob
+import os
+
+import polars as pl
+import pytest
+
+from conftest import RAW_FOLDER
+from manifest import temp_path
+from process_data import (
+    filter_clauses,
+    load_static_assets,
+    od_key_expr,
+    prefilter_expr,
+    prepare_raw_trips,
+    process_month,
+    rejection_exprs,
+)
+
+
+@pytest.fixture(scope="module")
+def month(tlc_root, tmp_path_factory):
+    """One raw month run through process_month (with a quarantine), plus its raw trips."""
+    od_dim, context = load_static_assets()
+    raw_file = sorted(glob.glob(os.path.join(tlc_root, RAW_FOLDER, "*.parquet")))[0]
+    out = tmp_path_factory.mktemp("great_filter")
+    target, quarantine = str(out / "data.parquet"), str(out / "quarantine.parquet")
+    stats = process_month(raw_file, target, od_dim, context, quarantine_file=quarantine)
+    trips = prepare_raw_trips(pl.scan_parquet(raw_file)).collect()
+    return stats, trips, od_dim, target, quarantine
+
+
+def test_split_filter_keeps_what_the_single_filter_keeps(month):
+    stats, trips, od_dim, _, _ = month
+    kept = trips.filter(pl.all_horizontal(list(filter_clauses().values())))
+
+    assert stats["rows_uber"] == trips.height
+    assert stats["rows_prefiltered"] == trips.filter(prefilter_expr()).height
+    assert stats["rows_kept"] == kept.height
+    assert stats["rows_kept"] + stats["rows_rejected"] == stats["rows_uber"]
+    # Written rows are the kept ones, fanned out by the OD join's duplicated zone ids
+    fanned_out = kept.with_columns(od_key_expr()).join(od_dim, on="od_key", how="left")
+    assert stats["rows_written"] == fanned_out.height
+
+
+def test_residual_filter_never_counts_negative(month):
+    stats, _, _, _, _ = month
+    assert stats["rows_prefiltered"] - stats["rows_kept"] >= 0
+    assert stats["rows_written"] >= stats["rows_kept"]
+
+
+def test_rejections_are_counted_per_clause(month):
+    stats, trips, _, _, _ = month
+    rejected, _ = rejection_exprs()
+    expected = trips.select([flag.sum().alias(name) for name, flag in rejected.items()]).row(0, named=True)
+    assert stats["rejected"] == expected
+    # A row failing several clauses counts for each
+    assert sum(stats["rejected"].values()) >= stats["rows_rejected"]
+
+
+def test_quarantine_holds_every_rejected_row_with_its_reasons(month):
+    stats, _, _, _, quarantine = month
+    rejected = pl.read_parquet(temp_path(quarantine))  # main renames it into place
+    assert rejected.height == stats["rows_rejected"]
+    assert (rejected["rejection_reasons"].list.len() > 0).all()
+
+    counts = rejected.select(pl.col("rejection_reasons").explode(empty_as_null=False).cast(pl.String)).to_series().value_counts()
+    by_reason = dict(zip(counts["rejection_reasons"].to_list(), counts["count"].to_list()))
+    assert by_reason == {name: n for name, n in stats["rejected"].items() if n}
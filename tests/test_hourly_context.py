@@ -0,0 +1,69 @@
+import glob
+import os
+from datetime import datetime
+
+import polars as pl
+import pytest
+
+from conftest import RAW_FOLDER
+from process_data import MISSING_CONTEXT_HOUR, build_feature_pipeline, calendar_exprs, load_static_assets, temp_bin_expr
+
+CALENDAR_COLUMNS = [
+    "cyclical_hour_sin",
+    "cyclical_month_cos",
+    "cyclical_day_sin",
+    "cultural_day_type",
+    "time_of_day_bin",
+    "pandemic_phase",
+]
+
+
+@pytest.fixture(scope="module")
+def assets(tlc_root):
+    return load_static_assets()
+
+
+def test_every_context_hour_has_a_temperature(assets):
+    _, context = assets
+    assert context["temp"].null_count() == 0
+    assert context.filter(pl.col("context_hour") == MISSING_CONTEXT_HOUR).height == 1
+
+
+def test_out_of_span_row_bins_the_mean_temperature(assets):
+    _, context = assets
+    outside = context.filter(pl.col("context_hour") == MISSING_CONTEXT_HOUR)
+    hours = context.filter(pl.col("context_hour") != MISSING_CONTEXT_HOUR)
+    assert outside["temp"][0] == pytest.approx(hours["temp"].mean(), abs=1)
+    expected_bin = outside.select(temp_bin_expr(pl.col("temp"))).to_series()[0]
+    assert outside["temp_bin"].cast(pl.String)[0] == expected_bin
+
+
+def test_trips_outside_the_weather_span_keep_their_calendar_features(tlc_root, assets):
+    od_dim, context = assets
+    raw_file = sorted(glob.glob(os.path.join(tlc_root, RAW_FOLDER, "*.parquet")))[0]
+    raw = pl.scan_parquet(raw_file).head(500)
+    stamps = [c for c, dtype in raw.collect_schema().items() if dtype == pl.Datetime]
+    shifted = raw.with_columns([pl.col(c).dt.offset_by("-3y") for c in stamps])
+    df = build_feature_pipeline(shifted, od_dim, context).collect()
+
+    assert df.height > 0
+    assert (df["pickup_datetime"].dt.year() < 2019).all()
+    assert df.select(pl.col(CALENDAR_COLUMNS).null_count()).row(0) == (0,) * len(CALENDAR_COLUMNS)
+    assert (df["pandemic_phase"].cast(pl.String) == "pre_pandemic").all()
+    assert df["temp"].null_count() == 0
+    assert df["temp_bin"].n_unique() == 1
+
+
+def test_pandemic_phase_boundaries_are_exact():
+    # Bounds are inclusive: the boundary instant stays in the earlier phase
+    instants = pl.DataFrame({"pickup_datetime": [datetime(2020, 6, 1), datetime(2020, 6, 1, 0, 0, 1)]})
+    phases = (
+        instants.with_columns(
+            pl.col("pickup_datetime").dt.hour().alias("pickup_hour"),
+            pl.col("pickup_datetime").dt.month().alias("pickup_month"),
+            pl.col("pickup_datetime").dt.weekday().alias("pickup_dow"),
+        )
+        .with_columns(calendar_exprs())["pandemic_phase"]
+        .to_list()
+    )
+    assert phases == ["lockdown", "recovery"]
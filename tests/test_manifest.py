@@ -0,0 +1,95 @@
+import glob
+import os
+import shutil
+
+import polars as pl
+import pytest
+
+import catalog
+import process_data
+from manifest import file_fingerprint, load_manifest, make_entry, stale_reason, text_fingerprint
+
+
+# --- Fingerprints & staleness ---
+def test_file_fingerprint_follows_content_not_mtime(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"abc")
+    before = file_fingerprint(str(path))
+    os.utime(path, (0, 0))
+    assert file_fingerprint(str(path)) == before
+    path.write_bytes(b"abd")
+    assert file_fingerprint(str(path)) != before
+    assert file_fingerprint(str(tmp_path / "missing")) is None
+
+
+def test_text_fingerprint_separates_parts():
+    assert text_fingerprint("ab", "c") != text_fingerprint("a", "bc")
+
+
+def test_stale_reason(tmp_path):
+    (tmp_path / "data.parquet").write_bytes(b"")
+    inputs = {"raw": "1", "code": "2"}
+    entry = make_entry(inputs, ["data.parquet"])
+
+    assert stale_reason(None, inputs, str(tmp_path)) == "new"
+    assert stale_reason(entry, inputs, str(tmp_path)) is None
+    assert stale_reason(entry, {**inputs, "code": "3"}, str(tmp_path)) == "code changed"
+    assert stale_reason(entry, {**inputs, "zones": "4"}, str(tmp_path)) == "zones changed"
+    os.remove(tmp_path / "data.parquet")
+    assert stale_reason(entry, inputs, str(tmp_path)) == "output missing"
+
+
+# --- Incremental process_data runs ---
+@pytest.fixture
+def tree(processed, tmp_path, monkeypatch):
+    """A private copy of the raw and processed datasets, so runs here can't disturb other tests."""
+    for name in ("raw", "processed", "quarantine"):
+        copy = tmp_path / name
+        shutil.copytree(catalog.dataset_root(name), copy)
+        monkeypatch.setitem(catalog.DATASETS[name], "root", str(copy))
+    return tmp_path
+
+
+def build_times(tree):
+    manifest = load_manifest(os.path.join(tree / "processed", process_data.MANIFEST_NAME))
+    return {key: entry["written_at"] for key, entry in manifest["partitions"].items()}
+
+
+def rebuilt(tree):
+    before = build_times(tree)
+    process_data.main()
+    after = build_times(tree)
+    return sorted(k for k in after if after[k] != before.get(k))
+
+
+def test_rerun_rebuilds_nothing(tree, capsys):
+    assert rebuilt(tree) == []
+    assert "Every partition is up to date" in capsys.readouterr().out
+
+
+def test_changed_raw_file_rebuilds_only_its_month(tree):
+    raw_file = sorted(glob.glob(str(tree / "raw" / "*.parquet")))[0]
+    pl.read_parquet(raw_file).slice(1).write_parquet(raw_file)
+
+    assert rebuilt(tree) == ["year=2019/month=02"]
+    entry = load_manifest(os.path.join(tree / "processed", process_data.MANIFEST_NAME))["partitions"]["year=2019/month=02"]
+    assert entry["rows_uber"] == pl.scan_parquet(raw_file).filter(pl.col("hvfhs_license_num") == "HV0003").select(pl.len()).collect().item()
+
+
+def test_missing_output_rebuilds_its_month(tree):
+    os.remove(tree / "processed" / "year=2021" / "month=09" / "data.parquet")
+    assert rebuilt(tree) == ["year=2021/month=09"]
+    assert os.path.exists(tree / "processed" / "year=2021" / "month=09" / "data.parquet")
+
+
+def test_pipeline_change_rebuilds_every_month(tree, monkeypatch):
+    monkeypatch.setattr(process_data, "PIPELINE_VERSION", process_data.PIPELINE_VERSION + 1)
+    assert rebuilt(tree) == ["year=2019/month=02", "year=2021/month=09"]
+
+
+def test_leftovers_of_an_interrupted_run_are_discarded(tree):
+    leftover = tree / "processed" / "year=2019" / "month=02" / "data.parquet.tmp"
+    leftover.write_bytes(b"half a file")
+    assert rebuilt(tree) == []
+    assert not leftover.exists()
+    assert catalog.list_files("processed") == sorted(glob.glob(str(tree / "processed" / "year=*" / "month=*" / "*.parquet")))
@@ -0,0 +1,75 @@
+import os
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import catalog
+import mart_query
+from mart_query import MART_ONLY_METRICS, TRIP_METRICS, can_answer, choose_source, mart_path, query
+
+
+@pytest.fixture(scope="module")
+def trips(marts):
+    return catalog.scan("processed").collect()
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    mart_query.clear_cache()
+    yield
+    mart_query.clear_cache()
+
+
+def test_queries_go_to_the_smallest_mart_that_answers_them(marts):
+    assert choose_source(["trip_count"], ["pickup_date"]) == "executive"
+    assert choose_source(["trip_count", "avg_wait_time"], ["PULocationID"]) == "network"
+    assert choose_source(["std_driver_share"], ["weather_state"], pl.col("pickup_year") == 2021) == "economic"
+    assert choose_source(["avg_trip_km"], ["trip_archetype"]) == "timeline"
+    assert choose_source(["trip_count"], ["rain_intensity"]) == "trips"
+
+
+def test_mart_answers_equal_the_trip_answers(marts, trips):
+    where = pl.col("pickup_year") == 2021
+    metrics = ["trip_count", "total_fare_amt", "avg_trip_km", "avg_wait_time"]
+    for by in (["borough_flow_type"], ["pickup_month"]):
+        answer = query(metrics, by=by, where=where)
+        direct = trips.filter(where).group_by(by).agg([TRIP_METRICS[m].alias(m) for m in metrics]).sort(by)
+        assert_frame_equal(answer, direct, check_dtypes=False, rel_tol=1e-5)
+
+
+def test_every_trip_metric_computes_on_processed_trips(marts, trips):
+    # No mart has rain_intensity as a key, so the whole query falls back to the trips
+    df = query(list(TRIP_METRICS), by=["rain_intensity"])
+    assert df.columns == ["rain_intensity"] + list(TRIP_METRICS)
+    assert df["trip_count"].sum() == trips.height
+    total = query(["avg_trip_miles"])["avg_trip_miles"][0]
+    assert total == pytest.approx(trips["trip_km"].cast(pl.Float64).mean() / 1.60934, rel=1e-5)
+
+
+def test_raw_only_metrics_fail_clearly_on_processed_trips(marts):
+    assert "avg_duration_sec" in MART_ONLY_METRICS
+    with pytest.raises(ValueError, match=r"\['trip_time'\].*mode='Raw'"):
+        query(["avg_duration_sec"], by=["PULocationID"])
+    with pytest.raises(ValueError, match="Unknown metrics"):
+        query(["avg_nonsense"])
+
+
+def test_marts_lacking_a_declared_key_are_not_chosen(marts):
+    # The Raw timeline has no borough_flow_type, though the timeline declares it
+    raw_timeline = ["pickup_year", "pickup_month", "pickup_day", "pickup_hour", "trip_count"]
+    assert not can_answer("timeline", raw_timeline, ["trip_count"], ["borough_flow_type"], [])
+    assert can_answer("timeline", raw_timeline, ["trip_count"], ["pickup_hour"], [])
+    # No Raw marts were built here, and Raw trips can't be rescanned
+    with pytest.raises(ValueError, match="No Raw mart"):
+        query(["trip_count"], by=["borough_flow_type"], mode="Raw")
+
+
+def test_cache_follows_the_source_file(marts):
+    first = query(["trip_count"], by=["pickup_date"])
+    assert query(["trip_count"], by=["pickup_date"]) is first
+    path = mart_path("executive")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    again = query(["trip_count"], by=["pickup_date"])
+    assert again is not first and again.equals(first)
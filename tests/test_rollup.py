@@ -0,0 +1,98 @@
+import os
+
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import catalog
+from marts import rollup
+
+
+@pytest.fixture(scope="module")
+def trips(processed):
+    return catalog.scan("processed").with_columns(pl.col("pickup_datetime").dt.date().alias("pickup_date")).collect()
+
+
+def read_mart(marts, table):
+    path = os.path.join(marts, f"{table}.parquet")
+    return pl.read_parquet(path) if os.path.exists(path) else pl.read_csv(path.replace(".parquet", ".csv"), try_parse_dates=True)
+
+
+def f64(col):
+    # Direct aggregates in Float64, as the stored sums are
+    return pl.col(col).cast(pl.Float64)
+
+
+def assert_same(rolled, direct, keys):
+    assert_frame_equal(rolled.select(direct.columns).sort(keys), direct.sort(keys), check_dtypes=False, rel_tol=1e-6)
+
+
+def test_timeline_rolls_up_to_months_by_flow(marts, trips):
+    timeline = read_mart(marts, "agg_timeline_hourly")
+    keys = ["pickup_year", "pickup_month", "borough_flow_type"]
+    direct = trips.group_by(keys).agg(
+        pl.len().alias("trip_count"),
+        f64("base_passenger_fare").sum().alias("total_fare_amt"),
+        f64("trip_km").mean().alias("avg_trip_km"),
+        f64("speed_kmh").mean().alias("avg_speed_kmh"),
+        pl.col("is_bad_weather").sum().alias("bad_weather_count"),
+    )
+    assert_same(rollup(timeline, by=["borough_flow_type"], grain="month"), direct, keys)
+
+
+def test_network_rolls_up_to_years_exactly(marts, trips):
+    network = read_mart(marts, "agg_network_monthly")
+    keys = ["pickup_year", "PULocationID", "DOLocationID"]
+    direct = trips.group_by(keys).agg(
+        pl.len().alias("trip_count"),
+        f64("duration_min").mean().alias("avg_duration_min"),
+        f64("total_wait_time_min").mean().alias("avg_wait_time"),
+    )
+    assert_same(rollup(network, by=["PULocationID", "DOLocationID"], grain="year"), direct, keys)
+
+
+def test_economic_std_is_recomputed_from_the_sums(marts, trips):
+    economic = read_mart(marts, "agg_pricing_distribution")
+    keys = ["pickup_date", "weather_state"]
+    direct = trips.with_columns(pl.col("pickup_date").dt.truncate("1y")).group_by(keys).agg(
+        pl.len().alias("trip_count"),
+        f64("driver_revenue_share").mean().alias("avg_driver_share"),
+        f64("driver_revenue_share").std().alias("std_driver_share"),
+        f64("pay_per_hour").mean().alias("avg_hourly_wage"),
+    )
+    rolled = rollup(economic, by=["weather_state"], grain="year")
+    assert_same(rolled, direct, keys)
+    # Exact quantiles and modes can't be rolled up
+    assert not {"median_fare", "p90_fare_surge_proxy", "dominant_rain"} & set(rolled.columns)
+
+
+def test_executive_rolls_up_to_weeks(marts, trips):
+    executive = read_mart(marts, "agg_executive_daily")
+    direct = trips.with_columns(pl.col("pickup_date").dt.truncate("1w")).group_by("pickup_date").agg(
+        pl.len().alias("total_trips"),
+        f64("base_passenger_fare").sum().alias("total_fare_revenue"),
+        f64("total_wait_time_min").mean().alias("avg_wait_time"),
+    )
+    assert_same(rollup(executive, grain="week"), direct, ["pickup_date"])
+
+
+def test_no_keys_gives_one_grand_total_row(marts, trips):
+    total = rollup(read_mart(marts, "agg_timeline_hourly").lazy()).collect()
+    assert total.height == 1
+    assert total["trip_count"][0] == trips.height
+    assert total["avg_trip_km"][0] == pytest.approx(trips["trip_km"].cast(pl.Float64).mean())
+
+
+def test_impossible_rollups_raise(marts):
+    timeline = read_mart(marts, "agg_timeline_hourly")
+    network = read_mart(marts, "agg_network_monthly")
+    with pytest.raises(ValueError, match="Unknown grain"):
+        rollup(timeline, grain="quarter")
+    with pytest.raises(ValueError, match="coarser"):
+        rollup(network, grain="day")
+    with pytest.raises(ValueError, match="no pickup_date"):
+        rollup(timeline, grain="week")
+    with pytest.raises(ValueError, match="Keys not in the mart"):
+        rollup(timeline, by=["weather_state"])
+    with pytest.raises(ValueError, match="no stored sums"):
+        rollup(timeline.drop("trip_km_sum"), grain="year")
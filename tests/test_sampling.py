@@ -0,0 +1,124 @@
+import os
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+import catalog
+from stratified_sampling import HASH_COLUMNS, HASH_FLOAT_SCALE, row_hash, sample_file
+
+MASK = 2**64 - 1
+EPOCH = datetime(1970, 1, 1)
+FRACTIONS = [0.01, 0.05, 0.10]
+
+
+def splitmix64(x):
+    """Reference splitmix64 finalizer on Python ints."""
+    x = (x + 0x9E3779B97F4A7C15) & MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+
+def reference_hash(keys, seed):
+    h = seed
+    for key in keys:
+        h = splitmix64(h ^ splitmix64(key & MASK))
+    return h
+
+
+@pytest.fixture
+def trips():
+    return pl.DataFrame(
+        {
+            "pickup_datetime": [datetime(2021, 9, 1, 8, 30), datetime(2019, 2, 14, 23, 59, 59), None],
+            "PULocationID": [132, 1, None],
+            "base_passenger_fare": [23.57, 7.0, None],
+        }
+    )
+
+
+def hashes(df, seed=105):
+    return df.select(row_hash(df.schema, seed).alias("h"))["h"].to_list()
+
+
+# --- Row hash ---
+def test_row_hash_is_pinned(trips):
+    # Samples drawn today must be drawn again after any Polars upgrade
+    assert hashes(trips) == [4759073644813940807, 1081335961741734175, 5453889860708229230]
+
+
+def test_row_hash_follows_its_specification(trips):
+    for row, h in zip(trips.iter_rows(), hashes(trips)):
+        stamp, zone, fare = row
+        # Epoch microseconds, integers as they are, floats scaled and rounded; nulls -> Int64 min
+        keys = [
+            (stamp - EPOCH) // timedelta(microseconds=1) if stamp else -(2**63),
+            zone if zone is not None else -(2**63),
+            round(fare * HASH_FLOAT_SCALE) if fare is not None else -(2**63),
+        ]
+        assert h == reference_hash(keys, 105)
+
+
+def test_row_hash_ignores_dtype_precision_order_and_engine(trips):
+    expected = hashes(trips)
+    narrow = trips.with_columns(
+        pl.col("pickup_datetime").dt.cast_time_unit("ms"),
+        pl.col("PULocationID").cast(pl.Int32),
+        pl.col("base_passenger_fare").cast(pl.Float32),
+    )
+    assert hashes(narrow) == expected
+    assert hashes(trips.reverse()) == expected[::-1]
+    assert hashes(trips.slice(1)) == expected[1:]
+    lazy = trips.lazy().select(row_hash(trips.schema, 105).alias("h")).collect(engine="streaming")
+    assert lazy["h"].to_list() == expected
+    assert hashes(trips, seed=106) != expected
+
+
+def test_row_hash_needs_a_hash_column():
+    with pytest.raises(ValueError, match="None of the hash columns"):
+        row_hash(pl.Schema({"foo": pl.Int64}))
+    with pytest.raises(ValueError, match="unsupported dtype"):
+        row_hash(pl.Schema({"PULocationID": pl.String}))
+
+
+# --- Sampling a file ---
+def draw(file_path, out_dir):
+    rates = pl.DataFrame({f"rate_{k}": [f] for k, f in enumerate(FRACTIONS)})
+    dirs = [str(out_dir / f"sample_{k}") for k in range(len(FRACTIONS))]
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    paths, rows_in, rows_out = sample_file(file_path, FRACTIONS, dirs, rates, [])
+    return [pl.read_parquet(p) for p in paths], rows_in, rows_out
+
+
+@pytest.fixture(scope="module")
+def month_file(processed):
+    return catalog.list_files("processed")[-1]
+
+
+def trip_ids(df):
+    return set(df.select([c for c in HASH_COLUMNS if c in df.columns]).rows())
+
+
+def test_samples_are_nested_and_sized_by_their_rates(month_file, tmp_path):
+    samples, rows_in, rows_out = draw(month_file, tmp_path)
+    assert rows_out == [s.height for s in samples]
+    assert trip_ids(samples[0]) <= trip_ids(samples[1]) <= trip_ids(samples[2])
+    for fraction, sample in zip(FRACTIONS, samples):
+        expected = fraction * rows_in
+        assert abs(sample.height - expected) <= 5 * (expected * (1 - fraction)) ** 0.5
+        assert (sample["sample_weight"] == 1 / fraction).all()
+
+
+def test_shards_give_the_samples_of_the_whole_month(month_file, tmp_path):
+    whole, _, _ = draw(month_file, tmp_path / "whole")
+    trips = pl.read_parquet(month_file)
+    half = trips.height // 2
+    shards = []
+    for k, part in enumerate((trips.slice(half), trips.slice(0, half))):
+        path = tmp_path / f"shard_{k}.parquet"
+        part.write_parquet(path)
+        shards.append(draw(str(path), tmp_path / f"shard_{k}")[0])
+    for k in range(len(FRACTIONS)):
+        assert trip_ids(pl.concat([s[k] for s in shards])) == trip_ids(whole[k])
@@ -0,0 +1,104 @@
+import os
+import time
+
+import pytest
+
+import scheduler
+from scheduler import current_tuning, plan_schedule, run_tasks, tune_job
+
+KB = 1000
+
+
+# Tasks run in spawned workers, so they live at module level
+def echo(value):
+    return value
+
+
+def echo_or_raise(value):
+    if value < 0:
+        raise RuntimeError(f"bad value {value}")
+    return value
+
+
+def echo_or_die(value):
+    if value is None:
+        os._exit(1)  # What the OS killing a worker looks like from the pool
+    return value
+
+
+def timed(log_dir, key, seconds):
+    start = time.time()
+    time.sleep(seconds)
+    with open(os.path.join(log_dir, key), "w") as f:
+        f.write(f"{start} {time.time()}")
+    return current_tuning()["low_memory"]
+
+
+def job(key, fn_args, est_bytes=KB, rows=None):
+    return {"key": key, "args": fn_args, "est_bytes": est_bytes, "rows": rows}
+
+
+@pytest.fixture
+def cpus(monkeypatch):
+    # Enough CPUs for several workers, whatever the machine running the tests has
+    monkeypatch.setattr(scheduler.os, "cpu_count", lambda: 8)
+
+
+def test_results_come_back_in_input_order(cpus):
+    seen = []
+    jobs = [job(f"job-{k}", (k,), est_bytes=(k + 1) * KB) for k in range(5)]
+    records = run_tasks(echo, jobs, memory_budget_gb=1, on_result=lambda idx, rec: seen.append(idx))
+
+    assert [r["key"] for r in records] == [j["key"] for j in jobs]
+    assert [r["value"] for r in records] == list(range(5))
+    assert sorted(seen) == list(range(5))
+
+
+def test_a_failing_job_fails_alone(cpus):
+    records = run_tasks(echo_or_raise, [job(f"job-{v}", (v,)) for v in (1, -1, 2)], memory_budget_gb=1)
+    assert [r["ok"] for r in records] == [True, False, True]
+    assert "RuntimeError: bad value -1" in records[1]["error"]
+    assert [records[0]["value"], records[2]["value"]] == [1, 2]
+
+
+def test_killed_worker_only_fails_the_jobs_in_flight_with_it(cpus):
+    # The killed job holds the whole budget, so it is alone on the pool when it breaks
+    jobs = [job("killed", (None,), est_bytes=95 * KB)] + [job(f"job-{k}", (k,), est_bytes=10 * KB) for k in range(4)]
+    records = run_tasks(echo_or_die, jobs, memory_budget_gb=100 * KB / 1e9)
+    assert not records[0]["ok"] and "BrokenProcessPool" in records[0]["error"]
+    assert [r["value"] for r in records[1:]] == list(range(4))
+
+
+def test_admission_keeps_in_flight_estimates_under_the_budget(cpus, tmp_path):
+    # 100 KB budget: the 95 KB job can't share it with any 10 KB one
+    jobs = [job("big", (str(tmp_path), "big", 0.5), est_bytes=95 * KB)]
+    jobs += [job(f"small-{k}", (str(tmp_path), f"small-{k}", 0.2), est_bytes=10 * KB) for k in range(3)]
+    records = run_tasks(timed, jobs, memory_budget_gb=100 * KB / 1e9)
+    assert all(r["ok"] for r in records)
+
+    spans = {}
+    for key in os.listdir(tmp_path):
+        start, end = map(float, open(tmp_path / key).read().split())
+        spans[key] = (start, end)
+    big_start, big_end = spans.pop("big")
+    assert len(spans) == 3
+    for start, end in spans.values():
+        assert end <= big_start or start >= big_end
+
+
+def test_a_job_over_the_whole_budget_runs_with_its_low_memory_plan(cpus, tmp_path):
+    jobs = [job("huge", (str(tmp_path), "huge", 0), est_bytes=500 * KB), job("fits", (str(tmp_path), "fits", 0))]
+    records = run_tasks(timed, jobs, memory_budget_gb=100 * KB / 1e9)
+    assert [r["ok"] for r in records] == [True, True]
+    assert [r["value"] for r in records] == [True, False]
+
+
+def test_plan_fits_median_jobs_in_the_budget(cpus):
+    jobs = [job(f"job-{k}", (), est_bytes=30 * KB) for k in range(8)]
+    plan = plan_schedule(jobs, memory_budget_gb=100 * KB / 1e9)
+    assert plan["workers"] == 3
+    assert plan["budget_bytes"] == 100 * KB
+
+    tuning = tune_job(job("huge", (), est_bytes=200 * KB, rows=1000), plan)
+    assert tuning["low_memory"]
+    assert tuning["allowance_bytes"] == 100 * KB
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import polars as pl
+import pytest
+
+import catalog
+from marts import SKETCH_ALPHA, SKETCH_MIN_VALUE, merge_sketches, sketch, sketch_quantile, sketch_quantiles
+
+QUANTILES = [0.01, 0.1, 0.5, 0.9, 0.99]
+
+
+@pytest.fixture(scope="module")
+def values():
+    # Fares-like: log-normal, with a few negatives, tiny values and exact zeros
+    rng = np.random.default_rng(7)
+    x = np.concatenate([rng.lognormal(3, 1, 20_000), -rng.lognormal(1, 1, 500), rng.uniform(0, SKETCH_MIN_VALUE, 300), np.zeros(200)])
+    return pl.DataFrame({"group": rng.integers(0, 2, x.size), "fare": rng.permutation(x)})
+
+
+def sketched(df, keys=()):
+    """A sketch per group, as the marts store them (one group for all rows when no keys)."""
+    return df.group_by(list(keys) or pl.lit(0).alias("_all")).agg(sketch("fare", "fare_sketch"))
+
+
+def quantiles_of(sketches):
+    return sketches.select([sketch_quantile("fare_sketch", q) for q in QUANTILES]).row(0)
+
+
+def assert_within_bound(estimates, fare):
+    for q, estimate in zip(QUANTILES, estimates):
+        exact = fare.quantile(q, "nearest")
+        assert abs(estimate - exact) <= max(SKETCH_ALPHA * abs(exact), SKETCH_MIN_VALUE), q
+
+
+def test_sketch_quantiles_are_within_the_error_bound(values):
+    assert_within_bound(quantiles_of(sketched(values)), values["fare"])
+
+
+def test_merged_halves_equal_the_sketch_of_the_whole(values):
+    halves = sketched(values, ["group"])
+    merged = merge_sketches(halves.lazy(), [], "fare_sketch").collect()
+    whole = sketched(values)
+    assert merged["fare_sketch"].to_list() == whole["fare_sketch"].to_list()
+    assert_within_bound(quantiles_of(merged), values["fare"])
+
+
+def test_sketch_quantiles_rolls_up_a_mart(values):
+    # Only keys and a sketch: nothing to sum, still one grand-total row
+    mart = sketched(values, ["group"])
+    out = sketch_quantiles(mart, "fare_sketch", QUANTILES)
+    assert out["sketch_n"][0] == values.height
+    assert_within_bound(out.row(0)[1:], values["fare"])
+
+
+def test_infinities_count_and_nans_are_dropped():
+    df = pl.DataFrame({"fare": [1.0, 2.0, float("inf"), float("-inf"), float("nan")]})
+    s = sketched(df)
+    assert s.select(pl.col("fare_sketch").list.eval(pl.element().struct.field("count")).list.sum()).item() == 4
+    assert s.select(sketch_quantile("fare_sketch", 1.0)).item() == float("inf")
+    assert s.select(sketch_quantile("fare_sketch", 0.0)).item() == float("-inf")
+
+
+def test_empty_sketches_give_null_quantiles():
+    df = pl.DataFrame({"group": [0, 1], "fare": [None, 5.0]}, schema={"group": pl.Int64, "fare": pl.Float64})
+    s = sketched(df, ["group"]).sort("group")
+    assert s.select(sketch_quantile("fare_sketch", 0.5)).to_series().to_list()[0] is None
+    merged = merge_sketches(s.lazy(), ["group"], "fare_sketch").sort("group").collect()
+    assert merged["fare_sketch"].to_list()[0] == []
+
+
+def test_economic_mart_sketches_match_the_trips(marts):
+    economic = pl.read_parquet(os.path.join(marts, "agg_pricing_distribution.parquet"))
+    fares = catalog.scan("processed").select("base_passenger_fare").collect().to_series().cast(pl.Float64)
+    out = sketch_quantiles(economic, "fare_sketch", QUANTILES)
+    assert out["sketch_n"][0] == fares.drop_nulls().drop_nans().len()
+    assert_within_bound(out.row(0)[1:], fares)
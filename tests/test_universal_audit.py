@@ -0,0 +1,37 @@
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import catalog
+from tlc_universal_audit import AUDIT_QUANTILES, AUDIT_TARGETS, process_file
+
+
+@pytest.fixture(scope="module")
+def reports(processed):
+    files = catalog.list_files("processed")
+    return [pl.concat([process_file([f], mode=mode)[0] for f in files]).sort("audit_month") for mode in ("exact", "approx")]
+
+
+def test_approx_audit_matches_the_exact_one_outside_its_quantiles(reports):
+    exact, approx = reports
+    assert approx.columns == exact.columns
+    quantiles = {f"{c}_{name}" for c in AUDIT_TARGETS for name in AUDIT_QUANTILES}
+    rest = [c for c in exact.columns if c not in quantiles and not c.startswith(("audit_mode", "quantile_"))]
+    # The approx pass streams: sums may add up in another order
+    assert_frame_equal(approx.select(rest), exact.select(rest), rel_tol=1e-9)
+
+
+def test_approx_quantiles_are_within_the_reported_bound(reports):
+    exact, approx = reports
+    assert (exact["quantile_rel_error"] == 0).all() and (exact["quantile_abs_floor"] == 0).all()
+    checked = 0
+    for e, a in zip(exact.iter_rows(named=True), approx.iter_rows(named=True)):
+        for c in AUDIT_TARGETS:
+            for name in AUDIT_QUANTILES:
+                q = f"{c}_{name}"
+                if q not in e or e[q] is None:
+                    continue
+                bound = max(a["quantile_rel_error"] * abs(e[q]), a["quantile_abs_floor"])
+                assert abs(a[q] - e[q]) <= bound + 1e-9, (e["audit_month"], q)
+                checked += 1
+    assert checked > 0